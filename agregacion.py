@@ -0,0 +1,101 @@
+"""
+Agregación de la morbilidad del Observatorio de Salud Mental Escolar
+Esquema canónico y funciones que construyen el cubo por bloques. Es un módulo
+importable (sin Streamlit) para que los procesos del pool de agregación, creados
+con forkserver o spawn, puedan cargar las funciones que reciben.
+"""
+
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# Esquema canónico de la morbilidad: las páginas usan estos nombres sin verificar alias
+COL_ANO = 'ano'
+COL_LOCALIDAD = 'prestador_localidad_nombre'
+COL_GENERO = 'genero'
+COL_TRASTORNO = 'categoria_trastorno'
+COL_NIVEL = 'nivel_educativo'
+COL_EDAD = 'edad_grupo_rias'
+COL_ATENCIONES = 'sum_atenciones'
+
+# Columna canónica -> nombres con que puede llegar en las fuentes, en orden de preferencia
+ALIAS_COLUMNAS = {
+    COL_GENERO: ['genero', 'sexo_gen'],
+    COL_TRASTORNO: ['categoria_trastorno', 'dxprincipal_agrupacion1_nombre']
+}
+
+# Dimensiones del cubo de morbilidad; las agrupaciones de las páginas lo enrollan
+DIMENSIONES_CUBO = [COL_LOCALIDAD, COL_ANO, COL_GENERO, COL_TRASTORNO, COL_NIVEL, COL_EDAD]
+
+def anunciar_proceso(pids):
+    """Inicializador de los procesos del pool: publica su PID para poder terminarlos si se cuelgan"""
+    pids.put(os.getpid())
+
+def normalizar_esquema(df):
+    """Renombrar las columnas con alias a su nombre canónico (una sola vez, al cargar)"""
+    renombres = {}
+
+    for canonica, alias in ALIAS_COLUMNAS.items():
+        if canonica in df.columns:
+            continue
+
+        origen = next((a for a in alias if a in df.columns), None)
+        if origen is not None:
+            renombres[origen] = canonica
+
+    return df.rename(columns=renombres) if renombres else df
+
+def agregar_bloque(df, dimensiones):
+    """Colapsar registros a una fila por combinación de dimensiones (suma, conteo, mínimo, máximo)"""
+    return df.groupby(dimensiones, observed=True, dropna=False, sort=False).agg(
+        sum_atenciones=('sum_atenciones', 'sum'),
+        n_registros=('sum_atenciones', 'size'),
+        min_atenciones=('sum_atenciones', 'min'),
+        max_atenciones=('sum_atenciones', 'max')
+    ).reset_index()
+
+def combinar_agregados(parciales, dimensiones):
+    """Fusionar agregados parciales: sumas y conteos se suman, mínimos y máximos se comparan"""
+    df = pd.concat(parciales, ignore_index=True)
+
+    return df.groupby(dimensiones, observed=True, dropna=False, sort=False).agg(
+        sum_atenciones=('sum_atenciones', 'sum'),
+        n_registros=('n_registros', 'sum'),
+        min_atenciones=('min_atenciones', 'min'),
+        max_atenciones=('max_atenciones', 'max')
+    ).reset_index()
+
+def agregar_parcial(bloque, dimensiones):
+    """Agregado parcial de un bloque, sea de registros o ya pre-agregado"""
+    if 'n_registros' in bloque.columns:
+        return combinar_agregados([bloque], dimensiones)
+    return agregar_bloque(bloque, dimensiones)
+
+def reducir_bloques(bloques):
+    """Agregado por las dimensiones del cubo de una secuencia de bloques de morbilidad
+
+    Fusiona los parciales cada 8 bloques para que la memoria no crezca con su número.
+    Devuelve None si no hay bloques.
+    """
+    parciales = []
+    dimensiones = None
+
+    for bloque in bloques:
+        bloque = normalizar_esquema(bloque)
+        dimensiones = [c for c in DIMENSIONES_CUBO if c in bloque.columns]
+        parciales.append(agregar_parcial(bloque, dimensiones))
+
+        if len(parciales) >= 8:
+            parciales = [combinar_agregados(parciales, dimensiones)]
+
+    return combinar_agregados(parciales, dimensiones) if parciales else None
+
+def reducir_particion(ruta, tamano_bloque):
+    """Agregado por las dimensiones del cubo de una partición Parquet, leída por lotes"""
+    archivo = pq.ParquetFile(ruta)
+    return reducir_bloques(lote.to_pandas() for lote in archivo.iter_batches(batch_size=tamano_bloque))
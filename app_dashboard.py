@@ -5,7 +5,53 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
+import copy
+import glob
+import hashlib
+import io
 import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import signal
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+# Esquema canónico y agregación del cubo: en un módulo importable para el pool de procesos
+from agregacion import (
+    COL_ANO,
+    COL_ATENCIONES,
+    COL_GENERO,
+    COL_LOCALIDAD,
+    COL_NIVEL,
+    COL_TRASTORNO,
+    DIMENSIONES_CUBO,
+    agregar_bloque,
+    agregar_parcial,
+    anunciar_proceso,
+    combinar_agregados,
+    normalizar_esquema,
+    reducir_bloques,
+    reducir_particion
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
 
 # ============================================================================
 # CONFIGURACIÓN DE LA PÁGINA
@@ -18,118 +64,1967 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# ============================================================================
-# ESTILOS CSS PERSONALIZADOS
-# ============================================================================
+# ============================================================================
+# ESTILOS CSS PERSONALIZADOS
+# ============================================================================
+
+st.markdown("""
+<style>
+    .main {
+        background-color: #f8f9fa;
+    }
+
+    .metric-card {
+        background: white;
+        padding: 20px;
+        border-radius: 10px;
+        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+        margin: 10px 0;
+    }
+
+    h1 {
+        color: #1e3a8a;
+        font-weight: 700;
+    }
+
+    h2 {
+        color: #2563eb;
+        font-weight: 600;
+    }
+
+    h3 {
+        color: #3b82f6;
+        font-weight: 500;
+    }
+
+    .alert-critico {
+        background-color: #fee2e2;
+        border-left: 4px solid #dc2626;
+        padding: 15px;
+        margin: 10px 0;
+        border-radius: 5px;
+    }
+
+    .alert-advertencia {
+        background-color: #fef3c7;
+        border-left: 4px solid #f59e0b;
+        padding: 15px;
+        margin: 10px 0;
+        border-radius: 5px;
+    }
+
+    .alert-normal {
+        background-color: #d1fae5;
+        border-left: 4px solid #10b981;
+        padding: 15px;
+        margin: 10px 0;
+        border-radius: 5px;
+    }
+
+    .stButton>button {
+        background-color: #2563eb;
+        color: white;
+        border-radius: 5px;
+        padding: 10px 24px;
+        border: none;
+        font-weight: 500;
+    }
+
+    .stButton>button:hover {
+        background-color: #1e40af;
+    }
+
+    @media (max-width: 768px) {
+        .main .block-container {
+            padding: 1rem;
+        }
+    }
+</style>
+""", unsafe_allow_html=True)
+
+# ============================================================================
+# FUNCIONES DE CARGA DE DATOS
+# ============================================================================
+
+# Directorio donde se guardan las copias columnares (Parquet) de los CSV fuente
+DIR_ALMACEN = '.almacen_columnar'
+
+# Ingesta pre-agregada de morbilidad (OBSERVATORIO_PREAGREGAR=1): una fila por
+# combinación distinta de dimensiones en lugar de un registro por atención
+MODO_PREAGREGADO = os.environ.get('OBSERVATORIO_PREAGREGAR', '0') == '1'
+
+# Modo fuera de memoria (OBSERVATORIO_FUERA_DE_MEMORIA=1): los registros nunca se cargan
+# completos; el cubo se construye recorriendo la morbilidad por bloques y hace de morbilidad
+MODO_FUERA_DE_MEMORIA = os.environ.get('OBSERVATORIO_FUERA_DE_MEMORIA', '0') == '1'
+
+# Filas por bloque al leer el CSV de morbilidad en modo pre-agregado
+TAMANO_BLOQUE = 500_000
+
+# Procesos entre los que se reparte la construcción del cubo. Por defecto 1 (en el proceso
+# de Streamlit): activar OBSERVATORIO_PROCESOS solo si benchmark_procesos.py muestra una
+# ganancia en el servidor a partir de FILAS_MINIMAS_PROCESOS filas (OBSERVATORIO_FILAS_PROCESOS)
+PROCESOS_AGREGACION = int(os.environ.get('OBSERVATORIO_PROCESOS', '1'))
+FILAS_MINIMAS_PROCESOS = int(os.environ.get('OBSERVATORIO_FILAS_PROCESOS', '1000000'))
+
+# Hilos con que se cargan en paralelo los datasets de una página. Por defecto tantos como
+# CPU (máximo 4): con una sola CPU la carga es secuencial (ver benchmark_arranque.py)
+HILOS_PRECARGA = int(os.environ.get('OBSERVATORIO_HILOS_PRECARGA', str(min(4, os.cpu_count() or 1))))
+
+# Segundos que se espera al pool antes de terminarlo y agregar en el proceso de Streamlit
+TIEMPO_MAXIMO_PROCESOS = float(os.environ.get('OBSERVATORIO_TIEMPO_PROCESOS', '120'))
+
+# CSV base de morbilidad y directorio de extractos periódicos que lo complementan
+ARCHIVO_MORBILIDAD = 'morbilidad_salud_mental_limpio.csv'
+DIR_EXTRACTOS = 'extractos_morbilidad'
+
+# Tablas resumen publicadas con el repositorio; sirven las páginas cuando no hay
+# registros de morbilidad (modo resumen)
+ARCHIVOS_RESUMEN = {
+    'genero': 'atenciones_por_genero.csv',
+    'localidad': 'atenciones_por_localidad.csv',
+    'trastorno': 'atenciones_por_trastorno.csv',
+    'matricula_anio': 'matricula_agregada_por_anio.csv',
+    'matricula_genero': 'matricula_agregada_por_genero.csv',
+    'matricula_sector': 'matricula_agregada_por_sector.csv'
+}
+
+# Columnas de las tablas resumen -> nombre equivalente en la morbilidad
+COLUMNAS_RESUMEN = {
+    'año': 'ano',
+    'localidad': 'prestador_localidad_nombre',
+    'trastorno': 'categoria_trastorno',
+    'atenciones': 'sum_atenciones'
+}
+
+# Almacén de morbilidad particionado por año y mes, con la misma granularidad en todo el
+# almacén: las fuentes sin columna mes van a mes=0 (el año sin detalle mensual)
+DIR_PARTICIONES = os.path.join(DIR_ALMACEN, 'morbilidad')
+COLUMNAS_PARTICION = ['ano', 'mes']
+MES_SIN_DETALLE = 0
+
+# Cambia cuando cambia la organización del almacén (se reconstruye desde las fuentes)
+FORMATO_MANIFIESTO = 2
+
+# Directorio (en el mismo servidor) donde se publican las tablas Arrow que todos los
+# procesos de Streamlit mapean en memoria de solo lectura
+DIR_COMPARTIDO = os.environ.get('OBSERVATORIO_DIR_COMPARTIDO', os.path.join(DIR_ALMACEN, 'compartido'))
+
+# Memoria máxima (MB) de la caché de agregados compartida por todas las sesiones
+LIMITE_CACHE_AGREGADOS_MB = float(os.environ.get('OBSERVATORIO_CACHE_AGREGADOS_MB', '64'))
+
+# Memoria máxima (MB) de la caché de figuras Plotly compartida por todas las sesiones
+LIMITE_CACHE_FIGURAS_MB = float(os.environ.get('OBSERVATORIO_CACHE_FIGURAS_MB', '32'))
+
+# Filas por página de las tablas paginadas
+FILAS_POR_PAGINA = 25
+
+# Registros de la vista previa del dataset principal (la descarga los incluye todos)
+FILAS_VISTA_PREVIA = 1000
+
+# Límites de la consola SQL pública: filas devueltas, segundos por consulta y, con DuckDB,
+# memoria e hilos de cada consulta
+FILAS_MAXIMAS_SQL = int(os.environ.get('OBSERVATORIO_SQL_FILAS', '100000'))
+TIEMPO_MAXIMO_SQL = float(os.environ.get('OBSERVATORIO_SQL_SEGUNDOS', '30'))
+MEMORIA_MAXIMA_SQL = os.environ.get('OBSERVATORIO_SQL_MEMORIA', '512MB')
+HILOS_SQL = int(os.environ.get('OBSERVATORIO_SQL_HILOS', '2'))
+
+# Formatos de las columnas numéricas de las tablas: (printf de st.column_config, str.format
+# de Styler para las tablas con estilos, cuyo texto sustituye al formato de la columna)
+FORMATOS_NUMERO = {
+    'entero': ("%,d", "{:,.0f}"),
+    'decimal1': ("%.1f", "{:.1f}"),
+    'decimal2': ("%.2f", "{:.2f}"),
+    'porcentaje': ("%.1f%%", "{:.1f}%"),
+    'variacion': ("%+.1f%%", "{:+.1f}%"),
+    'razon': ("%.2fx", "{:.2f}x")
+}
+
+# Columnas de morbilidad que usan las páginas (proyección al leer)
+COLUMNAS_MORBILIDAD = [
+    'ano',
+    'prestador_localidad_nombre',
+    'genero',
+    'sexo_gen',
+    'categoria_trastorno',
+    'dxprincipal_agrupacion1_nombre',
+    'nivel_educativo',
+    'edad_grupo_rias',
+    'sum_atenciones'
+]
+
+# Dimensiones por las que las páginas agrupan la morbilidad
+COLUMNAS_DIMENSION = [c for c in COLUMNAS_MORBILIDAD if c != 'sum_atenciones']
+
+# Columnas sin las que la morbilidad no se puede usar
+COLUMNAS_OBLIGATORIAS = [COL_ANO, COL_LOCALIDAD, COL_ATENCIONES]
+
+# Años aceptados en la morbilidad
+RANGO_ANOS = (2000, 2100)
+
+# Cambia cuando cambia el esquema canónico (invalida las tablas compartidas ya publicadas)
+VERSION_ESQUEMA = 2
+
+def ruta_almacen(archivo_csv):
+    """Ruta del archivo Parquet asociado a un CSV fuente"""
+    nombre = os.path.splitext(os.path.basename(archivo_csv))[0]
+    return os.path.join(DIR_ALMACEN, f"{nombre}.parquet")
+
+def almacen_vigente(archivo_csv):
+    """Indica si el Parquet existe y no es más antiguo que su CSV fuente"""
+    ruta = ruta_almacen(archivo_csv)
+    if not os.path.exists(ruta):
+        return False
+    if not os.path.exists(archivo_csv):
+        # Despliegues que solo incluyen el almacén columnar
+        return True
+    return os.path.getmtime(ruta) >= os.path.getmtime(archivo_csv)
+
+def guardar_parquet(df, ruta):
+    """Escribir un Parquet de forma atómica: otro proceso nunca ve un archivo a medio escribir"""
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+    df.to_parquet(ruta_tmp, index=False)
+    os.replace(ruta_tmp, ruta)
+
+    return ruta
+
+def construir_almacen(archivo_csv):
+    """Convertir un CSV fuente a Parquet (se ejecuta solo si está desactualizado)"""
+    df = pd.read_csv(archivo_csv)
+    return guardar_parquet(df, ruta_almacen(archivo_csv))
+
+def leer_tabla(archivo_csv, columnas=None):
+    """Leer una tabla desde el almacén columnar, con el CSV como respaldo"""
+    if pq is not None:
+        try:
+            if not almacen_vigente(archivo_csv):
+                construir_almacen(archivo_csv)
+
+            ruta = ruta_almacen(archivo_csv)
+
+            if columnas is not None:
+                disponibles = pq.read_schema(ruta).names
+                columnas = [c for c in disponibles if c in columnas]
+
+            return pd.read_parquet(ruta, columns=columnas)
+        except Exception:
+            # Sin permisos de escritura o Parquet corrupto: usar el CSV
+            pass
+
+    if columnas is None:
+        return pd.read_csv(archivo_csv)
+
+    return pd.read_csv(archivo_csv, usecols=lambda c: c in columnas)
+
+def mapear_en_procesos(funcion, tareas, filas):
+    """Aplicar funcion a cada tarea en un pool de procesos; resultados en el orden de las tareas
+
+    El pool se usa solo con más de un proceso configurado y al menos FILAS_MINIMAS_PROCESOS
+    filas en total. funcion debe ser importable (módulo agregacion): los procesos se crean
+    con forkserver o spawn, porque fork en un servidor con hilos puede heredar bloqueos
+    tomados. Si el pool no arranca, falla o tarda más de TIEMPO_MAXIMO_PROCESOS, sus
+    procesos se terminan y se calcula aquí.
+    """
+    tareas = list(tareas)
+    procesos = min(PROCESOS_AGREGACION, len(tareas))
+
+    if procesos > 1 and filas >= FILAS_MINIMAS_PROCESOS:
+        metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        contexto = multiprocessing.get_context(metodo)
+        ejecutor = None
+
+        # Cada proceso publica su PID al arrancar (anunciar_proceso), antes de tomar tareas
+        pids = contexto.SimpleQueue()
+
+        try:
+            ejecutor = ProcessPoolExecutor(procesos, mp_context=contexto, initializer=anunciar_proceso, initargs=(pids,))
+            resultados = list(ejecutor.map(funcion, tareas, timeout=TIEMPO_MAXIMO_PROCESOS))
+            ejecutor.shutdown()
+            return resultados
+        except (TimeoutError, BrokenProcessPool, pickle.PicklingError, OSError):
+            if ejecutor is not None:
+                # shutdown no interrumpe tareas en curso: cada proceso se termina aquí en cuanto
+                # publica su PID (map arranca los `procesos`; los que no arrancan se esperan poco)
+                limite = time.monotonic() + 5
+                terminados = 0
+
+                while terminados < procesos and time.monotonic() < limite:
+                    if pids.empty():
+                        time.sleep(0.05)
+                        continue
+
+                    try:
+                        os.kill(pids.get(), signal.SIGTERM)
+                    except OSError:
+                        pass
+                    terminados += 1
+
+                ejecutor.shutdown(wait=False, cancel_futures=True)
+        finally:
+            pids.close()
+
+    return [funcion(tarea) for tarea in tareas]
+
+def preagregar_morbilidad(archivo_csv, tamano_bloque=TAMANO_BLOQUE):
+    """Leer la morbilidad por bloques y colapsarla a combinaciones distintas de dimensiones"""
+    encabezado = pd.read_csv(archivo_csv, nrows=0).columns
+    dimensiones = [c for c in COLUMNAS_DIMENSION if c in encabezado]
+
+    parciales = []
+
+    for bloque in pd.read_csv(archivo_csv, usecols=dimensiones + ['sum_atenciones'], chunksize=tamano_bloque):
+        parciales.append(agregar_bloque(bloque, dimensiones))
+
+        # Fusionar periódicamente para que la memoria no crezca con el número de bloques
+        if len(parciales) >= 8:
+            parciales = [combinar_agregados(parciales, dimensiones)]
+
+    return combinar_agregados(parciales, dimensiones)
+
+def archivos_morbilidad():
+    """CSV base de morbilidad seguido de los extractos periódicos, en orden de aplicación"""
+    extractos = sorted(glob.glob(os.path.join(DIR_EXTRACTOS, '*.csv')))
+    return [ARCHIVO_MORBILIDAD] + extractos
+
+def leer_manifiesto():
+    """Estado del almacén particionado: particiones escritas y claves de cada fuente incorporada"""
+    ruta = os.path.join(DIR_PARTICIONES, 'manifiesto.json')
+
+    if not os.path.exists(ruta):
+        return {'formato': FORMATO_MANIFIESTO, 'version': 0, 'particiones': {}, 'extractos': {}}
+
+    with open(ruta, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def guardar_manifiesto(manifiesto):
+    """Escribir el manifiesto de forma atómica"""
+    os.makedirs(DIR_PARTICIONES, exist_ok=True)
+    ruta = os.path.join(DIR_PARTICIONES, 'manifiesto.json')
+
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+    with open(ruta_tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifiesto, f, ensure_ascii=False, indent=2)
+    os.replace(ruta_tmp, ruta)
+
+def clave_particion(ano, mes):
+    """Clave (y ruta relativa) de una partición: ano=2025/mes=3"""
+    return f"ano={int(ano)}/mes={int(mes)}"
+
+def partes_clave(clave):
+    """(año, mes) de una clave de partición"""
+    return tuple(int(parte.split('=')[1]) for parte in clave.split('/'))
+
+def preparar_extracto(archivo_csv, dir_tmp, tamano_bloque=TAMANO_BLOQUE):
+    """Leer una fuente por bloques y escribir sus particiones en un directorio temporal
+
+    Devuelve {clave: {'hash', 'filas', 'ruta'}}; ruta es el directorio con los registros
+    (datos.parquet) y su agregado (agregado.parquet: suma, conteo, mínimo y máximo por
+    dimensiones). Los registros sin mes (o las fuentes sin columna mes) van a la partición
+    mes=0 de su año. Un registro sin año no tiene partición: la fuente se rechaza con
+    ValueError en lugar de perder filas en silencio.
+    """
+    encabezado = pd.read_csv(archivo_csv, nrows=0).columns
+
+    if 'ano' not in encabezado:
+        raise ValueError("no tiene la columna ano")
+    columnas = [c for c in encabezado if c in COLUMNAS_MORBILIDAD or c in COLUMNAS_PARTICION]
+    dimensiones = [c for c in COLUMNAS_DIMENSION if c in columnas]
+
+    # Textos como object en todos los bloques para que el esquema Parquet sea estable
+    tipos = {c: object for c in dimensiones if c not in COLUMNAS_PARTICION}
+
+    # Un directorio por fuente: dos fuentes pueden producir la misma clave
+    dir_fuente = os.path.join(dir_tmp, hashlib.blake2b(archivo_csv.encode('utf-8'), digest_size=8).hexdigest())
+
+    escritores = {}
+    hashes = {}
+    agregados = {}
+    filas = {}
+
+    try:
+        for bloque in pd.read_csv(archivo_csv, usecols=columnas, dtype=tipos, chunksize=tamano_bloque):
+            sin_ano = int(bloque['ano'].isna().sum())
+            if sin_ano:
+                raise ValueError(f"tiene {sin_ano:,} registros sin año")
+
+            if 'mes' in bloque.columns:
+                mes = bloque['mes'].fillna(MES_SIN_DETALLE)
+            else:
+                mes = pd.Series(MES_SIN_DETALLE, index=bloque.index, name='mes')
+
+            for (ano, mes_valor), parte in bloque.groupby([bloque['ano'], mes], sort=False):
+                clave = clave_particion(ano, mes_valor)
+                tabla = pa.Table.from_pandas(parte, preserve_index=False)
+
+                if clave not in escritores:
+                    os.makedirs(os.path.join(dir_fuente, clave), exist_ok=True)
+                    escritores[clave] = pq.ParquetWriter(os.path.join(dir_fuente, clave, 'datos.parquet'), tabla.schema)
+                    hashes[clave] = hashlib.blake2b(','.join(columnas).encode('utf-8'), digest_size=16)
+                    agregados[clave] = []
+                    filas[clave] = 0
+                else:
+                    tabla = tabla.cast(escritores[clave].schema)
+
+                escritores[clave].write_table(tabla)
+                hashes[clave].update(pd.util.hash_pandas_object(parte, index=False).to_numpy().tobytes())
+                agregados[clave].append(agregar_bloque(parte, dimensiones))
+                filas[clave] += len(parte)
+
+                if len(agregados[clave]) >= 8:
+                    agregados[clave] = [combinar_agregados(agregados[clave], dimensiones)]
+
+        for clave, escritor in escritores.items():
+            escritor.close()
+            guardar_parquet(
+                combinar_agregados(agregados[clave], dimensiones),
+                os.path.join(dir_fuente, clave, 'agregado.parquet')
+            )
+    finally:
+        for escritor in escritores.values():
+            if escritor.is_open:
+                escritor.close()
+
+    return {
+        clave: {'hash': hashes[clave].hexdigest(), 'filas': filas[clave], 'ruta': os.path.join(dir_fuente, clave)}
+        for clave in escritores
+    }
+
+def resolver_particiones(claves_fuente):
+    """Fuente de la que sale cada partición: {clave: archivo}
+
+    claves_fuente: {archivo: claves que produce}, en orden de aplicación. Una fuente
+    posterior reemplaza las mismas claves de las anteriores. Si para un año trae otra
+    granularidad (meses frente a mes=0, el año sin detalle) reemplaza el año completo:
+    el año sin detalle puede contener esos meses y se contarían dos veces.
+    """
+    duenos = {}
+
+    for archivo, claves in claves_fuente.items():
+        meses_por_ano = {}
+        for clave in claves:
+            ano, mes = partes_clave(clave)
+            meses_por_ano.setdefault(ano, set()).add(mes)
+
+        for ano, meses in meses_por_ano.items():
+            actuales = [c for c in duenos if partes_clave(c)[0] == ano]
+            sin_detalle = any(partes_clave(c)[1] == MES_SIN_DETALLE for c in actuales)
+
+            if actuales and sin_detalle != (MES_SIN_DETALLE in meses):
+                for clave in actuales:
+                    del duenos[clave]
+
+            for mes in meses:
+                duenos[clave_particion(ano, mes)] = archivo
+
+    return duenos
+
+def borrar_particion(clave):
+    """Borrar una partición del disco (y el directorio del año si queda vacío)"""
+    dir_particion = os.path.join(DIR_PARTICIONES, clave)
+    shutil.rmtree(dir_particion, ignore_errors=True)
+
+    try:
+        os.rmdir(os.path.dirname(dir_particion))
+    except OSError:
+        pass
+
+def actualizar_particiones():
+    """Reconciliar el almacén con las fuentes actuales; devuelve las particiones reescritas o borradas
+
+    Solo se leen las fuentes nuevas o modificadas, y las que vuelven a ser dueñas de una
+    partición porque la fuente que la reemplazaba cambió o ya no existe. Se reescriben
+    las particiones cuyo contenido cambió y se borran las que ya ninguna fuente produce.
+    Una fuente que no se puede particionar queda en manifiesto['rechazados'] con el
+    motivo y no se vuelve a leer mientras no cambie.
+    """
+    manifiesto = leer_manifiesto()
+
+    if manifiesto.get('formato') != FORMATO_MANIFIESTO:
+        # Almacén de otra versión (particiones solo por año): se reconstruye completo
+        for ruta in glob.glob(os.path.join(DIR_PARTICIONES, 'ano=*')):
+            shutil.rmtree(ruta, ignore_errors=True)
+        manifiesto = {'formato': FORMATO_MANIFIESTO, 'version': manifiesto.get('version', 0), 'particiones': {}, 'extractos': {}}
+
+    archivos = [a for a in archivos_morbilidad() if os.path.exists(a)]
+    huellas = {archivo: huella_fuentes([archivo]) for archivo in archivos}
+
+    rechazados = {
+        archivo: registro for archivo, registro in manifiesto.get('rechazados', {}).items()
+        if archivo in huellas and registro['huella'] == huellas[archivo]
+    }
+
+    # Claves de cada fuente en orden de aplicación; las fuentes sin cambios no se vuelven a leer
+    claves_fuente = {}
+    for archivo in archivos:
+        if archivo in rechazados:
+            continue
+        registro = manifiesto['extractos'].get(archivo)
+        vigente = registro is not None and registro['huella'] == huellas[archivo]
+        claves_fuente[archivo] = registro['claves'] if vigente else None
+
+    dir_tmp = os.path.join(DIR_PARTICIONES, f".ingesta_{os.getpid()}")
+    preparadas = {}
+
+    try:
+        for archivo, claves in list(claves_fuente.items()):
+            if claves is None:
+                try:
+                    preparadas[archivo] = preparar_extracto(archivo, dir_tmp)
+                except ValueError as e:
+                    rechazados[archivo] = {'huella': huellas[archivo], 'motivo': str(e)}
+                    del claves_fuente[archivo]
+                    continue
+                claves_fuente[archivo] = sorted(preparadas[archivo], key=partes_clave)
+
+        duenos = resolver_particiones(claves_fuente)
+
+        for archivo in claves_fuente:
+            recuperadas = [
+                clave for clave, origen in duenos.items()
+                if origen == archivo and manifiesto['particiones'].get(clave, {}).get('origen') != archivo
+            ]
+            if recuperadas and archivo not in preparadas:
+                preparadas[archivo] = preparar_extracto(archivo, dir_tmp)
+
+        cambios = []
+
+        for clave, origen in duenos.items():
+            if origen not in preparadas:
+                continue
+
+            nueva = preparadas[origen][clave]
+            actual = manifiesto['particiones'].get(clave)
+
+            if actual is not None and actual['origen'] == origen and actual['hash'] == nueva['hash']:
+                continue
+
+            dir_particion = os.path.join(DIR_PARTICIONES, clave)
+            os.makedirs(dir_particion, exist_ok=True)
+            for nombre in ('datos.parquet', 'agregado.parquet'):
+                os.replace(os.path.join(nueva['ruta'], nombre), os.path.join(dir_particion, nombre))
+
+            manifiesto['particiones'][clave] = {'hash': nueva['hash'], 'origen': origen, 'filas': nueva['filas']}
+            cambios.append(clave)
+
+        for clave in [c for c in manifiesto['particiones'] if c not in duenos]:
+            borrar_particion(clave)
+            del manifiesto['particiones'][clave]
+            cambios.append(clave)
+
+        extractos = {archivo: {'huella': huellas[archivo], 'claves': claves} for archivo, claves in claves_fuente.items()}
+
+        if cambios or extractos != manifiesto['extractos'] or rechazados != manifiesto.get('rechazados', {}):
+            manifiesto['extractos'] = extractos
+            manifiesto['rechazados'] = rechazados
+            if cambios:
+                manifiesto['version'] += 1
+            guardar_manifiesto(manifiesto)
+
+        return cambios
+    finally:
+        shutil.rmtree(dir_tmp, ignore_errors=True)
+
+def extractos_rechazados():
+    """Fuentes de morbilidad que no se incorporaron al almacén: [(archivo, motivo)]"""
+    try:
+        return [(archivo, registro['motivo']) for archivo, registro in leer_manifiesto().get('rechazados', {}).items()]
+    except Exception:
+        return []
+
+def claves_particiones(manifiesto):
+    """Particiones del almacén en orden numérico (ano=2019/mes=2 antes que ano=2019/mes=10)"""
+    if not manifiesto['particiones']:
+        raise FileNotFoundError(f"No se encontró {ARCHIVO_MORBILIDAD} ni un almacén particionado")
+
+    return sorted(manifiesto['particiones'], key=partes_clave)
+
+def leer_particiones(agregado=False):
+    """Leer la morbilidad del almacén particionado (registros o agregados por partición)"""
+    partes = []
+
+    for clave in claves_particiones(leer_manifiesto()):
+        ruta = os.path.join(DIR_PARTICIONES, clave, 'agregado.parquet' if agregado else 'datos.parquet')
+        disponibles = pq.read_schema(ruta).names
+        partes.append(pd.read_parquet(ruta, columns=[c for c in disponibles if c in COLUMNAS_MORBILIDAD or agregado]))
+
+    df = pd.concat(partes, ignore_index=True)
+
+    if agregado:
+        # Con particiones mensuales la misma combinación de dimensiones aparece en varios meses
+        dimensiones = [c for c in COLUMNAS_DIMENSION if c in df.columns]
+        df = combinar_agregados([df], dimensiones)
+
+    return df
+
+def morbilidad_disponible():
+    """Indica si hay registros de morbilidad (CSV, extractos o almacén particionado)"""
+    if any(os.path.exists(archivo) for archivo in archivos_morbilidad()):
+        return True
+
+    try:
+        return pq is not None and bool(leer_manifiesto()['particiones'])
+    except Exception:
+        return False
+
+def leer_morbilidad():
+    """Morbilidad desde el almacén particionado; CSV directo si no hay pyarrow o falla el almacén"""
+    if pq is not None:
+        try:
+            actualizar_particiones()
+            return leer_particiones(agregado=MODO_PREAGREGADO)
+        except Exception:
+            if not os.path.exists(ARCHIVO_MORBILIDAD):
+                raise
+
+    if MODO_PREAGREGADO:
+        return preagregar_morbilidad(ARCHIVO_MORBILIDAD)
+
+    return pd.read_csv(ARCHIVO_MORBILIDAD, usecols=lambda c: c in COLUMNAS_MORBILIDAD)
+
+def fuentes_morbilidad():
+    """Fuentes de morbilidad que cuentan y las particiones de las que es dueña cada una
+
+    Devuelve [(archivo, claves)] en orden de aplicación; claves es None si la fuente
+    entra completa (sin almacén particionado solo cuenta el CSV base).
+    """
+    if pq is not None:
+        try:
+            manifiesto = leer_manifiesto()
+        except Exception:
+            manifiesto = {'particiones': {}}
+
+        duenos = {}
+        for clave, registro in manifiesto['particiones'].items():
+            duenos.setdefault(registro['origen'], set()).add(clave)
+
+        if duenos:
+            return [(archivo, duenos[archivo]) for archivo in manifiesto['extractos'] if archivo in duenos]
+
+    return [(ARCHIVO_MORBILIDAD, None)]
+
+def columnas_originales():
+    """Columnas de las fuentes de morbilidad sin renombrar, en el orden en que aparecen"""
+    columnas = {}
+
+    for archivo, _ in fuentes_morbilidad():
+        columnas.update(dict.fromkeys(pd.read_csv(archivo, nrows=0).columns))
+
+    return list(columnas)
+
+def bloques_morbilidad_original(columnas, filas=None, tamano_bloque=TAMANO_BLOQUE):
+    """Registros de las fuentes tal como vienen (sin proyectar ni renombrar), por bloques
+
+    De cada fuente solo salen los registros de las particiones de las que es dueña, los
+    mismos que cuentan en el cubo, y en el orden del archivo. Todos los bloques traen
+    `columnas` (vacías si la fuente no las tiene); filas limita el total de registros.
+    """
+    restantes = filas
+
+    for archivo, claves in fuentes_morbilidad():
+        encabezado = pd.read_csv(archivo, nrows=0).columns
+        lectura = [c for c in encabezado if c in columnas or (claves is not None and c in COLUMNAS_PARTICION)]
+
+        for bloque in pd.read_csv(archivo, usecols=lectura, chunksize=tamano_bloque):
+            if claves is not None:
+                mes = bloque['mes'].fillna(MES_SIN_DETALLE) if 'mes' in bloque.columns else MES_SIN_DETALLE
+                clave = 'ano=' + bloque['ano'].astype(int).astype(str) + '/mes=' + pd.Series(mes, index=bloque.index).astype(int).astype(str)
+                bloque = bloque[clave.isin(claves)]
+
+            if restantes is not None:
+                bloque = bloque.iloc[:restantes]
+                restantes -= len(bloque)
+
+            yield bloque.reindex(columns=columnas)
+
+            if restantes == 0:
+                return
+
+def csv_morbilidad_original(columnas):
+    """CSV de los registros originales con las columnas elegidas (se arma al descargar)"""
+    salida = io.StringIO()
+    encabezado = True
+
+    for bloque in bloques_morbilidad_original(columnas):
+        bloque.to_csv(salida, index=False, header=encabezado)
+        encabezado = False
+
+    return salida.getvalue().encode('utf-8-sig')
+
+def contar_registros(df):
+    """Número de registros originales (en modo pre-agregado cada fila resume varios)"""
+    if 'n_registros' in df.columns:
+        return int(df['n_registros'].sum())
+    return len(df)
+
+def resumir_atenciones(df, columnas, metrica='sum'):
+    """Agregar sum_atenciones ('sum', 'mean', 'max', 'min') con registros crudos o pre-agregados"""
+    agrupado = df.groupby(columnas, observed=True)
+
+    if 'n_registros' not in df.columns:
+        return agrupado['sum_atenciones'].agg(metrica)
+
+    if metrica == 'sum':
+        return agrupado['sum_atenciones'].sum()
+    elif metrica == 'mean':
+        return (agrupado['sum_atenciones'].sum() / agrupado['n_registros'].sum()).rename('sum_atenciones')
+    elif metrica == 'max':
+        return agrupado['max_atenciones'].max()
+    else:
+        return agrupado['min_atenciones'].min()
+
+# Columnas de texto de morbilidad con pocos valores distintos (codificación por diccionario)
+COLUMNAS_CATEGORICAS = [
+    'prestador_localidad_nombre',
+    'genero',
+    'sexo_gen',
+    'categoria_trastorno',
+    'dxprincipal_agrupacion1_nombre',
+    'nivel_educativo',
+    'edad_grupo_rias'
+]
+
+def optimizar_tipos(df):
+    """Codificar textos como categorías y reducir los enteros al menor ancho posible"""
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+
+    # Enteros con signo: las restas entre totales (crecimientos) no deben desbordarse
+    for col in ['ano', 'sum_atenciones', 'n_registros', 'min_atenciones', 'max_atenciones']:
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+
+    return df
+
+def validar_esquema(df):
+    """Verificar columnas obligatorias, tipos y rangos de la morbilidad normalizada"""
+    faltantes = [c for c in COLUMNAS_OBLIGATORIAS if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"Faltan columnas en la morbilidad: {', '.join(faltantes)}")
+
+    if not pd.api.types.is_integer_dtype(df[COL_ANO]):
+        raise ValueError(f"La columna {COL_ANO} debe ser entera (tipo {df[COL_ANO].dtype})")
+
+    if not pd.api.types.is_numeric_dtype(df[COL_ATENCIONES]):
+        raise ValueError(f"La columna {COL_ATENCIONES} debe ser numérica (tipo {df[COL_ATENCIONES].dtype})")
+
+    for col in COLUMNAS_CATEGORICAS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            raise ValueError(f"La columna {col} debe ser categórica (tipo {df[col].dtype})")
+
+    if len(df) > 0:
+        ano_min, ano_max = df[COL_ANO].min(), df[COL_ANO].max()
+        if ano_min < RANGO_ANOS[0] or ano_max > RANGO_ANOS[1]:
+            raise ValueError(f"Años fuera de rango en la morbilidad: {ano_min} - {ano_max}")
+
+        if df[COL_ATENCIONES].min() < 0:
+            raise ValueError("La morbilidad tiene atenciones negativas")
+
+    return df
+
+def memoria_mb(df):
+    """Memoria ocupada por un DataFrame en MB (incluye el contenido de los textos)"""
+    return df.memory_usage(deep=True).sum() / 1024**2
+
+class TablaCompartida(pd.DataFrame):
+    """DataFrame de solo lectura compartido entre reruns y sesiones
+
+    Los datos viven una sola vez en memoria (st.cache_resource). Escribir valores falla
+    porque los arreglos son de solo lectura, y agregar, reemplazar o borrar columnas
+    también falla. Cualquier operación derivada (filtros, groupby, copy) devuelve un
+    DataFrame normal que la página puede modificar libremente.
+    """
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def _bloquear(self, *args, **kwargs):
+        raise TypeError(
+            "Los datasets compartidos son de solo lectura; usa .copy() antes de modificarlos"
+        )
+
+    __setitem__ = _bloquear
+    __delitem__ = _bloquear
+    insert = _bloquear
+    # Operaciones con inplace=True (sort_values, drop, fillna...) y cambios de ejes
+    # (df.columns = ..., rename(inplace=True))
+    _update_inplace = _bloquear
+    _set_axis = _bloquear
+
+def congelar_tabla(df):
+    """Convertir un DataFrame en TablaCompartida sobre arreglos de solo lectura
+
+    No copia los datos: el DataFrame de entrada no debe seguir usándose. Los arreglos que
+    ya son de solo lectura (tablas mapeadas en memoria) se reutilizan tal cual.
+    """
+    columnas = {}
+
+    for col in df.columns:
+        serie = df[col]
+
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            codigos = serie.cat.codes.to_numpy()
+            codigos.setflags(write=False)
+            columnas[col] = pd.Categorical.from_codes(codigos, dtype=serie.dtype)
+        else:
+            valores = serie.to_numpy()
+            valores.setflags(write=False)
+            columnas[col] = valores
+
+    # copy=False: cada columna queda como su propio bloque sobre el arreglo congelado
+    return TablaCompartida(columnas, index=df.index, copy=False)
+
+def huella_fuentes(archivos):
+    """Identificador de la versión de los archivos fuente (fecha de modificación y tamaño)"""
+    partes = []
+
+    for archivo in archivos:
+        if os.path.exists(archivo):
+            info = os.stat(archivo)
+            partes.append(f"{archivo}:{info.st_mtime_ns}:{info.st_size}")
+        else:
+            partes.append(f"{archivo}:ausente")
+
+    return '|'.join(partes)
+
+def publicar_arrow(df, nombre, huella, metadatos=None):
+    """Escribir una tabla como archivo Arrow IPC sin comprimir, listo para mapear en memoria"""
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    tabla = tabla.replace_schema_metadata({
+        **(tabla.schema.metadata or {}),
+        b'observatorio_huella': huella.encode('utf-8'),
+        b'observatorio_metadatos': json.dumps(metadatos or {}).encode('utf-8')
+    })
+
+    os.makedirs(DIR_COMPARTIDO, exist_ok=True)
+    ruta = os.path.join(DIR_COMPARTIDO, f"{nombre}.arrow")
+
+    # Escritura atómica: los procesos que ya mapean la versión anterior la conservan
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+    with pa.OSFile(ruta_tmp, 'wb') as destino:
+        with pa.ipc.new_file(destino, tabla.schema) as escritor:
+            escritor.write_table(tabla)
+    os.replace(ruta_tmp, ruta)
+
+def mapear_arrow(nombre, huella):
+    """Mapear en memoria una tabla publicada; devuelve (df, metadatos) o None si no está vigente"""
+    ruta = os.path.join(DIR_COMPARTIDO, f"{nombre}.arrow")
+
+    if not os.path.exists(ruta):
+        return None
+
+    lector = pa.ipc.open_file(pa.memory_map(ruta, 'r'))
+    metadatos_esquema = lector.schema.metadata or {}
+
+    if metadatos_esquema.get(b'observatorio_huella', b'').decode('utf-8') != huella:
+        return None
+
+    # split_blocks evita consolidar columnas: los arreglos numéricos y los códigos de las
+    # categorías quedan como vistas de solo lectura sobre el archivo (sin copiar)
+    df = lector.read_all().to_pandas(split_blocks=True)
+    metadatos = json.loads(metadatos_esquema.get(b'observatorio_metadatos', b'{}'))
+
+    return df, metadatos
+
+def tabla_compartida(nombre, archivos_fuente, construir):
+    """Tabla construida una vez por servidor y mapeada en memoria por cada proceso
+
+    construir() devuelve (df, metadatos). Si la publicación falla (sin pyarrow o sin
+    permisos de escritura) la tabla se construye en memoria del proceso.
+    """
+    huella = huella_fuentes(archivos_fuente)
+    huella = f"{huella}|preagregado={MODO_PREAGREGADO}|esquema={VERSION_ESQUEMA}"
+
+    if pa is not None:
+        try:
+            mapeada = mapear_arrow(nombre, huella)
+
+            if mapeada is None:
+                df, metadatos = construir()
+                publicar_arrow(df, nombre, huella, metadatos)
+                mapeada = mapear_arrow(nombre, huella)
+
+            if mapeada is not None:
+                return mapeada
+        except Exception:
+            pass
+
+    return construir()
+
+def leer_integrado():
+    """Serie temporal integrada por año (atenciones, matrícula, tasas)"""
+    df, _ = tabla_compartida(
+        'integrado',
+        ['dataset_integrado_completo.csv'],
+        lambda: (leer_tabla('dataset_integrado_completo.csv'), {})
+    )
+    return congelar_tabla(df)
+
+def construir_morbilidad_optimizada():
+    """Leer la morbilidad, llevarla al esquema canónico y compactar sus tipos
+
+    Devuelve (df, memoria antes/después).
+    """
+    df_morbilidad = normalizar_esquema(leer_morbilidad())
+    memoria_original = memoria_mb(df_morbilidad)
+    df_morbilidad = validar_esquema(optimizar_tipos(df_morbilidad))
+
+    memoria = {
+        'original': memoria_original,
+        'optimizada': memoria_mb(df_morbilidad)
+    }
+
+    return df_morbilidad, memoria
+
+def construir_cubo(df_morbilidad):
+    """Cubo de morbilidad: suma, conteo, mínimo y máximo por todas las dimensiones del cubo
+
+    Como el cubo está en el formato pre-agregado, contar_registros y resumir_atenciones
+    dan sobre él los mismos resultados que sobre los registros.
+    """
+    dimensiones = [c for c in DIMENSIONES_CUBO if c in df_morbilidad.columns]
+
+    # Un rango de filas por proceso; mapear_en_procesos decide si compensa usar el pool y
+    # los parciales se fusionan en el mismo orden
+    tamano = max(1, -(-len(df_morbilidad) // max(PROCESOS_AGREGACION, 1)))
+    bloques = [df_morbilidad.iloc[inicio:inicio + tamano] for inicio in range(0, max(len(df_morbilidad), 1), tamano)]
+
+    parciales = mapear_en_procesos(partial(agregar_parcial, dimensiones=dimensiones), bloques, len(df_morbilidad))
+    cubo = parciales[0] if len(parciales) == 1 else combinar_agregados(parciales, dimensiones)
+
+    return optimizar_tipos(cubo)
+
+def cubo_particiones(tamano_bloque=TAMANO_BLOQUE):
+    """Cubo de morbilidad desde los agregados por partición del almacén, sin leer registros
+
+    Cada partición (año y mes) se reduce por lotes de su agregado, en paralelo entre
+    procesos. Devuelve None si no hay almacén (sin pyarrow, o falla y queda el CSV).
+    """
+    if pq is None:
+        return None
+
+    try:
+        actualizar_particiones()
+        manifiesto = leer_manifiesto()
+        claves = claves_particiones(manifiesto)
+    except Exception:
+        if not os.path.exists(ARCHIVO_MORBILIDAD):
+            raise
+        return None
+
+    # El año es dimensión del cubo: los parciales de particiones distintas casi no se
+    # solapan y juntos ocupan lo mismo que el cubo
+    filas = sum(manifiesto['particiones'][clave]['filas'] for clave in claves)
+    rutas = [os.path.join(DIR_PARTICIONES, clave, 'agregado.parquet') for clave in claves]
+    parciales = mapear_en_procesos(partial(reducir_particion, tamano_bloque=tamano_bloque), rutas, filas)
+    cubo = reducir_bloques(p for p in parciales if p is not None)
+
+    if cubo is None:
+        raise ValueError("La morbilidad no tiene registros")
+
+    return validar_esquema(optimizar_tipos(cubo))
+
+def cubo_morbilidad(df_morbilidad):
+    """Cubo de la morbilidad ya leída: de los agregados por partición si hay almacén"""
+    cubo = cubo_particiones()
+    return cubo if cubo is not None else construir_cubo(df_morbilidad)
+
+def cubo_por_bloques(tamano_bloque=TAMANO_BLOQUE):
+    """Cubo de morbilidad como map-reduce sobre bloques: la memoria depende del tamaño del
+    cubo, no del número de registros
+
+    Con el almacén particionado se usa cubo_particiones; sin pyarrow se reducen bloques de
+    registros del CSV. Da el mismo cubo que construir_cubo sobre la morbilidad completa:
+    sumas, conteos, mínimos y máximos se combinan sin pérdida.
+    """
+    cubo = cubo_particiones(tamano_bloque)
+
+    if cubo is not None:
+        return cubo
+
+    cubo = reducir_bloques(pd.read_csv(ARCHIVO_MORBILIDAD, usecols=lambda c: c in COLUMNAS_MORBILIDAD, chunksize=tamano_bloque))
+
+    if cubo is None:
+        raise ValueError("La morbilidad no tiene registros")
+
+    return validar_esquema(optimizar_tipos(cubo))
+
+def pares_serie(serie):
+    """Serie -> lista [[clave, valor], ...] serializable en JSON, en el mismo orden"""
+    return [[k.item() if hasattr(k, 'item') else k, v.item() if hasattr(v, 'item') else v] for k, v in serie.items()]
+
+def serie_pares(pares):
+    """Lista [[clave, valor], ...] -> Serie"""
+    return pd.Series([v for _, v in pares], index=[k for k, _ in pares])
+
+def indexar_cubo(df):
+    """Ordenar las filas por localidad e indexarlas; devuelve (df ordenado, índice)
+
+    El índice guarda, para cada localidad, el rango [inicio, fin) de sus filas, y los
+    totales de Bogotá que el buscador compara con cada localidad. Es JSON para viajar
+    en los metadatos de la tabla compartida.
+    """
+    df = df.sort_values(COL_LOCALIDAD, kind='stable', ignore_index=True)
+
+    codigos, valores = pd.factorize(df[COL_LOCALIDAD])
+    inicios = np.flatnonzero(np.r_[True, codigos[1:] != codigos[:-1]]) if len(codigos) else np.array([], dtype=int)
+    fines = np.r_[inicios[1:], len(codigos)]
+
+    rangos = {
+        str(valores[codigos[inicio]]): [int(inicio), int(fin)]
+        for inicio, fin in zip(inicios, fines)
+        if codigos[inicio] >= 0
+    }
+
+    ciudad = {'total': df[COL_ATENCIONES].sum().item()}
+
+    for clave, columna in [('por_ano', COL_ANO), ('por_genero', COL_GENERO), ('por_nivel', COL_NIVEL)]:
+        if columna in df.columns:
+            ciudad[clave] = pares_serie(df.groupby(columna, observed=True)[COL_ATENCIONES].sum())
+
+    return df, {'rangos': rangos, 'ciudad': ciudad}
+
+def filas_localidad(df, indice, localidad):
+    """Filas de una localidad en una tabla indexada, sin recorrer las demás"""
+    inicio, fin = indice['rangos'].get(localidad, (0, 0))
+    return df.iloc[inicio:fin]
+
+def indexar_valores(df, columnas):
+    """Posiciones de las filas de cada valor: {columna: {valor: array ordenado de posiciones}}
+
+    Se calcula una vez por versión de los datos sobre los códigos enteros de cada
+    columna; filtrar_filas combina las listas en lugar de comparar la columna entera.
+    """
+    indice = {}
+
+    for columna in columnas:
+        codigos, valores = pd.factorize(df[columna])
+        orden = np.argsort(codigos, kind='stable').astype('int32')
+        limites = np.searchsorted(codigos[orden], np.arange(len(valores) + 1))
+
+        indice[columna] = {}
+        for i, valor in enumerate(valores):
+            posiciones = orden[limites[i]:limites[i + 1]]
+            posiciones.setflags(write=False)
+            indice[columna][valor.item() if hasattr(valor, 'item') else valor] = posiciones
+
+    return indice
+
+def filtrar_filas(df, indice, filtros):
+    """Filas de df que cumplen {columna: valores}: unión de listas por columna, intersección entre columnas"""
+    posiciones = None
+
+    for columna, valores in filtros.items():
+        listas = [indice[columna][v] for v in valores if v in indice[columna]]
+        seleccion = np.sort(np.concatenate(listas)) if listas else np.array([], dtype='int32')
+        posiciones = seleccion if posiciones is None else np.intersect1d(posiciones, seleccion, assume_unique=True)
+
+    return df if posiciones is None else df.take(posiciones)
+
+# Rankings de localidades materializados: alcance -> dimensiones dentro de las que se ordena
+ALCANCES_RANKING = {
+    'general': [],
+    'por_ano': [COL_ANO],
+    'por_trastorno': [COL_TRASTORNO]
+}
+
+def tabla_rankings(atenciones, grupo):
+    """Rango, percentil y participación de cada localidad dentro de cada grupo
+
+    atenciones: Serie indexada por grupo + localidad. Devuelve un DataFrame con el mismo
+    índice, ordenado de mayor a menor dentro de cada grupo: atenciones, rango (1 = más
+    atenciones), percentil (% de localidades con igual o menos atenciones), participación
+    y participación acumulada en el total del grupo (%).
+    """
+    df = atenciones.rename('atenciones').reset_index()
+    df = df.sort_values(grupo + ['atenciones'], ascending=[True] * len(grupo) + [False], kind='stable', ignore_index=True)
+
+    por_grupo = df.groupby(grupo or np.zeros(len(df), dtype=int), observed=True, sort=False)['atenciones']
+    total = por_grupo.transform('sum')
+
+    df['rango'] = por_grupo.cumcount() + 1
+    df['percentil'] = por_grupo.rank(method='max', pct=True) * 100
+    df['participacion'] = df['atenciones'] / total * 100
+    df['participacion_acumulada'] = por_grupo.cumsum() / total * 100
+
+    return df.set_index(grupo + [COL_LOCALIDAD])
+
+def materializar_rankings(agregar):
+    """Tablas de rankings de localidades de cada alcance que se pueda calcular
+
+    agregar(dimensiones) devuelve las atenciones por esas dimensiones, o None si no hay
+    datos para agruparlas (modo resumen).
+    """
+    rankings = {}
+
+    for alcance, grupo in ALCANCES_RANKING.items():
+        atenciones = agregar(grupo + [COL_LOCALIDAD])
+        if atenciones is not None:
+            rankings[alcance] = tabla_rankings(atenciones, grupo)
+
+    return rankings
+
+def brechas_genero(atenciones):
+    """Brecha de género para cada grupo en una sola pasada (tabla grupos x género)
+
+    atenciones: Serie indexada por una o más dimensiones más el género (por ejemplo
+    datos.agregar([COL_LOCALIDAD, COL_ANO, COL_GENERO])). Devuelve, por grupo con al
+    menos dos géneros: género predominante, brecha (predominante / segundo), participación
+    del predominante y total. Las páginas ordenan o eligen los extremos por brecha.
+    """
+    tabla = atenciones.unstack(COL_GENERO)
+    valores = tabla.to_numpy(dtype='float64')
+    presentes = ~np.isnan(valores)
+
+    # Géneros de cada fila ordenados de mayor a menor; los ausentes al final
+    orden = np.argsort(np.where(presentes, -valores, np.inf), axis=1, kind='stable')
+    filas = np.arange(len(tabla))
+    predominante = valores[filas, orden[:, 0]]
+    segundo = valores[filas, orden[:, 1]] if tabla.shape[1] > 1 else np.full(len(tabla), np.nan)
+    total = np.nansum(valores, axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        resultado = pd.DataFrame({
+            'genero_predominante': np.asarray(tabla.columns)[orden[:, 0]],
+            'brecha': predominante / segundo,
+            'participacion': predominante / total,
+            'total': total.astype('int64')
+        }, index=tabla.index)
+
+    return resultado[presentes.sum(axis=1) >= 2]
+
+def leer_morbilidad_optimizada():
+    """Morbilidad con tipos compactos, su memoria antes/después, su cubo, el índice del cubo
+    y las posiciones de cada valor en el cubo
+
+    El cubo (ordenado por localidad) se publica con la misma huella que la morbilidad y
+    lleva su índice en los metadatos: se construyen una sola vez por versión de los
+    datos y se recargan juntos. En ambos modos el cubo sale de los agregados por
+    partición; solo sin almacén se agrega sobre los registros. Las posiciones y los
+    rankings se calculan en cada proceso.
+
+    En modo fuera de memoria no se leen los registros: el cubo se construye por bloques
+    y se devuelve también como morbilidad (las páginas ya aceptan el formato pre-agregado).
+    """
+    archivos = archivos_morbilidad()
+
+    if MODO_FUERA_DE_MEMORIA:
+        cubo, indice = tabla_compartida('cubo_morbilidad', archivos, lambda: indexar_cubo(cubo_por_bloques()))
+        cubo = congelar_tabla(cubo)
+        df_morbilidad = cubo
+        memoria = {'original': memoria_mb(cubo), 'optimizada': memoria_mb(cubo)}
+    else:
+        df_morbilidad, memoria = tabla_compartida('morbilidad', archivos, construir_morbilidad_optimizada)
+        cubo, indice = tabla_compartida('cubo_morbilidad', archivos, lambda: indexar_cubo(cubo_morbilidad(df_morbilidad)))
+        df_morbilidad, cubo = congelar_tabla(df_morbilidad), congelar_tabla(cubo)
+
+    posiciones = indexar_valores(cubo, [c for c in DIMENSIONES_CUBO if c in cubo.columns])
+    rankings = materializar_rankings(lambda dimensiones: resumir_atenciones(cubo, dimensiones))
+    rankings = {alcance: congelar_tabla(tabla) for alcance, tabla in rankings.items()}
+
+    return df_morbilidad, memoria, cubo, indice, posiciones, rankings
+
+def leer_clasificacion():
+    """Clasificación de riesgo por localidad (Random Forest)"""
+    return congelar_tabla(leer_tabla('clasificacion_riesgo_localidades.csv'))
+
+def leer_clustering():
+    """Clusters de localidades similares (K-Means)"""
+    return congelar_tabla(leer_tabla('clustering_localidades.csv'))
+
+def leer_kpis():
+    """KPIs, alertas y semáforo de riesgo"""
+    with open('kpis_y_alertas.json', 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def leer_ecas():
+    """Factores de riesgo ECAS 2016 (opcional)"""
+    try:
+        with open('analisis_factores_riesgo_ecas.json', 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except:
+        return None
+
+def leer_resumenes():
+    """Tablas resumen disponibles, con las columnas renombradas como en la morbilidad"""
+    resumenes = {}
+
+    for nombre, archivo in ARCHIVOS_RESUMEN.items():
+        if os.path.exists(archivo):
+            resumenes[nombre] = pd.read_csv(archivo, encoding='utf-8-sig').rename(columns=COLUMNAS_RESUMEN)
+
+    return resumenes
+
+def leer_factores():
+    """Factores de riesgo por año: prevalencias 2016-2024 y proyecciones 2025-2030 (%)"""
+    # Datos históricos y proyectados (ECAS 2016 y fuentes externas)
+    años = list(range(2016, 2031))
+
+    factores_data = {
+        'año': años,
+        'sm_general': [44.7, 45.2, 45.8, 46.3, 48.5, 47.2, 46.5, 45.9, 44.7, 44.5, 44.2, 43.9, 43.7, 43.5, 43.4],
+        'ansiedad': [12.2, 13.1, 14.2, 15.3, 18.7, 17.2, 16.5, 15.8, 15.2, 14.8, 14.5, 14.2, 14.0, 13.8, 13.7],
+        'depresion': [12.2, 13.5, 14.8, 16.1, 19.2, 17.8, 16.9, 16.2, 15.7, 15.3, 14.9, 14.6, 14.4, 14.2, 14.1],
+        'tdah': [2.3, 2.4, 2.5, 2.6, 2.7, 2.8, 2.9, 3.0, 3.1, 3.2, 3.3, 3.4, 3.5, 3.6, 3.7],
+        'alcohol': [48.5, 49.2, 49.8, 50.4, 47.2, 48.5, 49.8, 50.3, 50.8, 51.2, 51.6, 52.0, 52.3, 52.6, 52.9],
+        'tabaco': [15.2, 14.8, 14.3, 13.9, 12.5, 13.1, 13.6, 13.2, 12.9, 12.6, 12.3, 12.1, 11.9, 11.7, 11.5],
+        'marihuana': [8.5, 9.2, 9.9, 10.6, 9.8, 10.5, 11.3, 12.1, 12.8, 13.4, 14.1, 14.7, 15.3, 15.9, 16.4],
+        'bullying': [29.3, 28.7, 28.2, 27.6, 22.4, 25.8, 27.3, 28.1, 28.6, 29.0, 29.3, 29.6, 29.8, 30.0, 30.2],
+        'ideacion_suicida': [6.2, 6.5, 6.8, 7.1, 8.9, 8.3, 7.8, 7.4, 7.1, 6.9, 6.7, 6.5, 6.4, 6.3, 6.2],
+        'consumo_problematico': [3.2, 3.5, 3.8, 4.1, 3.6, 4.2, 4.7, 5.2, 5.8, 6.3, 6.9, 7.4, 7.9, 8.4, 8.9]
+    }
+
+    return congelar_tabla(pd.DataFrame(factores_data))
+
+# Dataset en caché -> (archivos de los que depende o función que los lista, función que lo construye)
+DATASETS = {
+    'integrado': (['dataset_integrado_completo.csv'], leer_integrado),
+    'morbilidad': (archivos_morbilidad, leer_morbilidad_optimizada),
+    'clasificacion': (['clasificacion_riesgo_localidades.csv'], leer_clasificacion),
+    'clustering': (['clustering_localidades.csv'], leer_clustering),
+    'kpis': (['kpis_y_alertas.json'], leer_kpis),
+    'ecas': (['analisis_factores_riesgo_ecas.json'], leer_ecas),
+    'factores': ([], leer_factores),
+    'resumenes': (list(ARCHIVOS_RESUMEN.values()), leer_resumenes)
+}
+
+def estado_archivos(archivos):
+    """Fecha de modificación y tamaño de cada archivo (comprobación barata en cada acceso)"""
+    estado = []
+
+    for archivo in archivos:
+        try:
+            info = os.stat(archivo)
+            estado.append((info.st_mtime_ns, info.st_size))
+        except OSError:
+            estado.append(None)
+
+    return tuple(estado)
+
+def hash_contenido(archivos):
+    """Hash del contenido de los archivos (distingue cambios reales de un simple touch)"""
+    h = hashlib.blake2b(digest_size=16)
+
+    for archivo in archivos:
+        try:
+            with open(archivo, 'rb') as f:
+                for bloque in iter(lambda: f.read(1024 * 1024), b''):
+                    h.update(bloque)
+        except OSError:
+            h.update(b'ausente')
+        h.update(b'|')
+
+    return h.hexdigest()
+
+def archivos_dataset(nombre):
+    """Archivos de los que depende un dataset y la función que lo construye"""
+    archivos, construir = DATASETS[nombre]
+
+    if callable(archivos):
+        archivos = archivos()
+
+    return archivos, construir
+
+class CacheVersionada:
+    """Datasets del proceso indexados por la huella de sus archivos fuente
+
+    Cada acceso compara fecha y tamaño de los archivos. Si cambiaron, un hilo en segundo
+    plano verifica el contenido y recarga el dataset mientras se sigue sirviendo la
+    versión anterior; al terminar, la nueva versión reemplaza a la anterior de forma
+    atómica. Los datasets cuyos archivos no cambian permanecen en caché.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks_carga = {}
+        self._entradas = {}
+        self._recargando = set()
+        self._tiempos = {}
+
+    def obtener(self, nombre):
+        archivos, construir = archivos_dataset(nombre)
+        estado = estado_archivos(archivos)
+
+        with self._lock:
+            entrada = self._entradas.get(nombre)
+            lock_carga = self._locks_carga.setdefault(nombre, threading.Lock())
+
+        if entrada is None:
+            # Primera carga: síncrona y una sola vez aunque varias sesiones la pidan a la vez
+            with lock_carga:
+                with self._lock:
+                    entrada = self._entradas.get(nombre)
+
+                if entrada is None:
+                    entrada = {'estado': estado, 'hash': None, 'version': 1, 'valor': self._construir(nombre, archivos, construir)}
+
+                    with self._lock:
+                        self._entradas[nombre] = entrada
+
+                    threading.Thread(target=self._registrar_hash, args=(nombre, archivos), daemon=True).start()
+
+            return entrada['valor']
+
+        if estado != entrada['estado']:
+            with self._lock:
+                iniciar = nombre not in self._recargando
+                self._recargando.add(nombre)
+
+            if iniciar:
+                threading.Thread(target=self._recargar, args=(nombre, estado), daemon=True).start()
+
+        return entrada['valor']
+
+    def precargar(self, nombres, hilos=None):
+        """Cargar en paralelo los datasets que aún no están en caché; la espera queda acotada por el más lento
+
+        Sin pendientes no se crea el pool, y uno solo (o un solo hilo) se carga en este
+        hilo. Los errores no se propagan aquí: el dataset queda sin cargar y el error se
+        reporta cuando la página lo pide.
+        """
+        hilos = HILOS_PRECARGA if hilos is None else hilos
+
+        with self._lock:
+            pendientes = [n for n in dict.fromkeys(nombres) if n not in self._entradas]
+
+        if len(pendientes) <= 1 or hilos <= 1:
+            for nombre in pendientes:
+                self._precargar_uno(nombre)
+            return
+
+        with ThreadPoolExecutor(max_workers=min(len(pendientes), hilos)) as pool:
+            list(pool.map(self._precargar_uno, pendientes))
+
+    def tiempos(self):
+        """Segundos que tomó la última construcción de cada dataset y archivos leídos"""
+        with self._lock:
+            return dict(self._tiempos)
+
+    def version(self, nombre):
+        """Versión del dataset en caché (solo cambia cuando se recarga con contenido nuevo)"""
+        with self._lock:
+            entrada = self._entradas.get(nombre)
+
+        if entrada is None:
+            return None
+
+        return (nombre, entrada['version'])
+
+    def _precargar_uno(self, nombre):
+        try:
+            self.obtener(nombre)
+        except Exception:
+            pass
+
+    def _construir(self, nombre, archivos, construir):
+        inicio = time.perf_counter()
+        valor = construir()
+        segundos = time.perf_counter() - inicio
+
+        with self._lock:
+            self._tiempos[nombre] = {'archivos': list(archivos), 'segundos': segundos}
+
+        return valor
+
+    def _registrar_hash(self, nombre, archivos):
+        # El hash inicial se calcula fuera de la primera carga para no retrasarla
+        contenido = hash_contenido(archivos)
+        estado = estado_archivos(archivos)
+
+        with self._lock:
+            entrada = self._entradas.get(nombre)
+
+            # Si el archivo cambió mientras tanto, el hash no corresponde a los datos en caché
+            if entrada is not None and entrada['hash'] is None and entrada['estado'] == estado:
+                entrada['hash'] = contenido
+
+    def _recargar(self, nombre, estado):
+        archivos, construir = archivos_dataset(nombre)
+
+        try:
+            contenido = hash_contenido(archivos)
+
+            with self._lock:
+                anterior = self._entradas[nombre]
+
+            if contenido == anterior['hash']:
+                # Solo cambió la fecha de modificación: conservar los datos y su versión
+                nueva = dict(anterior, estado=estado)
+            else:
+                nueva = {
+                    'estado': estado,
+                    'hash': contenido,
+                    'version': anterior['version'] + 1,
+                    'valor': self._construir(nombre, archivos, construir)
+                }
+
+            with self._lock:
+                self._entradas[nombre] = nueva
+        except Exception:
+            # Archivo a medio escribir o inválido: seguir sirviendo la versión anterior
+            pass
+        finally:
+            with self._lock:
+                self._recargando.discard(nombre)
+
+@st.cache_resource
+def cache_datasets():
+    """Caché de datasets compartida por todas las sesiones del proceso"""
+    return CacheVersionada()
+
+class CacheLRU:
+    """Caché LRU compartida por todas las sesiones, acotada por memoria
+
+    La clave incluye la versión de los datos, así que una recarga deja las entradas
+    anteriores sin uso y el LRU las descarta. medir(valor) devuelve los bytes que ocupa
+    (y puede dejar el valor de solo lectura).
+    """
+
+    def __init__(self, limite_mb, medir):
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._limite = limite_mb * 1024**2
+        self._medir = medir
+        self._bytes = 0
+        self._aciertos = 0
+        self._fallos = 0
+
+    def obtener(self, clave, calcular):
+        with self._lock:
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                self._aciertos += 1
+                return self._entradas[clave][0]
+
+            self._fallos += 1
+
+        # El cálculo va fuera del lock: otras sesiones siguen leyendo mientras tanto
+        valor = calcular()
+        tamano = self._medir(valor)
+
+        with self._lock:
+            if clave not in self._entradas and tamano <= self._limite:
+                self._entradas[clave] = (valor, tamano)
+                self._bytes += tamano
+
+                while self._bytes > self._limite:
+                    _, (_, liberado) = self._entradas.popitem(last=False)
+                    self._bytes -= liberado
+
+        return valor
+
+    def estadisticas(self):
+        """Aciertos, fallos, entradas y memoria ocupada"""
+        with self._lock:
+            return {
+                'aciertos': self._aciertos,
+                'fallos': self._fallos,
+                'entradas': len(self._entradas),
+                'memoria_mb': self._bytes / 1024**2
+            }
+
+def medir_agregado(serie):
+    """Bytes de un agregado, que queda de solo lectura"""
+    serie.values.setflags(write=False)
+    return int(serie.memory_usage(deep=True))
+
+def medir_figura(fig):
+    """Bytes de una figura (su JSON, lo que se envía al navegador)"""
+    return len(fig.to_json())
+
+@st.cache_resource
+def cache_agregados():
+    """Caché de agregados compartida por todas las sesiones del proceso"""
+    return CacheLRU(LIMITE_CACHE_AGREGADOS_MB, medir_agregado)
+
+@st.cache_resource
+def cache_figuras():
+    """Caché de figuras Plotly compartida por todas las sesiones del proceso"""
+    return CacheLRU(LIMITE_CACHE_FIGURAS_MB, medir_figura)
+
+def mostrar_figura(id_figura, version, construir, parametros=()):
+    """Dibujar una figura construyéndola solo si no está en caché
+
+    La clave es (id_figura, versión de los datos, parámetros): construir() (agregación
+    y trazas) solo corre la primera vez en el proceso. Se guarda el objeto Figure, no
+    su dict, porque st.plotly_chart vuelve a validar los dicts en cada rerun.
+    """
+    figura = cache_figuras().obtener((id_figura, version, tuple(parametros)), construir)
+    st.plotly_chart(figura, width='stretch')
+
+class PercentilSQLite:
+    """Agregado quantile_cont(valor, p) para SQLite (el mismo nombre y resultado que en DuckDB)"""
+
+    def __init__(self):
+        self.valores = []
+        self.p = None
+
+    def step(self, valor, p):
+        if valor is not None:
+            self.valores.append(valor)
+        self.p = p
+
+    def finalize(self):
+        return float(np.quantile(self.valores, self.p)) if self.valores else None
+
+class MedianaSQLite(PercentilSQLite):
+    """Agregado median(valor) para SQLite"""
+
+    def step(self, valor):
+        super().step(valor, 0.5)
+
+class MotorSQL:
+    """Consultas SQL de solo lectura sobre las tablas del observatorio
+
+    Con DuckDB cada consulta abre una conexión en memoria que lee los DataFrames sin
+    copiarlos (los filtros y columnas de la consulta se aplican al leerlos) y sin acceso
+    a archivos. Sin DuckDB las tablas se copian una vez a un SQLite en memoria que solo
+    autoriza lecturas (por eso no se le pasan los registros de morbilidad, solo el
+    cubo); quantile_cont y median se agregan para que las mismas consultas funcionen en
+    los dos motores.
+    """
+
+    def __init__(self, tablas):
+        self._tablas = tablas
+        self._lock = threading.Lock()
+        self.motor = 'DuckDB' if duckdb is not None else 'SQLite'
+
+        if duckdb is None:
+            self._sqlite = sqlite3.connect(':memory:', check_same_thread=False)
+            for nombre, df in tablas.items():
+                categoricas = df.select_dtypes('category').columns
+                df.astype({c: 'object' for c in categoricas}).to_sql(nombre, self._sqlite, index=False)
+
+            self._sqlite.create_aggregate('quantile_cont', 2, PercentilSQLite)
+            self._sqlite.create_aggregate('median', 1, MedianaSQLite)
+            self._sqlite.set_authorizer(autorizar_lectura_sqlite)
+
+    def tablas(self):
+        """Tabla -> columnas"""
+        return {nombre: list(df.columns) for nombre, df in self._tablas.items()}
+
+    def consultar(self, consulta):
+        """Resultado de una consulta SELECT (o WITH ... SELECT): (DataFrame, truncado)
+
+        Se leen como máximo FILAS_MAXIMAS_SQL filas (truncado indica que había más) y la
+        consulta se cancela a los TIEMPO_MAXIMO_SQL segundos con TimeoutError.
+        """
+        if not consulta.lstrip().lower().startswith(('select', 'with')):
+            raise ValueError("Solo se permiten consultas SELECT")
+
+        if duckdb is None:
+            with self._lock:
+                return self._consultar_sqlite(consulta)
+
+        return self._consultar_duckdb(consulta)
+
+    def _consultar_sqlite(self, consulta):
+        limite = time.monotonic() + TIEMPO_MAXIMO_SQL
+
+        # SQLite llama al manejador cada 10.000 instrucciones; un valor distinto de 0 la interrumpe
+        self._sqlite.set_progress_handler(lambda: int(time.monotonic() > limite), 10_000)
+        try:
+            cursor = self._sqlite.execute(consulta)
+            columnas = [d[0] for d in cursor.description]
+            filas = cursor.fetchmany(FILAS_MAXIMAS_SQL + 1)
+        except sqlite3.OperationalError:
+            if time.monotonic() > limite:
+                raise TimeoutError(f"La consulta superó el límite de {TIEMPO_MAXIMO_SQL:.0f} s y se canceló") from None
+            raise
+        finally:
+            self._sqlite.set_progress_handler(None, 0)
+
+        resultado = pd.DataFrame.from_records(filas[:FILAS_MAXIMAS_SQL], columns=columnas)
+        return resultado, len(filas) > FILAS_MAXIMAS_SQL
+
+    def _consultar_duckdb(self, consulta):
+        con = duckdb.connect(':memory:', config={'memory_limit': MEMORIA_MAXIMA_SQL, 'threads': HILOS_SQL})
+        vencida = threading.Event()
+
+        def cancelar():
+            vencida.set()
+            con.interrupt()
+
+        temporizador = threading.Timer(TIEMPO_MAXIMO_SQL, cancelar)
+
+        try:
+            for nombre, df in self._tablas.items():
+                con.register(nombre, df)
+            con.execute("SET enable_external_access = false")
+            con.execute("SET lock_configuration = true")
+
+            temporizador.start()
+            cursor = con.execute(consulta)
+
+            # El resultado se lee por trozos: no se trae más allá del límite
+            partes = []
+            filas = 0
+            while True:
+                partes.append(cursor.fetch_df_chunk())
+                filas += len(partes[-1])
+                if partes[-1].empty or filas > FILAS_MAXIMAS_SQL:
+                    break
+
+            resultado = pd.concat([p for p in partes if not p.empty] or partes[:1], ignore_index=True)
+            return resultado.iloc[:FILAS_MAXIMAS_SQL], filas > FILAS_MAXIMAS_SQL
+        except Exception:
+            if vencida.is_set():
+                raise TimeoutError(f"La consulta superó el límite de {TIEMPO_MAXIMO_SQL:.0f} s y se canceló") from None
+            raise
+        finally:
+            temporizador.cancel()
+            con.close()
+
+def autorizar_lectura_sqlite(accion, tabla, *_):
+    """Autorizador de SQLite: solo lecturas de las tablas del observatorio, funciones y CTE
+
+    El catálogo (sqlite_master y demás tablas sqlite_*) no se puede leer.
+    """
+    if accion == sqlite3.SQLITE_READ and tabla is not None and tabla.lower().startswith('sqlite_'):
+        return sqlite3.SQLITE_DENY
+    if accion in (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE):
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+@st.cache_resource(max_entries=1)
+def motor_sql(versiones, _tablas):
+    """Motor SQL compartido por las sesiones; se reconstruye cuando cambia la versión de los datos"""
+    return MotorSQL(_tablas)
+
+# Consultas de ejemplo del editor SQL (funcionan en DuckDB y en SQLite)
+CONSULTAS_SQL = {
+    "Percentiles de atenciones anuales por localidad": """WITH anual AS (
+    SELECT prestador_localidad_nombre, ano, SUM(sum_atenciones) AS atenciones
+    FROM cubo
+    GROUP BY prestador_localidad_nombre, ano
+)
+SELECT ano,
+       quantile_cont(atenciones, 0.25) AS p25,
+       median(atenciones) AS mediana,
+       quantile_cont(atenciones, 0.75) AS p75,
+       quantile_cont(atenciones, 0.90) AS p90
+FROM anual
+GROUP BY ano
+ORDER BY ano""",
+    "Participación de cada trastorno": """SELECT categoria_trastorno,
+       SUM(sum_atenciones) AS atenciones,
+       100.0 * SUM(sum_atenciones) / SUM(SUM(sum_atenciones)) OVER () AS participacion_pct
+FROM cubo
+GROUP BY categoria_trastorno
+ORDER BY atenciones DESC""",
+    "Variación anual (YoY) por localidad": """WITH anual AS (
+    SELECT prestador_localidad_nombre, ano, SUM(sum_atenciones) AS atenciones
+    FROM cubo
+    GROUP BY prestador_localidad_nombre, ano
+)
+SELECT prestador_localidad_nombre, ano, atenciones,
+       100.0 * (atenciones - LAG(atenciones) OVER w) / LAG(atenciones) OVER w AS variacion_pct
+FROM anual
+WINDOW w AS (PARTITION BY prestador_localidad_nombre ORDER BY ano)
+ORDER BY prestador_localidad_nombre, ano""",
+    "Tasa por 1.000 matriculados": """SELECT c.ano,
+       SUM(c.sum_atenciones) AS atenciones,
+       m.matricula,
+       1000.0 * SUM(c.sum_atenciones) / m.matricula AS tasa_por_1000
+FROM cubo c
+JOIN matricula_anio m ON m.ano = c.ano
+GROUP BY c.ano, m.matricula
+ORDER BY c.ano"""
+}
+
+def cargar_integrado():
+    """Serie temporal integrada por año (atenciones, matrícula, tasas)"""
+    return cache_datasets().obtener('integrado')
 
-st.markdown("""
-<style>
-    .main {
-        background-color: #f8f9fa;
-    }
+def cargar_morbilidad():
+    """Registros de morbilidad en salud mental (6-17 años)"""
+    return cache_datasets().obtener('morbilidad')[0]
 
-    .metric-card {
-        background: white;
-        padding: 20px;
-        border-radius: 10px;
-        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-        margin: 10px 0;
-    }
+def cargar_memoria_morbilidad():
+    """Memoria de la tabla de morbilidad antes y después de optimizar tipos"""
+    return cache_datasets().obtener('morbilidad')[1]
 
-    h1 {
-        color: #1e3a8a;
-        font-weight: 700;
-    }
+def cargar_cubo():
+    """Cubo de morbilidad (suma, conteo, mínimo y máximo por dimensiones)"""
+    return cache_datasets().obtener('morbilidad')[2]
 
-    h2 {
-        color: #2563eb;
-        font-weight: 600;
-    }
+def cargar_indice_localidades():
+    """Rango de filas de cada localidad en el cubo y totales de Bogotá"""
+    return copy.deepcopy(cache_datasets().obtener('morbilidad')[3])
 
-    h3 {
-        color: #3b82f6;
-        font-weight: 500;
-    }
+def cargar_posiciones_cubo():
+    """Posiciones de las filas del cubo con cada valor de sus dimensiones (solo lectura)"""
+    return cache_datasets().obtener('morbilidad')[4]
 
-    .alert-critico {
-        background-color: #fee2e2;
-        border-left: 4px solid #dc2626;
-        padding: 15px;
-        margin: 10px 0;
-        border-radius: 5px;
-    }
+def cargar_rankings():
+    """Rango, percentil y participación de cada localidad: en total, por año y por trastorno"""
+    return cache_datasets().obtener('morbilidad')[5]
 
-    .alert-advertencia {
-        background-color: #fef3c7;
-        border-left: 4px solid #f59e0b;
-        padding: 15px;
-        margin: 10px 0;
-        border-radius: 5px;
-    }
+def cargar_clasificacion():
+    """Clasificación de riesgo por localidad (Random Forest)"""
+    return cache_datasets().obtener('clasificacion')
 
-    .alert-normal {
-        background-color: #d1fae5;
-        border-left: 4px solid #10b981;
-        padding: 15px;
-        margin: 10px 0;
-        border-radius: 5px;
-    }
+def cargar_clustering():
+    """Clusters de localidades similares (K-Means)"""
+    return cache_datasets().obtener('clustering')
 
-    .stButton>button {
-        background-color: #2563eb;
-        color: white;
-        border-radius: 5px;
-        padding: 10px 24px;
-        border: none;
-        font-weight: 500;
-    }
+def cargar_kpis():
+    """KPIs, alertas y semáforo de riesgo (copia propia: los dict no son de solo lectura)"""
+    return copy.deepcopy(cache_datasets().obtener('kpis'))
 
-    .stButton>button:hover {
-        background-color: #1e40af;
-    }
+def cargar_ecas():
+    """Factores de riesgo ECAS 2016 (opcional)"""
+    return copy.deepcopy(cache_datasets().obtener('ecas'))
 
-    @media (max-width: 768px) {
-        .main .block-container {
-            padding: 1rem;
-        }
-    }
-</style>
-""", unsafe_allow_html=True)
+def cargar_factores():
+    """Prevalencias y proyecciones de factores de riesgo 2016-2030"""
+    return cache_datasets().obtener('factores')
 
-# ============================================================================
-# FUNCIONES DE CARGA DE DATOS
-# ============================================================================
+def cargar_resumenes():
+    """Tablas resumen para el modo sin registros de morbilidad"""
+    return {nombre: congelar_tabla(df) for nombre, df in cache_datasets().obtener('resumenes').items()}
 
-@st.cache_data
-def cargar_datos():
-    """Cargar todos los datos necesarios"""
-    try:
-        df_integrado = pd.read_csv('dataset_integrado_completo.csv')
-        df_morbilidad = pd.read_csv('morbilidad_salud_mental_limpio.csv')
-        df_clasificacion = pd.read_csv('clasificacion_riesgo_localidades.csv')
-        df_clustering = pd.read_csv('clustering_localidades.csv')
+# Nombre del dataset -> función que lo carga
+CARGADORES = {
+    'integrado': cargar_integrado,
+    'morbilidad': cargar_morbilidad,
+    'memoria_morbilidad': cargar_memoria_morbilidad,
+    'cubo': cargar_cubo,
+    'indice_localidades': cargar_indice_localidades,
+    'posiciones_cubo': cargar_posiciones_cubo,
+    'rankings': cargar_rankings,
+    'clasificacion': cargar_clasificacion,
+    'clustering': cargar_clustering,
+    'kpis': cargar_kpis,
+    'ecas': cargar_ecas,
+    'factores': cargar_factores,
+    'resumenes': cargar_resumenes
+}
 
-        with open('kpis_y_alertas.json', 'r', encoding='utf-8') as f:
-            kpis_alertas = json.load(f)
+# Dataset expuesto a las páginas -> entrada de la caché versionada de la que proviene
+ORIGEN_DATASET = {
+    'memoria_morbilidad': 'morbilidad',
+    'cubo': 'morbilidad',
+    'indice_localidades': 'morbilidad',
+    'posiciones_cubo': 'morbilidad',
+    'rankings': 'morbilidad'
+}
 
-        try:
-            with open('analisis_factores_riesgo_ecas.json', 'r', encoding='utf-8') as f:
-                factores_ecas = json.load(f)
-        except:
-            factores_ecas = None
-
-        return {
-            'integrado': df_integrado,
-            'morbilidad': df_morbilidad,
-            'clasificacion': df_clasificacion,
-            'clustering': df_clustering,
-            'kpis': kpis_alertas,
-            'ecas': factores_ecas
+# Datasets que lee cada página; los que faltan se cargan en paralelo antes de dibujarla
+DATASETS_PAGINA = {
+    "🏠 Inicio": ['kpis'],
+    "📊 Indicadores Clave": ['integrado', 'kpis'],
+    "🗺️ Mapa de Riesgo": ['clasificacion', 'clustering', 'morbilidad'],
+    "📈 Análisis Temporal": ['integrado', 'morbilidad'],
+    "🧠 Factores de Riesgo": ['factores'],
+    "⚧️ Análisis de Género": ['morbilidad'],
+    "🔍 Buscador de Localidades": ['morbilidad', 'clasificacion'],
+    "📥 Descargar Reportes": ['morbilidad', 'integrado', 'clasificacion', 'clustering', 'kpis', 'resumenes']
+}
+
+class RegistroDatos:
+    """Acceso perezoso a los datasets: cada uno se carga la primera vez que una página lo pide"""
+
+    def __init__(self, cargadores):
+        self._cargadores = cargadores
+        self._cargados = {}
+
+        # Sin registros de morbilidad las páginas se sirven desde las tablas resumen
+        self.degradado = not morbilidad_disponible()
+
+    def __getitem__(self, nombre):
+        self._cargar(nombre)
+        return self._cargados[nombre]
+
+    def _cargar(self, nombre):
+        # No devuelve nada: así una llamada suelta no se muestra en la página (magic de Streamlit)
+        if nombre not in self._cargados:
+            try:
+                self._cargados[nombre] = self._cargadores[nombre]()
+            except Exception as e:
+                st.error(f"Error al cargar datos ({nombre}): {e}")
+                st.stop()
+
+    def __contains__(self, nombre):
+        return nombre in self._cargadores
+
+    def cargados(self):
+        """Nombres de los datasets que ya se cargaron en esta ejecución"""
+        return list(self._cargados)
+
+    def precargar(self, nombres):
+        """Leer en paralelo los archivos de varios datasets antes de que la página los pida"""
+        if self.degradado:
+            nombres = ['resumenes' if n == 'morbilidad' else n for n in nombres]
+
+        pendientes = [n for n in nombres if n not in self._cargados]
+        cache_datasets().precargar(ORIGEN_DATASET.get(n, n) for n in pendientes)
+
+    def agregar(self, dimensiones, metrica='sum', filtros=None):
+        """Atenciones por dimensiones ('sum', 'mean', 'max', 'min'), memoizadas entre páginas y sesiones
+
+        filtros: {columna: valor o lista de valores}. Devuelve una Serie de solo lectura
+        indexada por las dimensiones, o None si en modo resumen ninguna tabla las cubre.
+        """
+        filtros = {
+            col: tuple(valores) if isinstance(valores, (list, tuple, set, pd.Index)) else (valores,)
+            for col, valores in (filtros or {}).items()
         }
-    except Exception as e:
-        st.error(f"Error al cargar datos: {e}")
+        columnas = list(dimensiones) + [c for c in filtros if c not in dimensiones]
+
+        tabla = self.vista_morbilidad(columnas)
+        if tabla is None:
+            return None
+
+        clave = (
+            tuple(dimensiones),
+            tuple(sorted(filtros.items())),
+            metrica,
+            self.version_morbilidad()
+        )
+
+        def calcular():
+            if not self.degradado and tabla is self['cubo']:
+                return resumir_atenciones(filtrar_filas(tabla, self['posiciones_cubo'], filtros), list(dimensiones), metrica)
+
+            df = tabla
+            for col, valores in filtros.items():
+                df = df[df[col].isin(valores)]
+            return resumir_atenciones(df, list(dimensiones), metrica)
+
+        return cache_agregados().obtener(clave, calcular).copy(deep=False)
+
+    def vista_morbilidad(self, dimensiones):
+        """Tabla más pequeña con la que agrupar la morbilidad por esas dimensiones
+
+        Con registros devuelve el cubo (o la morbilidad completa si alguna dimensión no
+        está en el cubo). En modo resumen devuelve la tabla resumen que tiene todas las
+        dimensiones, o None si ninguna las cubre.
+        """
+        if not self.degradado:
+            if all(d in DIMENSIONES_CUBO for d in dimensiones):
+                return self['cubo']
+            return self['morbilidad']
+
+        for tabla in self['resumenes'].values():
+            if 'sum_atenciones' in tabla.columns and all(d in tabla.columns for d in dimensiones):
+                return tabla
+
         return None
 
+    def rankings(self):
+        """Rankings de localidades por alcance ('general', 'por_ano', 'por_trastorno')
+
+        Con registros se leen de las tablas materializadas; en modo resumen se calculan de
+        las tablas resumen y solo están los alcances que estas cubren.
+        """
+        if not self.degradado:
+            return self['rankings']
+        return materializar_rankings(self.agregar)
+
+    def sql(self):
+        """Motor SQL sobre la morbilidad (registros y cubo), la serie integrada y la matrícula
+
+        Los registros solo se exponen con DuckDB, que los lee sin copiarlos; SQLite los
+        copiaría completos a memoria en cada proceso, así que sin DuckDB se consulta el cubo.
+        """
+        tablas = {
+            'cubo': self['cubo'],
+            'integrado': self['integrado']
+        }
+        if duckdb is not None:
+            tablas = {'morbilidad': self['morbilidad'], **tablas}
+        tablas.update({n: df for n, df in self['resumenes'].items() if n.startswith('matricula')})
+
+        versiones = tuple(self.version(n) for n in ('morbilidad', 'integrado', 'resumenes'))
+        return motor_sql(versiones, tablas)
+
+    def version(self, nombre):
+        """Versión de los datos de un dataset (para cachés derivadas: agregados, figuras)"""
+        self._cargar(nombre)
+        return cache_datasets().version(ORIGEN_DATASET.get(nombre, nombre))
+
+    def version_morbilidad(self):
+        """Versión de la tabla de la que salen las agregaciones de morbilidad"""
+        nombre = 'resumenes' if self.degradado else 'morbilidad'
+        return (nombre, self.version(nombre))
+
+def cargar_datos():
+    """Registro de datos perezoso; cada página solo carga lo que usa"""
+    return RegistroDatos(CARGADORES)
+
+def selector_seccion(secciones, key):
+    """Selector de la sección visible de una página, en lugar de st.tabs
+
+    st.tabs ejecuta y envía al navegador el contenido de todas las pestañas en cada
+    rerun; con el selector solo se calcula la sección activa.
+    """
+    return st.radio("Sección", secciones, horizontal=True, key=key, label_visibility="collapsed")
+
+def aviso_modo_resumen(seccion):
+    """Aviso para secciones que necesitan los registros de morbilidad"""
+    st.info(f"ℹ️ {seccion} requiere los registros de morbilidad, que no están disponibles en este servidor. Se muestran solo las tablas resumen.")
+
+def estilo_por_condiciones(columna, condiciones, defecto=''):
+    """CSS de cada celda de una columna a partir de máscaras booleanas
+
+    condiciones: lista de (máscara, css) en orden de prioridad; las celdas que no
+    cumplen ninguna reciben el estilo por defecto.
+    """
+    mascaras = [np.asarray(mascara, dtype=bool) for mascara, _ in condiciones]
+    estilos = [css for _, css in condiciones]
+    return pd.Series(np.select(mascaras, estilos, default=defecto), index=columna.index)
+
+def formato_columnas(formatos):
+    """column_config que formatea columnas numéricas al dibujarlas: {columna: clave de FORMATOS_NUMERO}
+
+    Los valores siguen siendo números (la tabla ordena bien y el formato lo aplica el navegador).
+    """
+    return {
+        columna: st.column_config.NumberColumn(format=FORMATOS_NUMERO[formato][0])
+        for columna, formato in formatos.items()
+    }
+
+@st.fragment
+def tabla_paginada(df, key, estilos=None, formatos=None, columnas=None, filas_por_pagina=FILAS_POR_PAGINA, **kwargs):
+    """st.dataframe que envía al navegador solo la página visible
+
+    La página se corta en el servidor y solo ella se estiliza, columna a columna:
+    estilos = {columna: función(Serie) -> Serie de CSS}. formatos es como en
+    formato_columnas. Cambiar de página solo vuelve a ejecutar la tabla.
+    """
+    n_paginas = max(1, -(-len(df) // filas_por_pagina))
+    pagina = 1
+
+    if n_paginas > 1:
+        # La clave incluye el número de páginas: si cambian los datos se vuelve a la primera
+        pagina = st.number_input(
+            f"Página (de {n_paginas:,})",
+            min_value=1,
+            max_value=n_paginas,
+            value=1,
+            step=1,
+            key=f"{key}_{n_paginas}"
+        )
+
+    inicio = (pagina - 1) * filas_por_pagina
+    filas = df.iloc[inicio:inicio + filas_por_pagina]
+    vista = filas if columnas is None else filas[columnas]
+
+    if estilos:
+        vista = vista.style.format({c: FORMATOS_NUMERO[f][1] for c, f in (formatos or {}).items()})
+        for columna, estilo in estilos.items():
+            vista = vista.apply(estilo, subset=[columna])
+    elif formatos:
+        kwargs['column_config'] = formato_columnas(formatos)
+
+    st.dataframe(vista, **kwargs)
+
+    if n_paginas > 1:
+        st.caption(f"Filas {inicio + 1:,}-{inicio + len(filas):,} de {len(df):,}")
+
 # ============================================================================
 # SIDEBAR - NAVEGACIÓN
 # ============================================================================
@@ -139,7 +2034,7 @@ def sidebar_navigation():
     
     st.sidebar.image(
         "logo.png",
-        use_column_width=True # Ajusta la imagen al ancho de la barra lateral
+        width='stretch' # Ajusta la imagen al ancho de la barra lateral
     )
 
     st.sidebar.title("🧭 Navegación")
@@ -252,29 +2147,32 @@ def pagina_inicio(datos):
             color = '#10b981'
             emoji = '🟢'
 
-        fig = go.Figure(go.Indicator(
-            mode = "gauge+number",
-            value = score,
-            domain = {'x': [0, 1], 'y': [0, 1]},
-            title = {'text': f"{emoji} {nivel}"},
-            gauge = {
-                'axis': {'range': [None, 100]},
-                'bar': {'color': color},
-                'steps': [
-                    {'range': [0, 40], 'color': "#d1fae5"},
-                    {'range': [40, 70], 'color': "#fef3c7"},
-                    {'range': [70, 100], 'color': "#fee2e2"}
-                ],
-                'threshold': {
-                    'line': {'color': "red", 'width': 4},
-                    'thickness': 0.75,
-                    'value': score
+        def figura():
+            fig = go.Figure(go.Indicator(
+                mode = "gauge+number",
+                value = score,
+                domain = {'x': [0, 1], 'y': [0, 1]},
+                title = {'text': f"{emoji} {nivel}"},
+                gauge = {
+                    'axis': {'range': [None, 100]},
+                    'bar': {'color': color},
+                    'steps': [
+                        {'range': [0, 40], 'color': "#d1fae5"},
+                        {'range': [40, 70], 'color': "#fef3c7"},
+                        {'range': [70, 100], 'color': "#fee2e2"}
+                    ],
+                    'threshold': {
+                        'line': {'color': "red", 'width': 4},
+                        'thickness': 0.75,
+                        'value': score
+                    }
                 }
-            }
-        ))
+            ))
+
+            fig.update_layout(height=300)
+            return fig
 
-        fig.update_layout(height=300)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_figura('inicio_semaforo', datos.version('kpis'), figura)
 
     with col2:
         st.markdown("#### 🚨 Alertas Activas")
@@ -362,37 +2260,40 @@ def pagina_indicadores(datos):
     with tab1:
         st.subheader("Evolución de Atenciones por Año")
 
-        fig = go.Figure()
-
-        fig.add_trace(go.Scatter(
-            x=df_integrado['año'],
-            y=df_integrado['atenciones'],
-            mode='lines+markers',
-            name='Atenciones',
-            line=dict(color='#2563eb', width=3),
-            marker=dict(size=10)
-        ))
-
-        fig.update_layout(
-            title="Atenciones en Salud Mental por Año",
-            xaxis_title="Año",
-            yaxis_title="Número de Atenciones",
-            hovermode='x unified',
-            height=400
-        )
+        def figura():
+            fig = go.Figure()
+
+            fig.add_trace(go.Scatter(
+                x=df_integrado['año'],
+                y=df_integrado['atenciones'],
+                mode='lines+markers',
+                name='Atenciones',
+                line=dict(color='#2563eb', width=3),
+                marker=dict(size=10)
+            ))
+
+            fig.update_layout(
+                title="Atenciones en Salud Mental por Año",
+                xaxis_title="Año",
+                yaxis_title="Número de Atenciones",
+                hovermode='x unified',
+                height=400
+            )
+            return fig
 
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_figura('indicadores_evolucion', datos.version('integrado'), figura)
 
         # Tabla de datos
         st.subheader("Datos Detallados")
 
         df_display = df_integrado[['año', 'atenciones', 'matricula', 'tasa_por_500']].copy()
         df_display.columns = ['Año', 'Atenciones', 'Matrícula', 'Tasa por 500']
-        df_display['Atenciones'] = df_display['Atenciones'].apply(lambda x: f"{int(x):,}")
-        df_display['Matrícula'] = df_display['Matrícula'].apply(lambda x: f"{int(x):,}")
-        df_display['Tasa por 500'] = df_display['Tasa por 500'].apply(lambda x: f"{x:.1f}")
 
-        st.dataframe(df_display, use_container_width=True)
+        st.dataframe(
+            df_display,
+            width='stretch',
+            column_config=formato_columnas({'Atenciones': 'entero', 'Matrícula': 'entero', 'Tasa por 500': 'decimal1'})
+        )
 
     with tab2:
         st.subheader("Análisis de Capacidad de Orientadores")
@@ -403,30 +2304,33 @@ def pagina_indicadores(datos):
             # Gráfico de gauge para carga
             carga = indicadores['carga_por_orientador']
 
-            fig = go.Figure(go.Indicator(
-                mode = "gauge+number+delta",
-                value = carga,
-                domain = {'x': [0, 1], 'y': [0, 1]},
-                title = {'text': "Carga por Orientador (casos/año)"},
-                delta = {'reference': 800},
-                gauge = {
-                    'axis': {'range': [None, 1500]},
-                    'bar': {'color': "darkblue"},
-                    'steps': [
-                        {'range': [0, 800], 'color': "#d1fae5"},
-                        {'range': [800, 1200], 'color': "#fef3c7"},
-                        {'range': [1200, 1500], 'color': "#fee2e2"}
-                    ],
-                    'threshold': {
-                        'line': {'color': "red", 'width': 4},
-                        'thickness': 0.75,
-                        'value': 1200
+            def figura():
+                fig = go.Figure(go.Indicator(
+                    mode = "gauge+number+delta",
+                    value = carga,
+                    domain = {'x': [0, 1], 'y': [0, 1]},
+                    title = {'text': "Carga por Orientador (casos/año)"},
+                    delta = {'reference': 800},
+                    gauge = {
+                        'axis': {'range': [None, 1500]},
+                        'bar': {'color': "darkblue"},
+                        'steps': [
+                            {'range': [0, 800], 'color': "#d1fae5"},
+                            {'range': [800, 1200], 'color': "#fef3c7"},
+                            {'range': [1200, 1500], 'color': "#fee2e2"}
+                        ],
+                        'threshold': {
+                            'line': {'color': "red", 'width': 4},
+                            'thickness': 0.75,
+                            'value': 1200
+                        }
                     }
-                }
-            ))
+                ))
 
-            fig.update_layout(height=300)
-            st.plotly_chart(fig, use_container_width=True)
+                fig.update_layout(height=300)
+                return fig
+
+            mostrar_figura('indicadores_carga', datos.version('kpis'), figura)
 
         with col2:
             st.markdown("#### 📋 Análisis de Capacidad")
@@ -458,21 +2362,23 @@ def pagina_indicadores(datos):
 
             tasa_actual = indicadores['tasa_por_500']
 
-            fig = go.Figure()
+            def figura():
+                fig = go.Figure()
 
-            fig.add_trace(go.Bar(
-                x=['Tasa Actual', 'Umbral Advertencia', 'Umbral Crítico'],
-                y=[tasa_actual, 7.5, 12.5],
-                marker_color=['#2563eb', '#f59e0b', '#dc2626']
-            ))
+                fig.add_trace(go.Bar(
+                    x=['Tasa Actual', 'Umbral Advertencia', 'Umbral Crítico'],
+                    y=[tasa_actual, 7.5, 12.5],
+                    marker_color=['#2563eb', '#f59e0b', '#dc2626']
+                ))
 
-            fig.update_layout(
-                title="Comparación con Umbrales de Alerta",
-                yaxis_title="Tasa por 500 estudiantes",
-                height=300
-            )
+                fig.update_layout(
+                    title="Comparación con Umbrales de Alerta",
+                    yaxis_title="Tasa por 500 estudiantes",
+                    height=300
+                )
+                return fig
 
-            st.plotly_chart(fig, use_container_width=True)
+            mostrar_figura('indicadores_umbrales', datos.version('kpis'), figura)
 
         with col2:
             # Brecha de género
@@ -480,17 +2386,20 @@ def pagina_indicadores(datos):
 
             brecha = indicadores['brecha_genero']
 
-            fig = go.Figure(go.Indicator(
-                mode = "number+delta",
-                value = brecha,
-                domain = {'x': [0, 1], 'y': [0, 1]},
-                title = {'text': "Ratio de Brecha"},
-                delta = {'reference': 1.0, 'valueformat': ".2f"},
-                number = {'valueformat': ".2f"}
-            ))
+            def figura():
+                fig = go.Figure(go.Indicator(
+                    mode = "number+delta",
+                    value = brecha,
+                    domain = {'x': [0, 1], 'y': [0, 1]},
+                    title = {'text': "Ratio de Brecha"},
+                    delta = {'reference': 1.0, 'valueformat': ".2f"},
+                    number = {'valueformat': ".2f"}
+                ))
 
-            fig.update_layout(height=300)
-            st.plotly_chart(fig, use_container_width=True)
+                fig.update_layout(height=300)
+                return fig
+
+            mostrar_figura('indicadores_brecha', datos.version('kpis'), figura)
 
             st.info(f"""
             **Brecha de género: {brecha:.2f}x**
@@ -514,7 +2423,6 @@ def pagina_mapa_riesgo(datos):
     st.title("🗺️ Mapa de Riesgo por Localidad")
     st.markdown("### Clasificación y distribución de riesgo en Bogotá (6-17 años)")
     
-    df_morbilidad = datos['morbilidad']
     df_clasificacion = datos['clasificacion']
     df_clustering = datos['clustering']
     
@@ -542,53 +2450,24 @@ def pagina_mapa_riesgo(datos):
         # Gráfico de distribución
         st.markdown("#### Distribución de Riesgo")
         
-        fig = px.pie(
-            values=[riesgo_alto, riesgo_medio, riesgo_bajo],
-            names=['Alto', 'Medio', 'Bajo'],
-            color=['Alto', 'Medio', 'Bajo'],
-            color_discrete_map={'Alto': '#dc2626', 'Medio': '#f59e0b', 'Bajo': '#10b981'},
-            title="Distribución de Localidades por Nivel de Riesgo",
-            hole=0.3
-        )
-        
-        fig.update_traces(textposition='inside', textinfo='percent+label')
-        fig.update_layout(height=400)
-        
-        st.plotly_chart(fig, use_container_width=True)
-        
-        # Tabla de localidades
-        st.markdown("#### Localidades por Nivel de Riesgo")
+        def figura():
+            fig = px.pie(
+                values=[riesgo_alto, riesgo_medio, riesgo_bajo],
+                names=['Alto', 'Medio', 'Bajo'],
+                color=['Alto', 'Medio', 'Bajo'],
+                color_discrete_map={'Alto': '#dc2626', 'Medio': '#f59e0b', 'Bajo': '#10b981'},
+                title="Distribución de Localidades por Nivel de Riesgo",
+                hole=0.3
+            )
         
-        df_display = df_clasificacion[['localidad', 'nivel_riesgo', 'riesgo_predicho', 'confianza']].copy()
-        df_display.columns = ['Localidad', 'Riesgo Real', 'Riesgo Predicho', 'Confianza']
-        df_display['Confianza'] = df_display['Confianza'].apply(lambda x: f"{x:.1%}")
+            fig.update_traces(textposition='inside', textinfo='percent+label')
+            fig.update_layout(height=400)
+            return fig
         
-        # Filtro por nivel
-        filtro_riesgo = st.multiselect(
-            "Filtrar por nivel de riesgo predicho:",
-            ['Alto', 'Medio', 'Bajo'],
-            default=['Alto', 'Medio']
-        )
+        mostrar_figura('mapa_riesgo', datos.version('clasificacion'), figura)
         
-        if filtro_riesgo:
-            df_filtrado = df_display[df_display['Riesgo Predicho'].isin(filtro_riesgo)]
-            
-            # Agregar color según riesgo
-            def color_riesgo(val):
-                if val == 'Alto':
-                    return 'background-color: #fee2e2'
-                elif val == 'Medio':
-                    return 'background-color: #fef3c7'
-                else:
-                    return 'background-color: #d1fae5'
-            
-            st.dataframe(
-                df_filtrado.style.applymap(color_riesgo, subset=['Riesgo Predicho']),
-                use_container_width=True,
-                height=400
-            )
-        else:
-            st.warning("Selecciona al menos un nivel de riesgo para filtrar")
+        # Tabla de localidades (el filtro solo vuelve a ejecutar la tabla)
+        tabla_localidades_riesgo(df_clasificacion)
         
         # Concentración
         concentracion_top3 = (df_clasificacion.nlargest(3, 'confianza')['confianza'].mean() * 100)
@@ -599,28 +2478,31 @@ def pagina_mapa_riesgo(datos):
         st.info("Modelo: K-Means - Agrupa localidades con características similares")
         
         if 'etiqueta_cluster' in df_clustering.columns:
-            # Distribución de clusters
-            cluster_counts = df_clustering['etiqueta_cluster'].value_counts()
-            
             col1, col2 = st.columns([1, 1])
             
             with col1:
                 # Gráfico de barras
-                fig = px.bar(
-                    x=cluster_counts.index,
-                    y=cluster_counts.values,
-                    labels={'x': 'Tipo de Cluster', 'y': 'Número de Localidades'},
-                    title="Distribución de Localidades por Cluster",
-                    color=cluster_counts.index,
-                    color_discrete_map={
-                        'Riesgo Alto': '#dc2626',
-                        'Riesgo Medio': '#f59e0b',
-                        'Riesgo Bajo': '#10b981'
-                    }
-                )
+                def figura():
+                    # Distribución de clusters
+                    cluster_counts = df_clustering['etiqueta_cluster'].value_counts()
+
+                    fig = px.bar(
+                        x=cluster_counts.index,
+                        y=cluster_counts.values,
+                        labels={'x': 'Tipo de Cluster', 'y': 'Número de Localidades'},
+                        title="Distribución de Localidades por Cluster",
+                        color=cluster_counts.index,
+                        color_discrete_map={
+                            'Riesgo Alto': '#dc2626',
+                            'Riesgo Medio': '#f59e0b',
+                            'Riesgo Bajo': '#10b981'
+                        }
+                    )
                 
-                fig.update_layout(showlegend=False, height=400)
-                st.plotly_chart(fig, use_container_width=True)
+                    fig.update_layout(showlegend=False, height=400)
+                    return fig
+
+                mostrar_figura('mapa_clusters', datos.version('clustering'), figura)
             
             with col2:
                 # Métricas por cluster
@@ -645,42 +2527,53 @@ def pagina_mapa_riesgo(datos):
     with tab3:
         st.subheader("Top 10 Localidades con Mayor Riesgo (6-17 años)")
         
-        # Agregar por localidad
-        localidades_atenciones = df_morbilidad.groupby('prestador_localidad_nombre')['sum_atenciones'].sum().sort_values(ascending=False).head(10)
+        # Ranking materializado de localidades
+        rankings = datos.rankings()
+        
+        if 'general' not in rankings:
+            aviso_modo_resumen("El ranking de localidades")
+            return
+        
+        ranking_top = rankings['general'].head(10)
+        localidades_atenciones = ranking_top['atenciones']
         
         # Gráfico horizontal
-        fig = px.bar(
-            x=localidades_atenciones.values,
-            y=localidades_atenciones.index,
-            orientation='h',
-            labels={'x': 'Total de Atenciones', 'y': 'Localidad'},
-            title="Top 10 Localidades por Número de Atenciones (6-17 años)",
-            color=localidades_atenciones.values,
-            color_continuous_scale='Reds'
-        )
+        def figura():
+            fig = px.bar(
+                x=localidades_atenciones.values,
+                y=localidades_atenciones.index,
+                orientation='h',
+                labels={'x': 'Total de Atenciones', 'y': 'Localidad'},
+                title="Top 10 Localidades por Número de Atenciones (6-17 años)",
+                color=localidades_atenciones.values,
+                color_continuous_scale='Reds'
+            )
         
-        fig.update_layout(showlegend=False, height=500)
-        st.plotly_chart(fig, use_container_width=True)
+            fig.update_layout(showlegend=False, height=500)
+            return fig
+
+        mostrar_figura('mapa_top10', datos.version_morbilidad(), figura)
         
         # Tabla detallada
         st.markdown("#### Datos Detallados")
         
+        # Participación dentro del Top 10, a partir de la participación materializada con el
+        # ranking (sobre el total de Bogotá) y la acumulada de las 10 localidades
+        total_top = ranking_top['participacion_acumulada'].iloc[-1]
         df_top = pd.DataFrame({
-            'Localidad': localidades_atenciones.index,
-            'Atenciones': localidades_atenciones.values
+            'Localidad': ranking_top.index,
+            'Atenciones': localidades_atenciones.values,
+            '% del Total': ranking_top['participacion'].values / total_top * 100
         })
         
-        total_top = df_top['Atenciones'].sum()
-        df_top['% del Total'] = (df_top['Atenciones'] / total_top * 100).round(1)
-        df_top['Atenciones'] = df_top['Atenciones'].apply(lambda x: f"{int(x):,}")
-        
-        st.dataframe(df_top, use_container_width=True)
+        st.dataframe(df_top, width='stretch', column_config=formato_columnas({'Atenciones': 'entero', '% del Total': 'decimal1'}))
         
         # Análisis adicional
         st.markdown("#### 📊 Análisis de Concentración")
         
-        top3_pct = df_top['% del Total'].iloc[:3].astype(float).sum()
-        top5_pct = df_top['% del Total'].iloc[:5].astype(float).sum()
+        acumulada = ranking_top['participacion_acumulada'] / total_top * 100
+        top3_pct = acumulada.iloc[min(3, len(acumulada)) - 1]
+        top5_pct = acumulada.iloc[min(5, len(acumulada)) - 1]
         
         col1, col2 = st.columns(2)
         with col1:
@@ -693,6 +2586,44 @@ def pagina_mapa_riesgo(datos):
         else:
             st.success("✅ Distribución relativamente equilibrada entre localidades.")
 
+@st.fragment
+def tabla_localidades_riesgo(df_clasificacion):
+    """Tabla de localidades filtrable por riesgo predicho"""
+    
+    st.markdown("#### Localidades por Nivel de Riesgo")
+    
+    df_display = df_clasificacion[['localidad', 'nivel_riesgo', 'riesgo_predicho', 'confianza']].copy()
+    df_display.columns = ['Localidad', 'Riesgo Real', 'Riesgo Predicho', 'Confianza']
+    df_display['Confianza'] = df_display['Confianza'] * 100
+    
+    # Filtro por nivel
+    filtro_riesgo = st.multiselect(
+        "Filtrar por nivel de riesgo predicho:",
+        ['Alto', 'Medio', 'Bajo'],
+        default=['Alto', 'Medio']
+    )
+    
+    if filtro_riesgo:
+        df_filtrado = df_display[df_display['Riesgo Predicho'].isin(filtro_riesgo)]
+        
+        # Agregar color según riesgo (sobre la columna completa)
+        def color_riesgo(riesgo):
+            return estilo_por_condiciones(riesgo, [
+                (riesgo == 'Alto', 'background-color: #fee2e2'),
+                (riesgo == 'Medio', 'background-color: #fef3c7')
+            ], defecto='background-color: #d1fae5')
+        
+        tabla_paginada(
+            df_filtrado,
+            key="pagina_riesgo",
+            estilos={'Riesgo Predicho': color_riesgo},
+            formatos={'Confianza': 'porcentaje'},
+            width='stretch',
+            height=400
+        )
+    else:
+        st.warning("Selecciona al menos un nivel de riesgo para filtrar")
+
 # ============================================================================
 # PÁGINA 4: ANÁLISIS TEMPORAL Y PREDICCIONES
 # ============================================================================
@@ -711,28 +2642,30 @@ def pagina_analisis_temporal(datos):
         st.subheader("Evolución Histórica de Atenciones (2019-2024)")
         
         # Gráfico principal de línea
-        fig = go.Figure()
-        
-        fig.add_trace(go.Scatter(
-            x=df_integrado['año'],
-            y=df_integrado['atenciones'],
-            mode='lines+markers',
-            name='Atenciones Reales',
-            line=dict(color='#2563eb', width=3),
-            marker=dict(size=12, symbol='circle'),
-            hovertemplate='<b>Año:</b> %{x}<br><b>Atenciones:</b> %{y:,.0f}<extra></extra>'
-        ))
-        
-        fig.update_layout(
-            title="Atenciones en Salud Mental - Población Escolar (6-17 años)",
-            xaxis_title="Año",
-            yaxis_title="Número de Atenciones",
-            hovermode='x unified',
-            height=450,
-            template='plotly_white'
-        )
+        def figura():
+            fig = go.Figure()
+        
+            fig.add_trace(go.Scatter(
+                x=df_integrado['año'],
+                y=df_integrado['atenciones'],
+                mode='lines+markers',
+                name='Atenciones Reales',
+                line=dict(color='#2563eb', width=3),
+                marker=dict(size=12, symbol='circle'),
+                hovertemplate='<b>Año:</b> %{x}<br><b>Atenciones:</b> %{y:,.0f}<extra></extra>'
+            ))
         
-        st.plotly_chart(fig, use_container_width=True)
+            fig.update_layout(
+                title="Atenciones en Salud Mental - Población Escolar (6-17 años)",
+                xaxis_title="Año",
+                yaxis_title="Número de Atenciones",
+                hovermode='x unified',
+                height=450,
+                template='plotly_white'
+            )
+            return fig
+
+        mostrar_figura('temporal_historico', datos.version('integrado'), figura)
         
         # Métricas clave
         col1, col2, col3, col4 = st.columns(4)
@@ -759,45 +2692,48 @@ def pagina_analisis_temporal(datos):
         # Gráfico de tasa por 500
         st.markdown("#### Tasa por 500 Estudiantes")
         
-        fig2 = go.Figure()
-        
-        fig2.add_trace(go.Scatter(
-            x=df_integrado['año'],
-            y=df_integrado['tasa_por_500'],
-            mode='lines+markers',
-            name='Tasa por 500',
-            line=dict(color='#f59e0b', width=3),
-            marker=dict(size=12),
-            fill='tozeroy',
-            fillcolor='rgba(245, 158, 11, 0.2)'
-        ))
-        
-        # Líneas de umbral
-        fig2.add_hline(y=7.5, line_dash="dash", line_color="orange", 
-                      annotation_text="Umbral Advertencia (7.5)", 
-                      annotation_position="right")
-        fig2.add_hline(y=12.5, line_dash="dash", line_color="red", 
-                      annotation_text="Umbral Crítico (12.5)", 
-                      annotation_position="right")
-        
-        fig2.update_layout(
-            title="Evolución de la Tasa por 500 Estudiantes",
-            xaxis_title="Año",
-            yaxis_title="Tasa por 500 estudiantes",
-            height=400,
-            template='plotly_white'
-        )
+        def figura():
+            fig2 = go.Figure()
+        
+            fig2.add_trace(go.Scatter(
+                x=df_integrado['año'],
+                y=df_integrado['tasa_por_500'],
+                mode='lines+markers',
+                name='Tasa por 500',
+                line=dict(color='#f59e0b', width=3),
+                marker=dict(size=12),
+                fill='tozeroy',
+                fillcolor='rgba(245, 158, 11, 0.2)'
+            ))
         
-        st.plotly_chart(fig2, use_container_width=True)
+            # Líneas de umbral
+            fig2.add_hline(y=7.5, line_dash="dash", line_color="orange", 
+                          annotation_text="Umbral Advertencia (7.5)", 
+                          annotation_position="right")
+            fig2.add_hline(y=12.5, line_dash="dash", line_color="red", 
+                          annotation_text="Umbral Crítico (12.5)", 
+                          annotation_position="right")
+        
+            fig2.update_layout(
+                title="Evolución de la Tasa por 500 Estudiantes",
+                xaxis_title="Año",
+                yaxis_title="Tasa por 500 estudiantes",
+                height=400,
+                template='plotly_white'
+            )
+            return fig2
+
+        mostrar_figura('temporal_tasa', datos.version('integrado'), figura)
         
         # Tabla de datos
         with st.expander("📋 Ver datos detallados"):
             df_display = df_integrado[['año', 'atenciones', 'matricula', 'tasa_por_500']].copy()
             df_display.columns = ['Año', 'Atenciones', 'Matrícula', 'Tasa por 500']
-            df_display['Atenciones'] = df_display['Atenciones'].apply(lambda x: f"{int(x):,}")
-            df_display['Matrícula'] = df_display['Matrícula'].apply(lambda x: f"{int(x):,}")
-            df_display['Tasa por 500'] = df_display['Tasa por 500'].apply(lambda x: f"{x:.2f}")
-            st.dataframe(df_display, use_container_width=True)
+            st.dataframe(
+                df_display,
+                width='stretch',
+                column_config=formato_columnas({'Atenciones': 'entero', 'Matrícula': 'entero', 'Tasa por 500': 'decimal2'})
+            )
     
     with tab2:
         st.subheader("Predicciones con Machine Learning y Deep Learning")
@@ -876,48 +2812,50 @@ def pagina_analisis_temporal(datos):
         # Gráfico con predicción
         st.markdown("#### Proyección Visual")
         
-        fig = go.Figure()
-        
-        # Datos históricos
-        fig.add_trace(go.Scatter(
-            x=df_integrado['año'],
-            y=df_integrado['atenciones'],
-            mode='lines+markers',
-            name='Datos Reales',
-            line=dict(color='#2563eb', width=3),
-            marker=dict(size=10)
-        ))
-        
-        # Predicción RF
-        fig.add_trace(go.Scatter(
-            x=[ultimo_año, ultimo_año + 1],
-            y=[ultima_atencion, prediccion_rf],
-            mode='lines+markers',
-            name='Predicción RF',
-            line=dict(color='#10b981', width=3, dash='dash'),
-            marker=dict(size=12, symbol='diamond')
-        ))
-        
-        # Predicción NN
-        fig.add_trace(go.Scatter(
-            x=[ultimo_año, ultimo_año + 1],
-            y=[ultima_atencion, prediccion_nn],
-            mode='lines+markers',
-            name='Predicción NN',
-            line=dict(color='#8b5cf6', width=3, dash='dash'),
-            marker=dict(size=12, symbol='star')
-        ))
-        
-        fig.update_layout(
-            title=f"Proyección de Atenciones para {ultimo_año + 1}",
-            xaxis_title="Año",
-            yaxis_title="Número de Atenciones",
-            height=450,
-            template='plotly_white',
-            legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
-        )
+        def figura():
+            fig = go.Figure()
+        
+            # Datos históricos
+            fig.add_trace(go.Scatter(
+                x=df_integrado['año'],
+                y=df_integrado['atenciones'],
+                mode='lines+markers',
+                name='Datos Reales',
+                line=dict(color='#2563eb', width=3),
+                marker=dict(size=10)
+            ))
+        
+            # Predicción RF
+            fig.add_trace(go.Scatter(
+                x=[ultimo_año, ultimo_año + 1],
+                y=[ultima_atencion, prediccion_rf],
+                mode='lines+markers',
+                name='Predicción RF',
+                line=dict(color='#10b981', width=3, dash='dash'),
+                marker=dict(size=12, symbol='diamond')
+            ))
         
-        st.plotly_chart(fig, use_container_width=True)
+            # Predicción NN
+            fig.add_trace(go.Scatter(
+                x=[ultimo_año, ultimo_año + 1],
+                y=[ultima_atencion, prediccion_nn],
+                mode='lines+markers',
+                name='Predicción NN',
+                line=dict(color='#8b5cf6', width=3, dash='dash'),
+                marker=dict(size=12, symbol='star')
+            ))
+        
+            fig.update_layout(
+                title=f"Proyección de Atenciones para {ultimo_año + 1}",
+                xaxis_title="Año",
+                yaxis_title="Número de Atenciones",
+                height=450,
+                template='plotly_white',
+                legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1)
+            )
+            return fig
+
+        mostrar_figura('temporal_proyeccion', datos.version('integrado'), figura)
         
         # Intervalo de confianza
         st.markdown("#### 📊 Intervalo de Confianza")
@@ -943,28 +2881,30 @@ def pagina_analisis_temporal(datos):
             df_tendencias['variacion_abs'] = df_tendencias['atenciones'].diff()
             
             # Gráfico de variación
-            fig = go.Figure()
+            def figura():
+                fig = go.Figure()
             
-            colors = ['#dc2626' if x > 0 else '#10b981' for x in df_tendencias['variacion'].fillna(0)]
+                colors = ['#dc2626' if x > 0 else '#10b981' for x in df_tendencias['variacion'].fillna(0)]
             
-            fig.add_trace(go.Bar(
-                x=df_tendencias['año'],
-                y=df_tendencias['variacion'],
-                name='Variación %',
-                marker_color=colors,
-                text=df_tendencias['variacion'].apply(lambda x: f"{x:+.1f}%" if pd.notna(x) else ""),
-                textposition='outside'
-            ))
-            
-            fig.update_layout(
-                title="Variación Interanual de Atenciones (%)",
-                xaxis_title="Año",
-                yaxis_title="Variación %",
-                height=400,
-                template='plotly_white'
-            )
+                fig.add_trace(go.Bar(
+                    x=df_tendencias['año'],
+                    y=df_tendencias['variacion'],
+                    name='Variación %',
+                    marker_color=colors,
+                    text=df_tendencias['variacion'].apply(lambda x: f"{x:+.1f}%" if pd.notna(x) else ""),
+                    textposition='outside'
+                ))
             
-            st.plotly_chart(fig, use_container_width=True)
+                fig.update_layout(
+                    title="Variación Interanual de Atenciones (%)",
+                    xaxis_title="Año",
+                    yaxis_title="Variación %",
+                    height=400,
+                    template='plotly_white'
+                )
+                return fig
+
+            mostrar_figura('temporal_variacion', datos.version('integrado'), figura)
             
             # Estadísticas de tendencia
             st.markdown("#### 📊 Estadísticas de Crecimiento")
@@ -1002,62 +2942,67 @@ def pagina_analisis_temporal(datos):
     with tab4:
         st.subheader("Evolución por Género (6-17 años)")
         
+        df_morbilidad = datos.vista_morbilidad([COL_ANO, COL_GENERO])
+        
         # Verificar si hay datos de género
-        if 'genero' in datos['morbilidad'].columns or 'sexo_gen' in datos['morbilidad'].columns:
-            col_genero = 'genero' if 'genero' in datos['morbilidad'].columns else 'sexo_gen'
-            
+        if df_morbilidad is not None and COL_GENERO in df_morbilidad.columns:
             # Agrupar por año y género
-            df_genero = datos['morbilidad'].groupby(['ano', col_genero])['sum_atenciones'].sum().reset_index()
+            df_genero = datos.agregar([COL_ANO, COL_GENERO]).reset_index()
             
             # Gráfico de evolución por género
-            fig = px.line(
-                df_genero,
-                x='ano',
-                y='sum_atenciones',
-                color=col_genero,
-                markers=True,
-                title="Evolución de Atenciones por Género",
-                labels={'ano': 'Año', 'sum_atenciones': 'Atenciones', col_genero: 'Género'},
-                color_discrete_map={'Masculino': '#3b82f6', 'Femenino': '#ec4899', 
-                                   'Hombre': '#3b82f6', 'Mujer': '#ec4899'}
-            )
+            def figura():
+                fig = px.line(
+                    df_genero,
+                    x='ano',
+                    y='sum_atenciones',
+                    color=COL_GENERO,
+                    markers=True,
+                    title="Evolución de Atenciones por Género",
+                    labels={'ano': 'Año', 'sum_atenciones': 'Atenciones', COL_GENERO: 'Género'},
+                    color_discrete_map={'Masculino': '#3b82f6', 'Femenino': '#ec4899', 
+                                       'Hombre': '#3b82f6', 'Mujer': '#ec4899'}
+                )
             
-            fig.update_layout(height=400, template='plotly_white')
-            st.plotly_chart(fig, use_container_width=True)
+                fig.update_layout(height=400, template='plotly_white')
+                return fig
+
+            mostrar_figura('temporal_genero', datos.version_morbilidad(), figura)
             
             # Calcular brecha por año
             st.markdown("#### 📊 Evolución de la Brecha de Género")
             
-            df_brecha = df_genero.pivot(index='ano', columns=col_genero, values='sum_atenciones')
+            df_brecha = df_genero.pivot(index='ano', columns=COL_GENERO, values='sum_atenciones')
             
             if len(df_brecha.columns) == 2:
                 generos = df_brecha.columns
                 df_brecha['ratio'] = df_brecha[generos[0]] / df_brecha[generos[1]]
                 
-                fig2 = go.Figure()
-                
-                fig2.add_trace(go.Scatter(
-                    x=df_brecha.index,
-                    y=df_brecha['ratio'],
-                    mode='lines+markers',
-                    name='Brecha de Género',
-                    line=dict(color='#8b5cf6', width=3),
-                    marker=dict(size=10)
-                ))
+                def figura():
+                    fig2 = go.Figure()
                 
-                fig2.add_hline(y=1.0, line_dash="dash", line_color="gray", 
-                              annotation_text="Equilibrio (1.0)", 
-                              annotation_position="right")
+                    fig2.add_trace(go.Scatter(
+                        x=df_brecha.index,
+                        y=df_brecha['ratio'],
+                        mode='lines+markers',
+                        name='Brecha de Género',
+                        line=dict(color='#8b5cf6', width=3),
+                        marker=dict(size=10)
+                    ))
                 
-                fig2.update_layout(
-                    title=f"Ratio {generos[0]}/{generos[1]} por Año",
-                    xaxis_title="Año",
-                    yaxis_title="Ratio",
-                    height=350,
-                    template='plotly_white'
-                )
+                    fig2.add_hline(y=1.0, line_dash="dash", line_color="gray", 
+                                  annotation_text="Equilibrio (1.0)", 
+                                  annotation_position="right")
                 
-                st.plotly_chart(fig2, use_container_width=True)
+                    fig2.update_layout(
+                        title=f"Ratio {generos[0]}/{generos[1]} por Año",
+                        xaxis_title="Año",
+                        yaxis_title="Ratio",
+                        height=350,
+                        template='plotly_white'
+                    )
+                    return fig2
+
+                mostrar_figura('temporal_brecha_genero', datos.version_morbilidad(), figura)
                 
                 # Análisis de brecha
                 brecha_promedio = df_brecha['ratio'].mean()
@@ -1099,42 +3044,25 @@ def pagina_factores_riesgo(datos):
     # DATOS DE PROYECCIÓN
     # ===========================================================================
     
-    # Datos históricos y proyectados
-    años = list(range(2016, 2031))
-    
-    factores_data = {
-        'año': años,
-        'sm_general': [44.7, 45.2, 45.8, 46.3, 48.5, 47.2, 46.5, 45.9, 44.7, 44.5, 44.2, 43.9, 43.7, 43.5, 43.4],
-        'ansiedad': [12.2, 13.1, 14.2, 15.3, 18.7, 17.2, 16.5, 15.8, 15.2, 14.8, 14.5, 14.2, 14.0, 13.8, 13.7],
-        'depresion': [12.2, 13.5, 14.8, 16.1, 19.2, 17.8, 16.9, 16.2, 15.7, 15.3, 14.9, 14.6, 14.4, 14.2, 14.1],
-        'tdah': [2.3, 2.4, 2.5, 2.6, 2.7, 2.8, 2.9, 3.0, 3.1, 3.2, 3.3, 3.4, 3.5, 3.6, 3.7],
-        'alcohol': [48.5, 49.2, 49.8, 50.4, 47.2, 48.5, 49.8, 50.3, 50.8, 51.2, 51.6, 52.0, 52.3, 52.6, 52.9],
-        'tabaco': [15.2, 14.8, 14.3, 13.9, 12.5, 13.1, 13.6, 13.2, 12.9, 12.6, 12.3, 12.1, 11.9, 11.7, 11.5],
-        'marihuana': [8.5, 9.2, 9.9, 10.6, 9.8, 10.5, 11.3, 12.1, 12.8, 13.4, 14.1, 14.7, 15.3, 15.9, 16.4],
-        'bullying': [29.3, 28.7, 28.2, 27.6, 22.4, 25.8, 27.3, 28.1, 28.6, 29.0, 29.3, 29.6, 29.8, 30.0, 30.2],
-        'ideacion_suicida': [6.2, 6.5, 6.8, 7.1, 8.9, 8.3, 7.8, 7.4, 7.1, 6.9, 6.7, 6.5, 6.4, 6.3, 6.2],
-        'consumo_problematico': [3.2, 3.5, 3.8, 4.1, 3.6, 4.2, 4.7, 5.2, 5.8, 6.3, 6.9, 7.4, 7.9, 8.4, 8.9]
-    }
-    
-    df_factores = pd.DataFrame(factores_data)
+    df_factores = datos['factores']
     
     # Separar histórico y proyección
     df_historico = df_factores[df_factores['año'] <= 2024].copy()
     df_proyeccion = df_factores[df_factores['año'] >= 2025].copy()
     
     # ===========================================================================
-    # TABS PRINCIPALES
+    # SECCIONES PRINCIPALES (solo se calcula la sección elegida)
     # ===========================================================================
     
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    seccion = selector_seccion([
         "📊 Panorama General",
         "🧠 Salud Mental",
         "💊 Consumo de SPA",
         "⚠️ Violencia y Riesgo Suicida",
         "📈 Proyecciones 2025-2030"
-    ])
+    ], key="seccion_factores")
     
-    with tab1:
+    if seccion == "📊 Panorama General":
         st.subheader("Panorama General de Factores de Riesgo")
         
         st.markdown("""
@@ -1184,42 +3112,44 @@ def pagina_factores_riesgo(datos):
         # Gráfico de evolución general
         st.markdown("#### 📈 Evolución de Problemas de Salud Mental (2016-2030)")
         
-        fig = go.Figure()
-        
-        # Datos históricos
-        fig.add_trace(go.Scatter(
-            x=df_historico['año'],
-            y=df_historico['sm_general'],
-            mode='lines+markers',
-            name='Datos Históricos',
-            line=dict(color='#2563eb', width=3),
-            marker=dict(size=10),
-            hovertemplate='<b>Año:</b> %{x}<br><b>Prevalencia:</b> %{y:.1f}%<extra></extra>'
-        ))
-        
-        # Proyección
-        fig.add_trace(go.Scatter(
-            x=df_proyeccion['año'],
-            y=df_proyeccion['sm_general'],
-            mode='lines+markers',
-            name='Proyección 2025-2030',
-            line=dict(color='#dc2626', width=3, dash='dash'),
-            marker=dict(size=10, symbol='diamond'),
-            hovertemplate='<b>Año:</b> %{x}<br><b>Proyección:</b> %{y:.1f}%<extra></extra>'
-        ))
-        
-        fig.add_vline(x=2024.5, line_dash="dot", line_color="gray", 
-                     annotation_text="Inicio Proyección", annotation_position="top")
-        
-        fig.update_layout(
-            xaxis_title="Año",
-            yaxis_title="Prevalencia (%)",
-            height=400,
-            hovermode='x unified',
-            template='plotly_white'
-        )
+        def figura():
+            fig = go.Figure()
+        
+            # Datos históricos
+            fig.add_trace(go.Scatter(
+                x=df_historico['año'],
+                y=df_historico['sm_general'],
+                mode='lines+markers',
+                name='Datos Históricos',
+                line=dict(color='#2563eb', width=3),
+                marker=dict(size=10),
+                hovertemplate='<b>Año:</b> %{x}<br><b>Prevalencia:</b> %{y:.1f}%<extra></extra>'
+            ))
+        
+            # Proyección
+            fig.add_trace(go.Scatter(
+                x=df_proyeccion['año'],
+                y=df_proyeccion['sm_general'],
+                mode='lines+markers',
+                name='Proyección 2025-2030',
+                line=dict(color='#dc2626', width=3, dash='dash'),
+                marker=dict(size=10, symbol='diamond'),
+                hovertemplate='<b>Año:</b> %{x}<br><b>Proyección:</b> %{y:.1f}%<extra></extra>'
+            ))
+        
+            fig.add_vline(x=2024.5, line_dash="dot", line_color="gray", 
+                         annotation_text="Inicio Proyección", annotation_position="top")
         
-        st.plotly_chart(fig, use_container_width=True)
+            fig.update_layout(
+                xaxis_title="Año",
+                yaxis_title="Prevalencia (%)",
+                height=400,
+                hovermode='x unified',
+                template='plotly_white'
+            )
+            return fig
+        
+        mostrar_figura('factores_salud_mental', datos.version('factores'), figura)
         
         # Contexto
         st.markdown("""
@@ -1250,52 +3180,54 @@ def pagina_factores_riesgo(datos):
             - Validación con expertos en salud pública
             """)
     
-    with tab2:
+    if seccion == "🧠 Salud Mental":
         st.subheader("Trastornos de Salud Mental")
         
         # Gráfico de trastornos específicos
-        fig2 = go.Figure()
+        def figura():
+            fig2 = go.Figure()
         
-        trastornos = {
-            'ansiedad': {'nombre': 'Ansiedad', 'color': '#f59e0b'},
-            'depresion': {'nombre': 'Depresión', 'color': '#8b5cf6'},
-            'tdah': {'nombre': 'TDAH', 'color': '#10b981'}
-        }
+            trastornos = {
+                'ansiedad': {'nombre': 'Ansiedad', 'color': '#f59e0b'},
+                'depresion': {'nombre': 'Depresión', 'color': '#8b5cf6'},
+                'tdah': {'nombre': 'TDAH', 'color': '#10b981'}
+            }
         
-        for trastorno, props in trastornos.items():
-            # Histórico
-            fig2.add_trace(go.Scatter(
-                x=df_historico['año'],
-                y=df_historico[trastorno],
-                mode='lines+markers',
-                name=f'{props["nombre"]} (Histórico)',
-                line=dict(color=props['color'], width=2.5),
-                marker=dict(size=8)
-            ))
+            for trastorno, props in trastornos.items():
+                # Histórico
+                fig2.add_trace(go.Scatter(
+                    x=df_historico['año'],
+                    y=df_historico[trastorno],
+                    mode='lines+markers',
+                    name=f'{props["nombre"]} (Histórico)',
+                    line=dict(color=props['color'], width=2.5),
+                    marker=dict(size=8)
+                ))
             
-            # Proyección
-            fig2.add_trace(go.Scatter(
-                x=df_proyeccion['año'],
-                y=df_proyeccion[trastorno],
-                mode='lines+markers',
-                name=f'{props["nombre"]} (Proyección)',
-                line=dict(color=props['color'], width=2.5, dash='dash'),
-                marker=dict(size=8, symbol='diamond'),
-                showlegend=False
-            ))
-        
-        fig2.add_vline(x=2024.5, line_dash="dot", line_color="gray")
+                # Proyección
+                fig2.add_trace(go.Scatter(
+                    x=df_proyeccion['año'],
+                    y=df_proyeccion[trastorno],
+                    mode='lines+markers',
+                    name=f'{props["nombre"]} (Proyección)',
+                    line=dict(color=props['color'], width=2.5, dash='dash'),
+                    marker=dict(size=8, symbol='diamond'),
+                    showlegend=False
+                ))
         
-        fig2.update_layout(
-            title="Prevalencia de Trastornos Específicos (2016-2030)",
-            xaxis_title="Año",
-            yaxis_title="Prevalencia (%)",
-            height=450,
-            hovermode='x unified',
-            template='plotly_white'
-        )
+            fig2.add_vline(x=2024.5, line_dash="dot", line_color="gray")
         
-        st.plotly_chart(fig2, use_container_width=True)
+            fig2.update_layout(
+                title="Prevalencia de Trastornos Específicos (2016-2030)",
+                xaxis_title="Año",
+                yaxis_title="Prevalencia (%)",
+                height=450,
+                hovermode='x unified',
+                template='plotly_white'
+            )
+            return fig2
+
+        mostrar_figura('factores_trastornos', datos.version('factores'), figura)
         
         # Estadísticas actuales
         col1, col2, col3 = st.columns(3)
@@ -1360,52 +3292,54 @@ def pagina_factores_riesgo(datos):
         - Trabajo coordinado familia-colegio-salud
         """)
     
-    with tab3:
+    if seccion == "💊 Consumo de SPA":
         st.subheader("Consumo de Sustancias Psicoactivas")
         
         # Gráfico de consumo de SPA
-        fig3 = go.Figure()
+        def figura():
+            fig3 = go.Figure()
         
-        sustancias = {
-            'alcohol': {'nombre': 'Alcohol', 'color': '#dc2626'},
-            'tabaco': {'nombre': 'Tabaco', 'color': '#78716c'},
-            'marihuana': {'nombre': 'Marihuana', 'color': '#16a34a'}
-        }
+            sustancias = {
+                'alcohol': {'nombre': 'Alcohol', 'color': '#dc2626'},
+                'tabaco': {'nombre': 'Tabaco', 'color': '#78716c'},
+                'marihuana': {'nombre': 'Marihuana', 'color': '#16a34a'}
+            }
         
-        for sustancia, props in sustancias.items():
-            # Histórico
-            fig3.add_trace(go.Scatter(
-                x=df_historico['año'],
-                y=df_historico[sustancia],
-                mode='lines+markers',
-                name=f'{props["nombre"]} (Histórico)',
-                line=dict(color=props['color'], width=2.5),
-                marker=dict(size=9)
-            ))
+            for sustancia, props in sustancias.items():
+                # Histórico
+                fig3.add_trace(go.Scatter(
+                    x=df_historico['año'],
+                    y=df_historico[sustancia],
+                    mode='lines+markers',
+                    name=f'{props["nombre"]} (Histórico)',
+                    line=dict(color=props['color'], width=2.5),
+                    marker=dict(size=9)
+                ))
             
-            # Proyección
-            fig3.add_trace(go.Scatter(
-                x=df_proyeccion['año'],
-                y=df_proyeccion[sustancia],
-                mode='lines+markers',
-                name=f'{props["nombre"]} (Proyección)',
-                line=dict(color=props['color'], width=2.5, dash='dash'),
-                marker=dict(size=9, symbol='diamond'),
-                showlegend=False
-            ))
-        
-        fig3.add_vline(x=2024.5, line_dash="dot", line_color="gray")
+                # Proyección
+                fig3.add_trace(go.Scatter(
+                    x=df_proyeccion['año'],
+                    y=df_proyeccion[sustancia],
+                    mode='lines+markers',
+                    name=f'{props["nombre"]} (Proyección)',
+                    line=dict(color=props['color'], width=2.5, dash='dash'),
+                    marker=dict(size=9, symbol='diamond'),
+                    showlegend=False
+                ))
         
-        fig3.update_layout(
-            title="Consumo de Sustancias en Adolescentes 12-17 años (2016-2030)",
-            xaxis_title="Año",
-            yaxis_title="Prevalencia de Consumo (%)",
-            height=450,
-            hovermode='x unified',
-            template='plotly_white'
-        )
+            fig3.add_vline(x=2024.5, line_dash="dot", line_color="gray")
         
-        st.plotly_chart(fig3, use_container_width=True)
+            fig3.update_layout(
+                title="Consumo de Sustancias en Adolescentes 12-17 años (2016-2030)",
+                xaxis_title="Año",
+                yaxis_title="Prevalencia de Consumo (%)",
+                height=450,
+                hovermode='x unified',
+                template='plotly_white'
+            )
+            return fig3
+
+        mostrar_figura('factores_spa', datos.version('factores'), figura)
         
         # Estadísticas y alertas
         col1, col2, col3 = st.columns(3)
@@ -1430,39 +3364,41 @@ def pagina_factores_riesgo(datos):
         # Consumo problemático
         st.markdown("#### 🚨 Consumo Problemático de SPA")
         
-        fig_problematico = go.Figure()
-        
-        fig_problematico.add_trace(go.Scatter(
-            x=df_historico['año'],
-            y=df_historico['consumo_problematico'],
-            mode='lines+markers',
-            name='Datos Históricos',
-            line=dict(color='#dc2626', width=3),
-            marker=dict(size=10),
-            fill='tozeroy',
-            fillcolor='rgba(220, 38, 38, 0.1)'
-        ))
-        
-        fig_problematico.add_trace(go.Scatter(
-            x=df_proyeccion['año'],
-            y=df_proyeccion['consumo_problematico'],
-            mode='lines+markers',
-            name='Proyección',
-            line=dict(color='#991b1b', width=3, dash='dash'),
-            marker=dict(size=10, symbol='diamond')
-        ))
-        
-        fig_problematico.add_vline(x=2024.5, line_dash="dot", line_color="gray")
-        
-        fig_problematico.update_layout(
-            title="Tasa de Consumo Problemático (por 100,000 adolescentes)",
-            xaxis_title="Año",
-            yaxis_title="Tasa por 100,000",
-            height=350,
-            template='plotly_white'
-        )
+        def figura():
+            fig_problematico = go.Figure()
         
-        st.plotly_chart(fig_problematico, use_container_width=True)
+            fig_problematico.add_trace(go.Scatter(
+                x=df_historico['año'],
+                y=df_historico['consumo_problematico'],
+                mode='lines+markers',
+                name='Datos Históricos',
+                line=dict(color='#dc2626', width=3),
+                marker=dict(size=10),
+                fill='tozeroy',
+                fillcolor='rgba(220, 38, 38, 0.1)'
+            ))
+        
+            fig_problematico.add_trace(go.Scatter(
+                x=df_proyeccion['año'],
+                y=df_proyeccion['consumo_problematico'],
+                mode='lines+markers',
+                name='Proyección',
+                line=dict(color='#991b1b', width=3, dash='dash'),
+                marker=dict(size=10, symbol='diamond')
+            ))
+        
+            fig_problematico.add_vline(x=2024.5, line_dash="dot", line_color="gray")
+        
+            fig_problematico.update_layout(
+                title="Tasa de Consumo Problemático (por 100,000 adolescentes)",
+                xaxis_title="Año",
+                yaxis_title="Tasa por 100,000",
+                height=350,
+                template='plotly_white'
+            )
+            return fig_problematico
+        
+        mostrar_figura('factores_problematico', datos.version('factores'), figura)
         
         valor_2024 = df_historico[df_historico['año'] == 2024]['consumo_problematico'].values[0]
         valor_2030 = df_proyeccion[df_proyeccion['año'] == 2030]['consumo_problematico'].values[0]
@@ -1500,69 +3436,71 @@ def pagina_factores_riesgo(datos):
             - Seguimiento y acompañamiento
             """)
     
-    with tab4:
+    if seccion == "⚠️ Violencia y Riesgo Suicida":
         st.subheader("Violencia Escolar y Riesgo Suicida")
         
         # Gráfico dual
-        fig4 = go.Figure()
-        
-        # Bullying
-        fig4.add_trace(go.Scatter(
-            x=df_historico['año'],
-            y=df_historico['bullying'],
-            mode='lines+markers',
-            name='Bullying (Histórico)',
-            line=dict(color='#ef4444', width=2.5),
-            marker=dict(size=9),
-            yaxis='y1'
-        ))
-        
-        fig4.add_trace(go.Scatter(
-            x=df_proyeccion['año'],
-            y=df_proyeccion['bullying'],
-            mode='lines+markers',
-            name='Bullying (Proyección)',
-            line=dict(color='#ef4444', width=2.5, dash='dash'),
-            marker=dict(size=9, symbol='diamond'),
-            yaxis='y1',
-            showlegend=False
-        ))
-        
-        # Ideación Suicida
-        fig4.add_trace(go.Scatter(
-            x=df_historico['año'],
-            y=df_historico['ideacion_suicida'],
-            mode='lines+markers',
-            name='Ideación Suicida (Histórico)',
-            line=dict(color='#7c3aed', width=2.5),
-            marker=dict(size=9),
-            yaxis='y2'
-        ))
-        
-        fig4.add_trace(go.Scatter(
-            x=df_proyeccion['año'],
-            y=df_proyeccion['ideacion_suicida'],
-            mode='lines+markers',
-            name='Ideación Suicida (Proyección)',
-            line=dict(color='#7c3aed', width=2.5, dash='dash'),
-            marker=dict(size=9, symbol='diamond'),
-            yaxis='y2',
-            showlegend=False
-        ))
-        
-        fig4.add_vline(x=2024.5, line_dash="dot", line_color="gray")
-        
-        fig4.update_layout(
-            title="Violencia Escolar e Ideación Suicida (2016-2030)",
-            xaxis_title="Año",
-            yaxis=dict(title="Bullying (%)", side="left"),
-            yaxis2=dict(title="Ideación Suicida (%)", side="right", overlaying="y"),
-            height=450,
-            hovermode='x unified',
-            template='plotly_white'
-        )
+        def figura():
+            fig4 = go.Figure()
+        
+            # Bullying
+            fig4.add_trace(go.Scatter(
+                x=df_historico['año'],
+                y=df_historico['bullying'],
+                mode='lines+markers',
+                name='Bullying (Histórico)',
+                line=dict(color='#ef4444', width=2.5),
+                marker=dict(size=9),
+                yaxis='y1'
+            ))
+        
+            fig4.add_trace(go.Scatter(
+                x=df_proyeccion['año'],
+                y=df_proyeccion['bullying'],
+                mode='lines+markers',
+                name='Bullying (Proyección)',
+                line=dict(color='#ef4444', width=2.5, dash='dash'),
+                marker=dict(size=9, symbol='diamond'),
+                yaxis='y1',
+                showlegend=False
+            ))
+        
+            # Ideación Suicida
+            fig4.add_trace(go.Scatter(
+                x=df_historico['año'],
+                y=df_historico['ideacion_suicida'],
+                mode='lines+markers',
+                name='Ideación Suicida (Histórico)',
+                line=dict(color='#7c3aed', width=2.5),
+                marker=dict(size=9),
+                yaxis='y2'
+            ))
+        
+            fig4.add_trace(go.Scatter(
+                x=df_proyeccion['año'],
+                y=df_proyeccion['ideacion_suicida'],
+                mode='lines+markers',
+                name='Ideación Suicida (Proyección)',
+                line=dict(color='#7c3aed', width=2.5, dash='dash'),
+                marker=dict(size=9, symbol='diamond'),
+                yaxis='y2',
+                showlegend=False
+            ))
         
-        st.plotly_chart(fig4, use_container_width=True)
+            fig4.add_vline(x=2024.5, line_dash="dot", line_color="gray")
+        
+            fig4.update_layout(
+                title="Violencia Escolar e Ideación Suicida (2016-2030)",
+                xaxis_title="Año",
+                yaxis=dict(title="Bullying (%)", side="left"),
+                yaxis2=dict(title="Ideación Suicida (%)", side="right", overlaying="y"),
+                height=450,
+                hovermode='x unified',
+                template='plotly_white'
+            )
+            return fig4
+
+        mostrar_figura('factores_violencia', datos.version('factores'), figura)
         
         # Estadísticas críticas
         col1, col2 = st.columns(2)
@@ -1652,7 +3590,7 @@ def pagina_factores_riesgo(datos):
         - Búsqueda de métodos letales
         """)
     
-    with tab5:
+    if seccion == "📈 Proyecciones 2025-2030":
         st.subheader("Proyecciones y Escenarios Futuros 2025-2030")
         
         st.markdown("""
@@ -1674,7 +3612,7 @@ def pagina_factores_riesgo(datos):
             'Bullying (%)', 'Ideación Suicida (%)', 'Consumo Problemático (tasa)'
         ]
         
-        st.dataframe(df_tabla_display, use_container_width=True, hide_index=True)
+        st.dataframe(df_tabla_display, width='stretch', hide_index=True)
         
         # Análisis de cambios
         st.markdown("#### 📈 Análisis de Tendencias 2024-2030")
@@ -1708,25 +3646,26 @@ def pagina_factores_riesgo(datos):
             cambios.append({
                 'Factor': factores_nombres[factor],
                 'Nivel': nivel,
-                '2024': f"{valor_2024:.1f}",
-                '2030': f"{valor_2030:.1f}",
-                'Cambio (%)': f"{cambio_pct:+.1f}%"
+                '2024': valor_2024,
+                '2030': valor_2030,
+                'Cambio (%)': cambio_pct
             })
         
         df_cambios = pd.DataFrame(cambios)
         
-        # Colorear según nivel
-        def color_nivel(val):
-            if '🔴' in val:
-                return 'background-color: #fee2e2'
-            elif '🟡' in val:
-                return 'background-color: #fef3c7'
-            else:
-                return 'background-color: #d1fae5'
-        
-        st.dataframe(
-            df_cambios.style.applymap(color_nivel, subset=['Nivel']),
-            use_container_width=True,
+        # Colorear según nivel (sobre la columna completa)
+        def color_nivel(nivel):
+            return estilo_por_condiciones(nivel, [
+                (nivel.str.contains('🔴', regex=False), 'background-color: #fee2e2'),
+                (nivel.str.contains('🟡', regex=False), 'background-color: #fef3c7')
+            ], defecto='background-color: #d1fae5')
+        
+        tabla_paginada(
+            df_cambios,
+            key="pagina_cambios",
+            estilos={'Nivel': color_nivel},
+            formatos={'2024': 'decimal1', '2030': 'decimal1', 'Cambio (%)': 'variacion'},
+            width='stretch',
             hide_index=True
         )
         
@@ -1787,30 +3726,30 @@ def pagina_analisis_genero(datos):
     st.title("⚧️ Análisis de Género en Salud Mental")
     st.markdown("### Brechas y diferencias en atención (6-17 años)")
     
-    df_morbilidad = datos['morbilidad']
+    df_morbilidad = datos.vista_morbilidad([COL_ANO, COL_GENERO])
+    
+    if df_morbilidad is None:
+        aviso_modo_resumen("El análisis de género")
+        return
     
     # Verificar columna de género
-    if 'genero' in df_morbilidad.columns:
-        col_genero = 'genero'
-    elif 'sexo_gen' in df_morbilidad.columns:
-        col_genero = 'sexo_gen'
-    else:
+    if COL_GENERO not in df_morbilidad.columns:
         st.error("❌ No se encontró información de género en los datos")
         return
     
-    # Tabs principales
-    tab1, tab2, tab3, tab4 = st.tabs([
+    # Secciones principales (solo se calcula la sección elegida)
+    seccion = selector_seccion([
         "📊 Panorama General",
         "🏙️ Por Localidad",
         "🧠 Por Trastorno",
         "📈 Evolución Temporal"
-    ])
+    ], key="seccion_genero")
     
-    with tab1:
+    if seccion == "📊 Panorama General":
         st.subheader("Panorama General de Género")
         
         # Distribución total por género
-        dist_genero = df_morbilidad.groupby(col_genero)['sum_atenciones'].sum().sort_values(ascending=False)
+        dist_genero = datos.agregar([COL_GENERO]).sort_values(ascending=False)
         total_atenciones = dist_genero.sum()
         
         # Métricas principales
@@ -1847,48 +3786,53 @@ def pagina_analisis_genero(datos):
         
         with col1:
             # Pie chart
-            fig = px.pie(
-                values=dist_genero.values,
-                names=dist_genero.index,
-                title="Distribución de Atenciones por Género",
-                hole=0.4,
-                color=dist_genero.index,
-                color_discrete_map={
-                    'Masculino': '#3b82f6',
-                    'Femenino': '#ec4899',
-                    'Hombre': '#3b82f6',
-                    'Mujer': '#ec4899'
-                }
-            )
+            def figura():
+                fig = px.pie(
+                    values=dist_genero.values,
+                    names=dist_genero.index,
+                    title="Distribución de Atenciones por Género",
+                    hole=0.4,
+                    color=dist_genero.index,
+                    color_discrete_map={
+                        'Masculino': '#3b82f6',
+                        'Femenino': '#ec4899',
+                        'Hombre': '#3b82f6',
+                        'Mujer': '#ec4899'
+                    }
+                )
             
-            fig.update_traces(textposition='inside', textinfo='percent+label')
-            fig.update_layout(height=350)
-            st.plotly_chart(fig, use_container_width=True)
+                fig.update_traces(textposition='inside', textinfo='percent+label')
+                fig.update_layout(height=350)
+                return fig
+
+            mostrar_figura('genero_distribucion', datos.version_morbilidad(), figura)
         
         with col2:
             # Bar chart con diferencia
-            fig = go.Figure()
-            
-            colors = ['#3b82f6' if 'Masculino' in str(g) or 'Hombre' in str(g) else '#ec4899' 
-                     for g in dist_genero.index]
+            def figura():
+                fig = go.Figure()
             
-            fig.add_trace(go.Bar(
-                x=dist_genero.index,
-                y=dist_genero.values,
-                marker_color=colors,
-                text=[f"{int(v):,}" for v in dist_genero.values],
-                textposition='outside'
-            ))
+                colors = ['#3b82f6' if 'Masculino' in str(g) or 'Hombre' in str(g) else '#ec4899' 
+                         for g in dist_genero.index]
             
-            fig.update_layout(
-                title="Comparación de Atenciones",
-                xaxis_title="Género",
-                yaxis_title="Total de Atenciones",
-                height=350,
-                showlegend=False
-            )
+                fig.add_trace(go.Bar(
+                    x=dist_genero.index,
+                    y=dist_genero.values,
+                    marker_color=colors,
+                    text=[f"{int(v):,}" for v in dist_genero.values],
+                    textposition='outside'
+                ))
             
-            st.plotly_chart(fig, use_container_width=True)
+                fig.update_layout(
+                    title="Comparación de Atenciones",
+                    xaxis_title="Género",
+                    yaxis_title="Total de Atenciones",
+                    height=350,
+                    showlegend=False
+                )
+                return fig
+
+            mostrar_figura('genero_barras', datos.version_morbilidad(), figura)
         
         # Análisis de la brecha
         st.markdown("#### 📊 Análisis de la Brecha de Género")
@@ -1938,172 +3882,154 @@ def pagina_analisis_genero(datos):
             st.markdown("#### 📚 Distribución por Nivel Educativo y Género")
             
             niveles = ['Primaria (6-10)', 'Secundaria (11-14)', 'Media (15-17)']
-            df_niveles = df_morbilidad[df_morbilidad['nivel_educativo'].isin(niveles)]
+            pivot = datos.agregar([COL_NIVEL, COL_GENERO], filtros={COL_NIVEL: niveles}).reset_index()
             
-            if len(df_niveles) > 0:
-                pivot = df_niveles.groupby(['nivel_educativo', col_genero])['sum_atenciones'].sum().reset_index()
+            if len(pivot) > 0:
                 
+                def figura():
+                    fig = px.bar(
+                        pivot,
+                        x='nivel_educativo',
+                        y='sum_atenciones',
+                        color=COL_GENERO,
+                        barmode='group',
+                        title="Atenciones por Nivel Educativo y Género",
+                        labels={'nivel_educativo': 'Nivel Educativo', 'sum_atenciones': 'Atenciones'},
+                        color_discrete_map={
+                            'Masculino': '#3b82f6',
+                            'Femenino': '#ec4899',
+                            'Hombre': '#3b82f6',
+                            'Mujer': '#ec4899'
+                        }
+                    )
+                
+                    fig.update_layout(height=400)
+                    return fig
+
+                mostrar_figura('genero_nivel', datos.version_morbilidad(), figura)
+    
+    if seccion == "🏙️ Por Localidad":
+        st.subheader("Análisis de Género por Localidad")
+        
+        if 'prestador_localidad_nombre' not in df_morbilidad.columns:
+            aviso_modo_resumen("La comparación por localidad y género")
+        else:
+            # Top 10 localidades
+            top_localidades = datos.rankings()['general'].index[:10]
+        
+            # Gráfico apilado
+            pivot_loc = datos.agregar([COL_LOCALIDAD, COL_GENERO], filtros={COL_LOCALIDAD: top_localidades}).reset_index()
+        
+            def figura():
                 fig = px.bar(
-                    pivot,
-                    x='nivel_educativo',
+                    pivot_loc,
+                    x='prestador_localidad_nombre',
                     y='sum_atenciones',
-                    color=col_genero,
-                    barmode='group',
-                    title="Atenciones por Nivel Educativo y Género",
-                    labels={'nivel_educativo': 'Nivel Educativo', 'sum_atenciones': 'Atenciones'},
+                    color=COL_GENERO,
+                    title="Top 10 Localidades - Distribución por Género",
+                    labels={'prestador_localidad_nombre': 'Localidad', 'sum_atenciones': 'Atenciones'},
                     color_discrete_map={
                         'Masculino': '#3b82f6',
                         'Femenino': '#ec4899',
                         'Hombre': '#3b82f6',
                         'Mujer': '#ec4899'
-                    }
+                    },
+                    barmode='stack'
                 )
-                
-                fig.update_layout(height=400)
-                st.plotly_chart(fig, use_container_width=True)
-    
-    with tab2:
-        st.subheader("Análisis de Género por Localidad")
-        
-        # Top 10 localidades
-        top_localidades = df_morbilidad.groupby('prestador_localidad_nombre')['sum_atenciones'].sum().nlargest(10).index
-        df_top_loc = df_morbilidad[df_morbilidad['prestador_localidad_nombre'].isin(top_localidades)]
-        
-        # Gráfico apilado
-        pivot_loc = df_top_loc.groupby(['prestador_localidad_nombre', col_genero])['sum_atenciones'].sum().reset_index()
-        
-        fig = px.bar(
-            pivot_loc,
-            x='prestador_localidad_nombre',
-            y='sum_atenciones',
-            color=col_genero,
-            title="Top 10 Localidades - Distribución por Género",
-            labels={'prestador_localidad_nombre': 'Localidad', 'sum_atenciones': 'Atenciones'},
-            color_discrete_map={
-                'Masculino': '#3b82f6',
-                'Femenino': '#ec4899',
-                'Hombre': '#3b82f6',
-                'Mujer': '#ec4899'
-            },
-            barmode='stack'
-        )
         
-        fig.update_layout(
-            height=500,
-            xaxis_tickangle=-45,
-            legend=dict(orientation="h", yanchor="bottom", y=1.02)
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
-        
-        # Tabla con brecha por localidad
-        st.markdown("#### 📊 Brecha de Género por Localidad")
-        
-        # Calcular brecha para cada localidad
-        brechas_localidad = []
-        
-        for localidad in top_localidades:
-            df_loc = df_morbilidad[df_morbilidad['prestador_localidad_nombre'] == localidad]
-            dist_gen = df_loc.groupby(col_genero)['sum_atenciones'].sum().sort_values(ascending=False)
-            
-            if len(dist_gen) >= 2:
-                ratio = dist_gen.iloc[0] / dist_gen.iloc[1]
-                gen_mayor = dist_gen.index[0]
-                
-                brechas_localidad.append({
-                    'Localidad': localidad,
-                    'Género Predominante': gen_mayor,
-                    'Brecha': ratio,
-                    'Total Atenciones': int(dist_gen.sum())
-                })
-        
-        df_brechas = pd.DataFrame(brechas_localidad).sort_values('Brecha', ascending=False)
-        df_brechas['Brecha'] = df_brechas['Brecha'].apply(lambda x: f"{x:.2f}x")
-        df_brechas['Total Atenciones'] = df_brechas['Total Atenciones'].apply(lambda x: f"{x:,}")
-        
-        # Colorear según brecha
-        def color_brecha(val):
-            try:
-                ratio = float(val.replace('x', ''))
-                if ratio > 2.0:
-                    return 'background-color: #fee2e2'
-                elif ratio > 1.5:
-                    return 'background-color: #fef3c7'
-                else:
-                    return 'background-color: #d1fae5'
-            except:
-                return ''
+                fig.update_layout(
+                    height=500,
+                    xaxis_tickangle=-45,
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02)
+                )
+                return fig
+
+            mostrar_figura('genero_localidad', datos.version_morbilidad(), figura)
         
-        st.dataframe(
-            df_brechas.style.applymap(color_brecha, subset=['Brecha']),
-            use_container_width=True,
-            height=400
-        )
+            # Tabla con brecha por localidad
+            st.markdown("#### 📊 Brecha de Género por Localidad")
         
-        # Localidades con mayor equidad
-        st.markdown("#### ✅ Localidades con Mayor Equidad de Género")
+            # Brecha de todas las localidades en una sola pasada
+            df_brechas = brechas_genero(datos.agregar([COL_LOCALIDAD, COL_GENERO])).reset_index().rename(columns={
+                COL_LOCALIDAD: 'Localidad',
+                'genero_predominante': 'Género Predominante',
+                'brecha': 'Brecha',
+                'total': 'Total Atenciones'
+            })
+            df_brechas = df_brechas[['Localidad', 'Género Predominante', 'Brecha', 'Total Atenciones']].sort_values('Brecha', ascending=False)
+            localidades_equitativas = df_brechas.nsmallest(3, 'Brecha')
+        
+            # Colorear según brecha (sobre la columna completa)
+            def color_brecha(brecha):
+                return estilo_por_condiciones(brecha, [
+                    (brecha > 2.0, 'background-color: #fee2e2'),
+                    (brecha > 1.5, 'background-color: #fef3c7'),
+                    (brecha.notna(), 'background-color: #d1fae5')
+                ])
+        
+            tabla_paginada(
+                df_brechas,
+                key="pagina_brechas",
+                estilos={'Brecha': color_brecha},
+                formatos={'Brecha': 'razon', 'Total Atenciones': 'entero'},
+                width='stretch',
+                height=400
+            )
         
-        localidades_equitativas = df_brechas.head(3)
+            # Localidades con mayor equidad
+            st.markdown("#### ✅ Localidades con Mayor Equidad de Género")
         
-        for _, row in localidades_equitativas.iterrows():
-            st.success(f"**{row['Localidad']}** - Brecha: {row['Brecha']} - {row['Total Atenciones']} atenciones")
+            for _, row in localidades_equitativas.iterrows():
+                st.success(f"**{row['Localidad']}** - Brecha: {row['Brecha']:.2f}x - {row['Total Atenciones']:,} atenciones")
     
-    with tab3:
+    if seccion == "🧠 Por Trastorno":
         st.subheader("Diferencias por Tipo de Trastorno")
         
-        if 'categoria_trastorno' in df_morbilidad.columns:
+        if COL_TRASTORNO in df_morbilidad.columns:
             # Top 8 trastornos
-            top_trastornos = df_morbilidad.groupby('categoria_trastorno')['sum_atenciones'].sum().nlargest(8).index
-            df_top_trast = df_morbilidad[df_morbilidad['categoria_trastorno'].isin(top_trastornos)]
+            top_trastornos = datos.agregar([COL_TRASTORNO]).nlargest(8).index
             
             # Gráfico de barras agrupadas
-            pivot_trast = df_top_trast.groupby(['categoria_trastorno', col_genero])['sum_atenciones'].sum().reset_index()
-            
-            fig = px.bar(
-                pivot_trast,
-                x='categoria_trastorno',
-                y='sum_atenciones',
-                color=col_genero,
-                barmode='group',
-                title="Top 8 Trastornos - Comparación por Género",
-                labels={'categoria_trastorno': 'Trastorno', 'sum_atenciones': 'Atenciones'},
-                color_discrete_map={
-                    'Masculino': '#3b82f6',
-                    'Femenino': '#ec4899',
-                    'Hombre': '#3b82f6',
-                    'Mujer': '#ec4899'
-                }
-            )
+            pivot_trast = datos.agregar([COL_TRASTORNO, COL_GENERO], filtros={COL_TRASTORNO: top_trastornos}).reset_index()
             
-            fig.update_layout(
-                height=500,
-                xaxis_tickangle=-45,
-                legend=dict(orientation="h", yanchor="bottom", y=1.02)
-            )
+            def figura():
+                fig = px.bar(
+                    pivot_trast,
+                    x=COL_TRASTORNO,
+                    y='sum_atenciones',
+                    color=COL_GENERO,
+                    barmode='group',
+                    title="Top 8 Trastornos - Comparación por Género",
+                    labels={COL_TRASTORNO: 'Trastorno', 'sum_atenciones': 'Atenciones'},
+                    color_discrete_map={
+                        'Masculino': '#3b82f6',
+                        'Femenino': '#ec4899',
+                        'Hombre': '#3b82f6',
+                        'Mujer': '#ec4899'
+                    }
+                )
             
-            st.plotly_chart(fig, use_container_width=True)
+                fig.update_layout(
+                    height=500,
+                    xaxis_tickangle=-45,
+                    legend=dict(orientation="h", yanchor="bottom", y=1.02)
+                )
+                return fig
+
+            mostrar_figura('genero_trastorno', datos.version_morbilidad(), figura)
             
             # Análisis de trastornos con mayor brecha
             st.markdown("#### 🔍 Trastornos con Mayor Diferencia de Género")
             
-            brechas_trastorno = []
-            
-            for trastorno in top_trastornos:
-                df_trast = df_morbilidad[df_morbilidad['categoria_trastorno'] == trastorno]
-                dist_gen = df_trast.groupby(col_genero)['sum_atenciones'].sum().sort_values(ascending=False)
-                
-                if len(dist_gen) >= 2:
-                    ratio = dist_gen.iloc[0] / dist_gen.iloc[1]
-                    gen_mayor = dist_gen.index[0]
-                    
-                    brechas_trastorno.append({
-                        'Trastorno': trastorno,
-                        'Género Predominante': gen_mayor,
-                        'Brecha': ratio,
-                        'Total': int(dist_gen.sum())
-                    })
+            brechas_trastorno = brechas_genero(datos.agregar([COL_TRASTORNO, COL_GENERO]))
+            brechas_trastorno = brechas_trastorno[brechas_trastorno.index.isin(top_trastornos)]
             
-            df_brech_trast = pd.DataFrame(brechas_trastorno).sort_values('Brecha', ascending=False)
+            df_brech_trast = brechas_trastorno.reset_index().rename(columns={
+                COL_TRASTORNO: 'Trastorno',
+                'genero_predominante': 'Género Predominante',
+                'brecha': 'Brecha',
+                'total': 'Total'
+            }).sort_values('Brecha', ascending=False)
             
             # Mostrar top 5 con mayor brecha
             st.markdown("**Top 5 con Mayor Brecha:**")
@@ -2147,70 +4073,77 @@ def pagina_analisis_genero(datos):
             - Patrones de socialización de género
             - Sesgos en detección y diagnóstico
             """)
+        elif datos.degradado:
+            aviso_modo_resumen("La comparación por trastorno y género")
     
-    with tab4:
+    if seccion == "📈 Evolución Temporal":
         st.subheader("Evolución Temporal de la Brecha de Género")
         
         # Evolución anual por género
-        evolucion_gen = df_morbilidad.groupby(['ano', col_genero])['sum_atenciones'].sum().reset_index()
+        evolucion_gen = datos.agregar([COL_ANO, COL_GENERO]).reset_index()
         
         # Gráfico de líneas
-        fig = px.line(
-            evolucion_gen,
-            x='ano',
-            y='sum_atenciones',
-            color=col_genero,
-            markers=True,
-            title="Evolución de Atenciones por Género (2019-2024)",
-            labels={'ano': 'Año', 'sum_atenciones': 'Atenciones'},
-            color_discrete_map={
-                'Masculino': '#3b82f6',
-                'Femenino': '#ec4899',
-                'Hombre': '#3b82f6',
-                'Mujer': '#ec4899'
-            }
-        )
+        def figura():
+            fig = px.line(
+                evolucion_gen,
+                x='ano',
+                y='sum_atenciones',
+                color=COL_GENERO,
+                markers=True,
+                title="Evolución de Atenciones por Género (2019-2024)",
+                labels={'ano': 'Año', 'sum_atenciones': 'Atenciones'},
+                color_discrete_map={
+                    'Masculino': '#3b82f6',
+                    'Femenino': '#ec4899',
+                    'Hombre': '#3b82f6',
+                    'Mujer': '#ec4899'
+                }
+            )
         
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
+            fig.update_layout(height=400)
+            return fig
+
+        mostrar_figura('genero_evolucion', datos.version_morbilidad(), figura)
         
         # Calcular brecha por año
         st.markdown("#### 📊 Evolución de la Brecha")
         
-        pivot_años = evolucion_gen.pivot(index='ano', columns=col_genero, values='sum_atenciones')
+        pivot_años = evolucion_gen.pivot(index='ano', columns=COL_GENERO, values='sum_atenciones')
         
         if len(pivot_años.columns) >= 2:
             pivot_años['ratio'] = pivot_años.iloc[:, 0] / pivot_años.iloc[:, 1]
             
-            fig2 = go.Figure()
-            
-            fig2.add_trace(go.Scatter(
-                x=pivot_años.index,
-                y=pivot_años['ratio'],
-                mode='lines+markers',
-                name='Brecha de Género',
-                line=dict(color='#8b5cf6', width=3),
-                marker=dict(size=12),
-                text=[f"{v:.2f}x" for v in pivot_años['ratio']],
-                textposition='top center'
-            ))
+            def figura():
+                fig2 = go.Figure()
             
-            fig2.add_hline(
-                y=1.0,
-                line_dash="dash",
-                line_color="gray",
-                annotation_text="Equilibrio (1.0x)",
-                annotation_position="right"
-            )
+                fig2.add_trace(go.Scatter(
+                    x=pivot_años.index,
+                    y=pivot_años['ratio'],
+                    mode='lines+markers',
+                    name='Brecha de Género',
+                    line=dict(color='#8b5cf6', width=3),
+                    marker=dict(size=12),
+                    text=[f"{v:.2f}x" for v in pivot_años['ratio']],
+                    textposition='top center'
+                ))
             
-            fig2.update_layout(
-                title=f"Ratio {pivot_años.columns[0]}/{pivot_años.columns[1]} por Año",
-                xaxis_title="Año",
-                yaxis_title="Ratio",
-                height=400
-            )
+                fig2.add_hline(
+                    y=1.0,
+                    line_dash="dash",
+                    line_color="gray",
+                    annotation_text="Equilibrio (1.0x)",
+                    annotation_position="right"
+                )
             
-            st.plotly_chart(fig2, use_container_width=True)
+                fig2.update_layout(
+                    title=f"Ratio {pivot_años.columns[0]}/{pivot_años.columns[1]} por Año",
+                    xaxis_title="Año",
+                    yaxis_title="Ratio",
+                    height=400
+                )
+                return fig2
+
+            mostrar_figura('genero_brecha_anual', datos.version_morbilidad(), figura)
             
             # Análisis de tendencia
             st.markdown("#### 🔍 Análisis de Tendencia de la Brecha")
@@ -2284,12 +4217,30 @@ def pagina_buscador_localidades(datos):
     st.title("🔍 Buscador de Localidades")
     st.markdown("### Consulta información detallada por localidad de Bogotá")
     
-    df_morbilidad = datos['morbilidad']
+    df_morbilidad = datos.vista_morbilidad([COL_LOCALIDAD])
+    
+    if df_morbilidad is None:
+        aviso_modo_resumen("El buscador de localidades")
+        return
+    
+    # Filas ordenadas por localidad con su índice y los totales de Bogotá (precalculados
+    # con cada versión de los datos; en modo resumen la tabla es pequeña y se indexa aquí)
+    if datos.degradado:
+        df_morbilidad, indice = indexar_cubo(df_morbilidad)
+    else:
+        indice = datos['indice_localidades']
+    
+    ficha_localidad(datos, df_morbilidad, indice)
+
+@st.fragment
+def ficha_localidad(datos, df_morbilidad, indice):
+    """Selector y ficha de la localidad; cambiar de localidad o de sección solo vuelve a ejecutar la ficha"""
+    
     df_clasificacion = datos['clasificacion']
-    df_integrado = datos['integrado']
+    ciudad = indice['ciudad']
     
     # Obtener lista de localidades únicas
-    localidades = sorted(df_morbilidad['prestador_localidad_nombre'].unique())
+    localidades = sorted(indice['rangos'])
     
     # Selector de localidad
     st.markdown("#### 📍 Selecciona una localidad")
@@ -2307,8 +4258,8 @@ def pagina_buscador_localidades(datos):
     with col2:
         st.metric("Total Localidades", len(localidades))
     
-    # Filtrar datos de la localidad seleccionada
-    df_loc = df_morbilidad[df_morbilidad['prestador_localidad_nombre'] == localidad_seleccionada]
+    # Filas de la localidad seleccionada
+    df_loc = filas_localidad(df_morbilidad, indice, localidad_seleccionada)
     
     if len(df_loc) == 0:
         st.warning(f"No se encontraron datos para {localidad_seleccionada}")
@@ -2324,11 +4275,12 @@ def pagina_buscador_localidades(datos):
     
     # Métricas principales
     total_atenciones = df_loc['sum_atenciones'].sum()
-    num_registros = len(df_loc)
+    num_registros = contar_registros(df_loc)
     
-    # Calcular ranking
-    ranking_localidades = df_morbilidad.groupby('prestador_localidad_nombre')['sum_atenciones'].sum().sort_values(ascending=False)
-    posicion = list(ranking_localidades.index).index(localidad_seleccionada) + 1
+    # Ranking materializado
+    rankings = datos.rankings()
+    posicion = int(rankings['general'].loc[localidad_seleccionada, 'rango'])
+    percentil = rankings['general'].loc[localidad_seleccionada, 'percentil']
     
     col1, col2, col3, col4 = st.columns(4)
     
@@ -2336,14 +4288,22 @@ def pagina_buscador_localidades(datos):
         st.metric("Total Atenciones", f"{int(total_atenciones):,}")
     
     with col2:
-        st.metric("Registros", f"{num_registros:,}")
+        if datos.degradado:
+            st.metric("Registros", "N/D", help="Las tablas resumen no incluyen el número de registros")
+        else:
+            st.metric("Registros", f"{num_registros:,}")
     
     with col3:
-        pct_total = (total_atenciones / df_morbilidad['sum_atenciones'].sum()) * 100
+        pct_total = (total_atenciones / ciudad['total']) * 100
         st.metric("% del Total", f"{pct_total:.2f}%")
     
     with col4:
-        st.metric("Ranking", f"#{posicion}", delta=f"de {len(localidades)}")
+        st.metric(
+            "Ranking",
+            f"#{posicion}",
+            delta=f"de {len(localidades)}",
+            help=f"Percentil {percentil:.0f}: tiene tantas o más atenciones que el {percentil:.0f}% de las localidades"
+        )
     
     # Nivel de riesgo (si existe clasificación)
     if len(df_clasificacion) > 0:
@@ -2362,46 +4322,52 @@ def pagina_buscador_localidades(datos):
     
     st.markdown("---")
     
+    if datos.degradado:
+        aviso_modo_resumen("El detalle por año, trastorno, género y nivel educativo")
+        return
+    
     # =========================================================================
-    # SECCIÓN 2: TABS CON ANÁLISIS DETALLADO
+    # SECCIÓN 2: ANÁLISIS DETALLADO (solo se calcula la sección elegida)
     # =========================================================================
     
-    tab1, tab2, tab3, tab4 = st.tabs([
+    # Atenciones por año (las usan la evolución temporal y las recomendaciones)
+    atenciones_año = df_loc.groupby('ano', observed=True)['sum_atenciones'].sum().sort_index()
+    
+    seccion = selector_seccion([
         "📈 Evolución Temporal",
         "🧠 Trastornos",
         "⚧️ Análisis de Género",
         "📚 Nivel Educativo"
-    ])
+    ], key="seccion_buscador")
     
-    with tab1:
+    if seccion == "📈 Evolución Temporal":
         st.subheader(f"Evolución Temporal - {localidad_seleccionada}")
         
-        # Atenciones por año
-        atenciones_año = df_loc.groupby('ano')['sum_atenciones'].sum().sort_index()
-        
         # Gráfico de línea
-        fig = go.Figure()
-        
-        fig.add_trace(go.Scatter(
-            x=atenciones_año.index,
-            y=atenciones_año.values,
-            mode='lines+markers',
-            name=localidad_seleccionada,
-            line=dict(color='#2563eb', width=3),
-            marker=dict(size=12),
-            fill='tozeroy',
-            fillcolor='rgba(37, 99, 235, 0.2)'
-        ))
-        
-        fig.update_layout(
-            title=f"Evolución de Atenciones - {localidad_seleccionada}",
-            xaxis_title="Año",
-            yaxis_title="Número de Atenciones",
-            height=400,
-            template='plotly_white'
-        )
+        def figura():
+            fig = go.Figure()
+        
+            fig.add_trace(go.Scatter(
+                x=atenciones_año.index,
+                y=atenciones_año.values,
+                mode='lines+markers',
+                name=localidad_seleccionada,
+                line=dict(color='#2563eb', width=3),
+                marker=dict(size=12),
+                fill='tozeroy',
+                fillcolor='rgba(37, 99, 235, 0.2)'
+            ))
         
-        st.plotly_chart(fig, use_container_width=True)
+            fig.update_layout(
+                title=f"Evolución de Atenciones - {localidad_seleccionada}",
+                xaxis_title="Año",
+                yaxis_title="Número de Atenciones",
+                height=400,
+                template='plotly_white'
+            )
+            return fig
+
+        mostrar_figura('buscador_evolucion', datos.version_morbilidad(), figura, [localidad_seleccionada])
         
         # Estadísticas de crecimiento
         col1, col2, col3 = st.columns(3)
@@ -2422,68 +4388,91 @@ def pagina_buscador_localidades(datos):
         # Comparación con promedio de Bogotá
         st.markdown("#### 📊 Comparación con Promedio de Bogotá")
         
-        atenciones_bogota = df_morbilidad.groupby('ano')['sum_atenciones'].sum()
-        num_localidades = df_morbilidad['prestador_localidad_nombre'].nunique()
+        atenciones_bogota = serie_pares(ciudad['por_ano'])
+        num_localidades = len(indice['rangos'])
         promedio_bogota = atenciones_bogota / num_localidades
         
         # Gráfico comparativo
-        fig2 = go.Figure()
-        
-        fig2.add_trace(go.Bar(
-            x=atenciones_año.index,
-            y=atenciones_año.values,
-            name=localidad_seleccionada,
-            marker_color='#2563eb'
-        ))
-        
-        fig2.add_trace(go.Scatter(
-            x=promedio_bogota.index,
-            y=promedio_bogota.values,
-            name='Promedio Bogotá',
-            line=dict(color='#f59e0b', width=2, dash='dash'),
-            mode='lines+markers'
-        ))
-        
-        fig2.update_layout(
-            title="Comparación con Promedio de Bogotá",
-            xaxis_title="Año",
-            yaxis_title="Atenciones",
-            height=350,
-            template='plotly_white'
-        )
+        def figura():
+            fig2 = go.Figure()
+        
+            fig2.add_trace(go.Bar(
+                x=atenciones_año.index,
+                y=atenciones_año.values,
+                name=localidad_seleccionada,
+                marker_color='#2563eb'
+            ))
+        
+            fig2.add_trace(go.Scatter(
+                x=promedio_bogota.index,
+                y=promedio_bogota.values,
+                name='Promedio Bogotá',
+                line=dict(color='#f59e0b', width=2, dash='dash'),
+                mode='lines+markers'
+            ))
+        
+            fig2.update_layout(
+                title="Comparación con Promedio de Bogotá",
+                xaxis_title="Año",
+                yaxis_title="Atenciones",
+                height=350,
+                template='plotly_white'
+            )
+            return fig2
+
+        mostrar_figura('buscador_comparacion', datos.version_morbilidad(), figura, [localidad_seleccionada])
+        
+        # Posición de la localidad entre todas las de Bogotá en cada año
+        st.markdown("#### 🏅 Posición por Año")
+        
+        ranking_ano = rankings['por_ano'].xs(localidad_seleccionada, level=COL_LOCALIDAD)
+        df_posicion = pd.DataFrame({
+            'Año': ranking_ano.index.astype(int),
+            'Atenciones': ranking_ano['atenciones'].to_numpy(),
+            'Posición': ranking_ano['rango'].to_numpy(),
+            'Percentil': ranking_ano['percentil'].round().astype('int64').to_numpy(),
+            '% de Bogotá': ranking_ano['participacion'].to_numpy()
+        })
         
-        st.plotly_chart(fig2, use_container_width=True)
+        st.dataframe(
+            df_posicion,
+            width='stretch',
+            hide_index=True,
+            column_config=formato_columnas({'Atenciones': 'entero', 'Percentil': 'entero', '% de Bogotá': 'porcentaje'})
+        )
     
-    with tab2:
+    if seccion == "🧠 Trastornos":
         st.subheader(f"Trastornos Prevalentes - {localidad_seleccionada}")
         
         # Top 10 trastornos en esta localidad
-        if 'categoria_trastorno' in df_loc.columns:
-            top_trastornos = df_loc.groupby('categoria_trastorno')['sum_atenciones'].sum().sort_values(ascending=False).head(10)
+        if COL_TRASTORNO in df_loc.columns:
+            top_trastornos = df_loc.groupby(COL_TRASTORNO, observed=True)['sum_atenciones'].sum().sort_values(ascending=False).head(10)
             
             # Gráfico horizontal
-            fig = go.Figure(go.Bar(
-                x=top_trastornos.values,
-                y=top_trastornos.index,
-                orientation='h',
-                marker=dict(
-                    color=top_trastornos.values,
-                    colorscale='Reds',
-                    showscale=False
-                ),
-                text=[f"{int(v):,}" for v in top_trastornos.values],
-                textposition='outside'
-            ))
-            
-            fig.update_layout(
-                title=f"Top 10 Trastornos - {localidad_seleccionada}",
-                xaxis_title="Atenciones",
-                yaxis_title="",
-                height=500,
-                template='plotly_white'
-            )
+            def figura():
+                fig = go.Figure(go.Bar(
+                    x=top_trastornos.values,
+                    y=top_trastornos.index,
+                    orientation='h',
+                    marker=dict(
+                        color=top_trastornos.values,
+                        colorscale='Reds',
+                        showscale=False
+                    ),
+                    text=[f"{int(v):,}" for v in top_trastornos.values],
+                    textposition='outside'
+                ))
             
-            st.plotly_chart(fig, use_container_width=True)
+                fig.update_layout(
+                    title=f"Top 10 Trastornos - {localidad_seleccionada}",
+                    xaxis_title="Atenciones",
+                    yaxis_title="",
+                    height=500,
+                    template='plotly_white'
+                )
+                return fig
+
+            mostrar_figura('buscador_trastornos', datos.version_morbilidad(), figura, [localidad_seleccionada])
             
             # Tabla detallada
             st.markdown("#### 📋 Detalle de Trastornos")
@@ -2494,9 +4483,17 @@ def pagina_buscador_localidades(datos):
             })
             
             df_trast_detalle['% de la Localidad'] = (df_trast_detalle['Atenciones'] / total_atenciones * 100).round(2)
-            df_trast_detalle['Atenciones'] = df_trast_detalle['Atenciones'].apply(lambda x: f"{int(x):,}")
             
-            st.dataframe(df_trast_detalle, use_container_width=True)
+            # Posición de la localidad entre todas las de Bogotá en cada trastorno
+            ranking_trastorno = rankings['por_trastorno'].xs(localidad_seleccionada, level=COL_LOCALIDAD).reindex(top_trastornos.index)
+            df_trast_detalle['Posición en Bogotá'] = ranking_trastorno['rango'].to_numpy()
+            df_trast_detalle['Percentil'] = ranking_trastorno['percentil'].round().astype('int64').to_numpy()
+            
+            st.dataframe(
+                df_trast_detalle,
+                width='stretch',
+                column_config=formato_columnas({'Atenciones': 'entero', 'Percentil': 'entero'})
+            )
             
             # Principal trastorno
             principal = top_trastornos.index[0]
@@ -2507,55 +4504,43 @@ def pagina_buscador_localidades(datos):
             Representa el {principal_pct:.1f}% de las atenciones en {localidad_seleccionada}
             """)
         else:
-            top_dx = df_loc.groupby('dxprincipal_agrupacion1_nombre')['sum_atenciones'].sum().sort_values(ascending=False).head(10)
-            
-            fig = px.bar(
-                x=top_dx.values,
-                y=top_dx.index,
-                orientation='h',
-                title=f"Top 10 Diagnósticos - {localidad_seleccionada}",
-                labels={'x': 'Atenciones', 'y': 'Diagnóstico'}
-            )
-            
-            fig.update_layout(height=500)
-            st.plotly_chart(fig, use_container_width=True)
+            st.warning("Datos de trastornos no disponibles")
     
-    with tab3:
+    if seccion == "⚧️ Análisis de Género":
         st.subheader(f"Análisis de Género - {localidad_seleccionada}")
         
         # Verificar columna de género
-        if 'genero' in df_loc.columns:
-            col_genero = 'genero'
-        elif 'sexo_gen' in df_loc.columns:
-            col_genero = 'sexo_gen'
-        else:
+        if COL_GENERO not in df_loc.columns:
             st.warning("Datos de género no disponibles")
             return
         
         # Distribución por género
-        dist_genero = df_loc.groupby(col_genero)['sum_atenciones'].sum().sort_values(ascending=False)
+        dist_genero = df_loc.groupby(COL_GENERO, observed=True)['sum_atenciones'].sum().sort_values(ascending=False)
         
         col1, col2 = st.columns(2)
         
         with col1:
             # Pie chart
-            fig = px.pie(
-                values=dist_genero.values,
-                names=dist_genero.index,
-                title=f"Distribución por Género - {localidad_seleccionada}",
-                hole=0.4,
-                color=dist_genero.index,
-                color_discrete_map={
-                    'Masculino': '#3b82f6',
-                    'Femenino': '#ec4899',
-                    'Hombre': '#3b82f6',
-                    'Mujer': '#ec4899'
-                }
-            )
+            def figura():
+                fig = px.pie(
+                    values=dist_genero.values,
+                    names=dist_genero.index,
+                    title=f"Distribución por Género - {localidad_seleccionada}",
+                    hole=0.4,
+                    color=dist_genero.index,
+                    color_discrete_map={
+                        'Masculino': '#3b82f6',
+                        'Femenino': '#ec4899',
+                        'Hombre': '#3b82f6',
+                        'Mujer': '#ec4899'
+                    }
+                )
             
-            fig.update_traces(textposition='inside', textinfo='percent+label')
-            fig.update_layout(height=350)
-            st.plotly_chart(fig, use_container_width=True)
+                fig.update_traces(textposition='inside', textinfo='percent+label')
+                fig.update_layout(height=350)
+                return fig
+
+            mostrar_figura('buscador_genero', datos.version_morbilidad(), figura, [localidad_seleccionada])
         
         with col2:
             # Métricas
@@ -2570,7 +4555,7 @@ def pagina_buscador_localidades(datos):
                 st.metric("Brecha de Género", f"{ratio:.2f}x")
                 
                 # Comparar con promedio de Bogotá
-                dist_gen_bogota = df_morbilidad.groupby(col_genero)['sum_atenciones'].sum().sort_values(ascending=False)
+                dist_gen_bogota = serie_pares(ciudad['por_genero']).sort_values(ascending=False)
                 if len(dist_gen_bogota) >= 2:
                     ratio_bogota = dist_gen_bogota.iloc[0] / dist_gen_bogota.iloc[1]
                     
@@ -2587,28 +4572,31 @@ def pagina_buscador_localidades(datos):
         # Evolución de género por año
         st.markdown("#### 📈 Evolución por Género")
         
-        evolucion_gen = df_loc.groupby(['ano', col_genero])['sum_atenciones'].sum().reset_index()
-        
-        fig2 = px.line(
-            evolucion_gen,
-            x='ano',
-            y='sum_atenciones',
-            color=col_genero,
-            markers=True,
-            title=f"Evolución por Género - {localidad_seleccionada}",
-            labels={'ano': 'Año', 'sum_atenciones': 'Atenciones'},
-            color_discrete_map={
-                'Masculino': '#3b82f6',
-                'Femenino': '#ec4899',
-                'Hombre': '#3b82f6',
-                'Mujer': '#ec4899'
-            }
-        )
+        evolucion_gen = df_loc.groupby(['ano', COL_GENERO], observed=True)['sum_atenciones'].sum().reset_index()
+        
+        def figura():
+            fig2 = px.line(
+                evolucion_gen,
+                x='ano',
+                y='sum_atenciones',
+                color=COL_GENERO,
+                markers=True,
+                title=f"Evolución por Género - {localidad_seleccionada}",
+                labels={'ano': 'Año', 'sum_atenciones': 'Atenciones'},
+                color_discrete_map={
+                    'Masculino': '#3b82f6',
+                    'Femenino': '#ec4899',
+                    'Hombre': '#3b82f6',
+                    'Mujer': '#ec4899'
+                }
+            )
         
-        fig2.update_layout(height=350)
-        st.plotly_chart(fig2, use_container_width=True)
+            fig2.update_layout(height=350)
+            return fig2
+
+        mostrar_figura('buscador_genero_evolucion', datos.version_morbilidad(), figura, [localidad_seleccionada])
     
-    with tab4:
+    if seccion == "📚 Nivel Educativo":
         st.subheader(f"Distribución por Nivel Educativo - {localidad_seleccionada}")
         
         if 'nivel_educativo' in df_loc.columns:
@@ -2617,27 +4605,29 @@ def pagina_buscador_localidades(datos):
             df_niveles = df_loc[df_loc['nivel_educativo'].isin(niveles)]
             
             if len(df_niveles) > 0:
-                dist_nivel = df_niveles.groupby('nivel_educativo')['sum_atenciones'].sum()
+                dist_nivel = df_niveles.groupby('nivel_educativo', observed=True)['sum_atenciones'].sum()
                 dist_nivel = dist_nivel.reindex(niveles, fill_value=0)
                 
                 # Gráfico de barras
-                fig = go.Figure(go.Bar(
-                    x=dist_nivel.index,
-                    y=dist_nivel.values,
-                    marker_color=['#3b82f6', '#f59e0b', '#10b981'],
-                    text=[f"{int(v):,}" for v in dist_nivel.values],
-                    textposition='outside'
-                ))
-                
-                fig.update_layout(
-                    title=f"Atenciones por Nivel Educativo - {localidad_seleccionada}",
-                    xaxis_title="Nivel Educativo",
-                    yaxis_title="Atenciones",
-                    height=400,
-                    template='plotly_white'
-                )
+                def figura():
+                    fig = go.Figure(go.Bar(
+                        x=dist_nivel.index,
+                        y=dist_nivel.values,
+                        marker_color=['#3b82f6', '#f59e0b', '#10b981'],
+                        text=[f"{int(v):,}" for v in dist_nivel.values],
+                        textposition='outside'
+                    ))
                 
-                st.plotly_chart(fig, use_container_width=True)
+                    fig.update_layout(
+                        title=f"Atenciones por Nivel Educativo - {localidad_seleccionada}",
+                        xaxis_title="Nivel Educativo",
+                        yaxis_title="Atenciones",
+                        height=400,
+                        template='plotly_white'
+                    )
+                    return fig
+
+                mostrar_figura('buscador_nivel', datos.version_morbilidad(), figura, [localidad_seleccionada])
                 
                 # Porcentajes
                 col1, col2, col3 = st.columns(3)
@@ -2659,9 +4649,7 @@ def pagina_buscador_localidades(datos):
                 # Comparación con Bogotá
                 st.markdown("#### 📊 Comparación con Bogotá")
                 
-                df_bogota_niveles = df_morbilidad[df_morbilidad['nivel_educativo'].isin(niveles)]
-                dist_bogota = df_bogota_niveles.groupby('nivel_educativo')['sum_atenciones'].sum()
-                dist_bogota = dist_bogota.reindex(niveles, fill_value=0)
+                dist_bogota = serie_pares(ciudad['por_nivel']).reindex(niveles, fill_value=0)
                 
                 # Normalizar a porcentajes
                 pct_localidad = (dist_nivel / dist_nivel.sum() * 100).round(1)
@@ -2675,23 +4663,26 @@ def pagina_buscador_localidades(datos):
                 
                 df_comparacion['Diferencia (pp)'] = df_comparacion[f'{localidad_seleccionada} (%)'] - df_comparacion['Bogotá (%)']
                 
-                st.dataframe(df_comparacion, use_container_width=True)
+                st.dataframe(df_comparacion, width='stretch')
             else:
                 st.info("No hay datos de nivel educativo disponibles para esta localidad")
         else:
             # Fallback a grupos de edad
             if 'edad_grupo_rias' in df_loc.columns:
-                dist_edad = df_loc.groupby('edad_grupo_rias')['sum_atenciones'].sum().sort_values(ascending=False)
+                dist_edad = df_loc.groupby('edad_grupo_rias', observed=True)['sum_atenciones'].sum().sort_values(ascending=False)
                 
-                fig = px.bar(
-                    x=dist_edad.index,
-                    y=dist_edad.values,
-                    title=f"Distribución por Grupo de Edad - {localidad_seleccionada}",
-                    labels={'x': 'Grupo de Edad', 'y': 'Atenciones'}
-                )
+                def figura():
+                    fig = px.bar(
+                        x=dist_edad.index,
+                        y=dist_edad.values,
+                        title=f"Distribución por Grupo de Edad - {localidad_seleccionada}",
+                        labels={'x': 'Grupo de Edad', 'y': 'Atenciones'}
+                    )
                 
-                fig.update_layout(height=400, xaxis_tickangle=-45)
-                st.plotly_chart(fig, use_container_width=True)
+                    fig.update_layout(height=400, xaxis_tickangle=-45)
+                    return fig
+
+                mostrar_figura('buscador_edad', datos.version_morbilidad(), figura, [localidad_seleccionada])
     
     # =========================================================================
     # SECCIÓN 3: RECOMENDACIONES
@@ -2713,9 +4704,8 @@ def pagina_buscador_localidades(datos):
         """)
     
     # Basado en brecha de género
-    if 'genero' in df_loc.columns or 'sexo_gen' in df_loc.columns:
-        col_gen = 'genero' if 'genero' in df_loc.columns else 'sexo_gen'
-        dist_gen = df_loc.groupby(col_gen)['sum_atenciones'].sum().sort_values(ascending=False)
+    if COL_GENERO in df_loc.columns:
+        dist_gen = df_loc.groupby(COL_GENERO, observed=True)['sum_atenciones'].sum().sort_values(ascending=False)
         
         if len(dist_gen) >= 2:
             ratio = dist_gen.iloc[0] / dist_gen.iloc[1]
@@ -2758,7 +4748,12 @@ def pagina_descargar_reportes(datos):
     st.title("📥 Descargar Reportes")
     st.markdown("### Genera y descarga reportes personalizados del Observatorio")
     
+    if datos.degradado:
+        descargar_tablas_resumen(datos)
+        return
+    
     df_morbilidad = datos['morbilidad']
+    df_cubo = datos.vista_morbilidad(DIMENSIONES_CUBO)
     df_integrado = datos['integrado']
     df_clasificacion = datos['clasificacion']
     df_clustering = datos['clustering']
@@ -2769,93 +4764,15 @@ def pagina_descargar_reportes(datos):
     - 📊 Reportes ejecutivos con indicadores clave
     - 📈 Datos completos para análisis personalizado
     - 🗺️ Información por localidad
-    - ⚧️ Análisis de género
-    - 🧠 Clasificación de riesgo
-    """)
-    
-    # =========================================================================
-    # SECCIÓN 1: REPORTES EJECUTIVOS
-    # =========================================================================
-    
-    st.markdown("---")
-    st.markdown("## 📊 Reportes Ejecutivos")
-    
-    col1, col2 = st.columns(2)
-    
-    with col1:
-        st.markdown("### 📋 Resumen General")
-        st.markdown("""
-        **Contenido:**
-        - Indicadores clave agregados
-        - KPIs principales
-        - Alertas activas
-        - Resumen por año
-        
-        **Formato:** CSV  
-        **Tamaño aproximado:** < 1 KB
-        """)
-        
-        if st.button("📥 Descargar Resumen General", key="btn_resumen"):
-            # Crear DataFrame de resumen
-            resumen_data = {
-                'Indicador': [
-                    'Total Atenciones (6-17 años)',
-                    'Población Estudiantil',
-                    'Tasa por 500 estudiantes',
-                    'Número de Localidades',
-                    'Período Analizado',
-                    'Orientadores Requeridos',
-                    'Brecha de Género'
-                ],
-                'Valor': [
-                    f"{int(df_morbilidad['sum_atenciones'].sum()):,}",
-                    f"{int(kpis.get('poblacion_estudiantil', 0)):,}",
-                    f"{kpis.get('tasa_por_500', 0):.2f}",
-                    f"{df_morbilidad['prestador_localidad_nombre'].nunique()}",
-                    f"{df_morbilidad['ano'].min()} - {df_morbilidad['ano'].max()}",
-                    f"{int(kpis.get('orientadores_necesarios', 0)):,}",
-                    f"{kpis.get('brecha_genero', 0):.2f}x"
-                ]
-            }
-            
-            df_resumen = pd.DataFrame(resumen_data)
-            
-            csv = df_resumen.to_csv(index=False, encoding='utf-8-sig')
-            st.download_button(
-                label="⬇️ Descargar CSV",
-                data=csv,
-                file_name=f"resumen_general_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
-            )
-    
-    with col2:
-        st.markdown("### 🚨 Reporte de Alertas")
-        st.markdown("""
-        **Contenido:**
-        - Alertas críticas activas
-        - Alertas de advertencia
-        - Umbrales alcanzados
-        - Recomendaciones
-        
-        **Formato:** CSV  
-        **Tamaño aproximado:** < 5 KB
-        """)
-        
-        if st.button("📥 Descargar Alertas", key="btn_alertas"):
-            alertas = kpis.get('alertas', [])
-            
-            if alertas:
-                df_alertas = pd.DataFrame(alertas)
-                
-                csv = df_alertas.to_csv(index=False, encoding='utf-8-sig')
-                st.download_button(
-                    label="⬇️ Descargar CSV",
-                    data=csv,
-                    file_name=f"alertas_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
-                    mime="text/csv"
-                )
-            else:
-                st.warning("No hay alertas disponibles para descargar")
+    - ⚧️ Análisis de género
+    - 🧠 Clasificación de riesgo
+    """)
+    
+    # =========================================================================
+    # SECCIÓN 1: REPORTES EJECUTIVOS
+    # =========================================================================
+    
+    reportes_ejecutivos(df_cubo, kpis)
     
     # =========================================================================
     # SECCIÓN 2: DATASETS COMPLETOS
@@ -2874,34 +4791,23 @@ def pagina_descargar_reportes(datos):
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            st.metric("Registros", f"{len(df_morbilidad):,}")
+            st.metric("Registros", f"{contar_registros(df_morbilidad):,}")
         
         with col2:
-            st.metric("Columnas", f"{len(df_morbilidad.columns)}")
+            st.metric("Columnas", f"{len(columnas_originales())}")
         
         with col3:
-            size_mb = df_morbilidad.memory_usage(deep=True).sum() / 1024**2
-            st.metric("Tamaño", f"{size_mb:.1f} MB")
-        
-        st.markdown("**Columnas incluidas:**")
-        cols_preview = st.multiselect(
-            "Selecciona columnas para descargar:",
-            options=list(df_morbilidad.columns),
-            default=list(df_morbilidad.columns[:10]),
-            key="cols_morbilidad"
-        )
-        
-        if cols_preview:
-            st.dataframe(df_morbilidad[cols_preview].head(5), use_container_width=True)
-            
-            csv = df_morbilidad[cols_preview].to_csv(index=False, encoding='utf-8-sig')
-            st.download_button(
-                label="⬇️ Descargar Dataset Morbilidad (CSV)",
-                data=csv,
-                file_name=f"morbilidad_6_17_años_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv",
-                key="download_morbilidad"
+            memoria = datos['memoria_morbilidad']
+            reduccion = (1 - memoria['optimizada'] / memoria['original']) * 100 if memoria['original'] > 0 else 0
+            st.metric(
+                "Tamaño",
+                f"{memoria['optimizada']:.1f} MB",
+                delta=f"-{reduccion:.0f}% (antes {memoria['original']:.1f} MB)",
+                delta_color="inverse",
+                help="Memoria en el servidor con columnas categóricas y enteros compactos"
             )
+        
+        columnas_morbilidad()
     
     # Dataset integrado
     with st.expander("📁 Dataset Integrado - Serie Temporal"):
@@ -2913,7 +4819,7 @@ def pagina_descargar_reportes(datos):
         - Orientadores necesarios
         """)
         
-        st.dataframe(df_integrado, use_container_width=True)
+        st.dataframe(df_integrado, width='stretch')
         
         csv = df_integrado.to_csv(index=False, encoding='utf-8-sig')
         st.download_button(
@@ -2934,7 +4840,7 @@ def pagina_descargar_reportes(datos):
         """)
         
         if len(df_clasificacion) > 0:
-            st.dataframe(df_clasificacion, use_container_width=True)
+            st.dataframe(df_clasificacion, width='stretch')
             
             csv = df_clasificacion.to_csv(index=False, encoding='utf-8-sig')
             st.download_button(
@@ -2957,7 +4863,7 @@ def pagina_descargar_reportes(datos):
         """)
         
         if len(df_clustering) > 0:
-            st.dataframe(df_clustering, use_container_width=True)
+            st.dataframe(df_clustering, width='stretch')
             
             csv = df_clustering.to_csv(index=False, encoding='utf-8-sig')
             st.download_button(
@@ -2974,6 +4880,216 @@ def pagina_descargar_reportes(datos):
     # SECCIÓN 3: REPORTES POR DIMENSIÓN
     # =========================================================================
     
+    reportes_por_dimension(datos, df_cubo)
+    
+    # =========================================================================
+    # SECCIÓN 4: REPORTE PERSONALIZADO
+    # =========================================================================
+    
+    reporte_personalizado(datos, df_cubo)
+    
+    # =========================================================================
+    # SECCIÓN 5: CONSULTA SQL
+    # =========================================================================
+    
+    consulta_sql(datos)
+    
+    # =========================================================================
+    # SECCIÓN 6: INFORMACIÓN ADICIONAL
+    # =========================================================================
+    
+    st.markdown("---")
+    st.markdown("## ℹ️ Información sobre los Reportes")
+    
+    with st.expander("📖 Guía de Uso"):
+        st.markdown("""
+        ### Cómo usar los reportes:
+        
+        1. **Reportes Ejecutivos**: Ideales para presentaciones y toma de decisiones rápida
+        2. **Datasets Completos**: Para análisis profundo con herramientas especializadas (Excel, R, Python)
+        3. **Reportes por Dimensión**: Enfocados en aspectos específicos (localidad, género)
+        4. **Reporte Personalizado**: Máxima flexibilidad para análisis a medida
+        
+        ### Formatos disponibles:
+        - **CSV**: Compatible con Excel, Google Sheets, y herramientas de análisis
+        - **UTF-8 con BOM**: Asegura correcta visualización de tildes y caracteres especiales
+        
+        ### Recomendaciones:
+        - Descarga regularmente para seguimiento histórico
+        - Usa reportes personalizados para análisis específicos
+        - Combina múltiples reportes para análisis integrado
+        """)
+    
+    with st.expander("📊 Metadatos de los Datasets"):
+        st.markdown(f"""
+        ### Información del Observatorio
+        
+        **Período cubierto:** {df_cubo['ano'].min()} - {df_cubo['ano'].max()}  
+        **Población objetivo:** Niños, niñas y adolescentes (6-17 años)  
+        **Localidades:** {df_cubo['prestador_localidad_nombre'].nunique()}  
+        **Registros totales:** {contar_registros(df_cubo):,}  
+        **Última actualización:** {pd.Timestamp.now().strftime('%Y-%m-%d')}  
+        
+        **Fuentes de datos:**
+        - Morbilidad en Salud Mental - Secretaría de Salud
+        - Matrícula Oficial - Ministerio de Educación Nacional
+        - Índice de Paridad de Género
+        - ECAS 2016 - Encuesta de Clima y Ambiente Escolar
+        
+        **Modelos aplicados:**
+        - Random Forest (Clasificación de Riesgo)
+        - K-Means (Clustering de Localidades)
+        - Red Neuronal Profunda (Predicciones)
+        """)
+        
+        tiempos = cache_datasets().tiempos()
+        if tiempos:
+            st.markdown("**Tiempos de carga (última lectura en el servidor):**")
+            df_tiempos = pd.DataFrame([
+                {
+                    'Dataset': nombre,
+                    'Archivos': ', '.join(info['archivos']),
+                    'Segundos': round(info['segundos'], 3)
+                }
+                for nombre, info in tiempos.items()
+            ])
+            st.dataframe(df_tiempos, width='stretch', hide_index=True)
+        
+        agregados = cache_agregados().estadisticas()
+        st.markdown(
+            f"**Caché de agregados:** {agregados['aciertos']:,} aciertos, {agregados['fallos']:,} fallos, "
+            f"{agregados['entradas']} entradas ({agregados['memoria_mb']:.2f} de {LIMITE_CACHE_AGREGADOS_MB:.0f} MB)"
+        )
+
+        figuras = cache_figuras().estadisticas()
+        st.markdown(
+            f"**Caché de figuras:** {figuras['aciertos']:,} aciertos, {figuras['fallos']:,} fallos, "
+            f"{figuras['entradas']} entradas ({figuras['memoria_mb']:.2f} de {LIMITE_CACHE_FIGURAS_MB:.0f} MB)"
+        )
+    
+    # Nota final
+    st.info("""
+    💾 **Nota:** Todos los datos descargados están filtrados para población de 6-17 años 
+    y incluyen únicamente registros validados y limpios.
+    """)
+
+
+@st.fragment
+def reportes_ejecutivos(df_cubo, kpis):
+    """Reportes ejecutivos; sus botones solo vuelven a ejecutar esta sección"""
+    
+    st.markdown("---")
+    st.markdown("## 📊 Reportes Ejecutivos")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.markdown("### 📋 Resumen General")
+        st.markdown("""
+        **Contenido:**
+        - Indicadores clave agregados
+        - KPIs principales
+        - Alertas activas
+        - Resumen por año
+        
+        **Formato:** CSV  
+        **Tamaño aproximado:** < 1 KB
+        """)
+        
+        if st.button("📥 Descargar Resumen General", key="btn_resumen"):
+            # Crear DataFrame de resumen
+            resumen_data = {
+                'Indicador': [
+                    'Total Atenciones (6-17 años)',
+                    'Población Estudiantil',
+                    'Tasa por 500 estudiantes',
+                    'Número de Localidades',
+                    'Período Analizado',
+                    'Orientadores Requeridos',
+                    'Brecha de Género'
+                ],
+                'Valor': [
+                    f"{int(df_cubo['sum_atenciones'].sum()):,}",
+                    f"{int(kpis.get('poblacion_estudiantil', 0)):,}",
+                    f"{kpis.get('tasa_por_500', 0):.2f}",
+                    f"{df_cubo['prestador_localidad_nombre'].nunique()}",
+                    f"{df_cubo['ano'].min()} - {df_cubo['ano'].max()}",
+                    f"{int(kpis.get('orientadores_necesarios', 0)):,}",
+                    f"{kpis.get('brecha_genero', 0):.2f}x"
+                ]
+            }
+            
+            df_resumen = pd.DataFrame(resumen_data)
+            
+            csv = df_resumen.to_csv(index=False, encoding='utf-8-sig')
+            st.download_button(
+                label="⬇️ Descargar CSV",
+                data=csv,
+                file_name=f"resumen_general_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
+                mime="text/csv"
+            )
+    
+    with col2:
+        st.markdown("### 🚨 Reporte de Alertas")
+        st.markdown("""
+        **Contenido:**
+        - Alertas críticas activas
+        - Alertas de advertencia
+        - Umbrales alcanzados
+        - Recomendaciones
+        
+        **Formato:** CSV  
+        **Tamaño aproximado:** < 5 KB
+        """)
+        
+        if st.button("📥 Descargar Alertas", key="btn_alertas"):
+            alertas = kpis.get('alertas', [])
+            
+            if alertas:
+                df_alertas = pd.DataFrame(alertas)
+                
+                csv = df_alertas.to_csv(index=False, encoding='utf-8-sig')
+                st.download_button(
+                    label="⬇️ Descargar CSV",
+                    data=csv,
+                    file_name=f"alertas_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
+                    mime="text/csv"
+                )
+            else:
+                st.warning("No hay alertas disponibles para descargar")
+
+@st.fragment
+def columnas_morbilidad():
+    """Vista previa y descarga de las columnas elegidas de los registros originales de morbilidad"""
+    
+    columnas = columnas_originales()
+    
+    st.markdown("**Columnas incluidas:**")
+    cols_preview = st.multiselect(
+        "Selecciona columnas para descargar:",
+        options=columnas,
+        default=columnas[:10],
+        key="cols_morbilidad"
+    )
+    
+    if cols_preview:
+        vista_previa = pd.concat(list(bloques_morbilidad_original(cols_preview, filas=FILAS_VISTA_PREVIA)), ignore_index=True)
+        tabla_paginada(vista_previa, key="pagina_morbilidad", width='stretch')
+        st.caption(f"Vista previa de los primeros {len(vista_previa):,} registros, tal como vienen en las fuentes.")
+        
+        # El CSV completo se arma solo cuando se pide la descarga
+        st.download_button(
+            label="⬇️ Descargar Dataset Morbilidad (CSV)",
+            data=partial(csv_morbilidad_original, cols_preview),
+            file_name=f"morbilidad_6_17_años_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
+            mime="text/csv",
+            key="download_morbilidad"
+        )
+
+@st.fragment
+def reportes_por_dimension(datos, df_cubo):
+    """Reportes por localidad y por género; sus selectores y botones solo vuelven a ejecutar esta sección"""
+    
     st.markdown("---")
     st.markdown("## 📊 Reportes por Dimensión")
     
@@ -2982,7 +5098,7 @@ def pagina_descargar_reportes(datos):
     with col1:
         st.markdown("### 🏙️ Reporte por Localidad")
         
-        localidades = sorted(df_morbilidad['prestador_localidad_nombre'].unique())
+        localidades = sorted(df_cubo['prestador_localidad_nombre'].unique())
         localidad_sel = st.selectbox(
             "Selecciona localidad:",
             options=['Todas'] + list(localidades),
@@ -2992,7 +5108,7 @@ def pagina_descargar_reportes(datos):
         if st.button("Generar Reporte por Localidad", key="btn_loc"):
             if localidad_sel == 'Todas':
                 # Resumen agregado por localidad
-                reporte_loc = df_morbilidad.groupby('prestador_localidad_nombre').agg({
+                reporte_loc = df_cubo.groupby('prestador_localidad_nombre', observed=True).agg({
                     'sum_atenciones': 'sum',
                     'ano': lambda x: f"{x.min()}-{x.max()}"
                 }).reset_index()
@@ -3002,15 +5118,15 @@ def pagina_descargar_reportes(datos):
                 
             else:
                 # Detalle de localidad específica
-                df_loc = df_morbilidad[df_morbilidad['prestador_localidad_nombre'] == localidad_sel]
+                df_loc = df_cubo[df_cubo['prestador_localidad_nombre'] == localidad_sel]
                 
-                reporte_loc = df_loc.groupby(['ano', 'categoria_trastorno' if 'categoria_trastorno' in df_loc.columns else 'dxprincipal_agrupacion1_nombre']).agg({
+                reporte_loc = df_loc.groupby(['ano', COL_TRASTORNO], observed=True).agg({
                     'sum_atenciones': 'sum'
                 }).reset_index()
                 
                 reporte_loc.columns = ['Año', 'Trastorno', 'Atenciones']
             
-            st.dataframe(reporte_loc, use_container_width=True)
+            st.dataframe(reporte_loc, width='stretch')
             
             csv = reporte_loc.to_csv(index=False, encoding='utf-8-sig')
             st.download_button(
@@ -3024,9 +5140,7 @@ def pagina_descargar_reportes(datos):
     with col2:
         st.markdown("### ⚧️ Reporte de Género")
         
-        if 'genero' in df_morbilidad.columns or 'sexo_gen' in df_morbilidad.columns:
-            col_gen = 'genero' if 'genero' in df_morbilidad.columns else 'sexo_gen'
-            
+        if COL_GENERO in df_cubo.columns:
             tipo_reporte_gen = st.radio(
                 "Tipo de reporte:",
                 ['Resumen General', 'Por Año', 'Por Trastorno'],
@@ -3035,31 +5149,23 @@ def pagina_descargar_reportes(datos):
             
             if st.button("Generar Reporte de Género", key="btn_genero"):
                 if tipo_reporte_gen == 'Resumen General':
-                    reporte_gen = df_morbilidad.groupby(col_gen).agg({
-                        'sum_atenciones': 'sum'
-                    }).reset_index()
+                    reporte_gen = datos.agregar([COL_GENERO]).reset_index()
                     
                     reporte_gen.columns = ['Género', 'Total_Atenciones']
                     reporte_gen['Porcentaje'] = (reporte_gen['Total_Atenciones'] / reporte_gen['Total_Atenciones'].sum() * 100).round(2)
                 
                 elif tipo_reporte_gen == 'Por Año':
-                    reporte_gen = df_morbilidad.groupby(['ano', col_gen]).agg({
-                        'sum_atenciones': 'sum'
-                    }).reset_index()
+                    reporte_gen = datos.agregar([COL_ANO, COL_GENERO]).reset_index()
                     
                     reporte_gen.columns = ['Año', 'Género', 'Atenciones']
                 
                 else:  # Por Trastorno
-                    col_trast = 'categoria_trastorno' if 'categoria_trastorno' in df_morbilidad.columns else 'dxprincipal_agrupacion1_nombre'
-                    
-                    reporte_gen = df_morbilidad.groupby([col_trast, col_gen]).agg({
-                        'sum_atenciones': 'sum'
-                    }).reset_index()
+                    reporte_gen = datos.agregar([COL_TRASTORNO, COL_GENERO]).reset_index()
                     
                     reporte_gen.columns = ['Trastorno', 'Género', 'Atenciones']
                     reporte_gen = reporte_gen.sort_values('Atenciones', ascending=False)
                 
-                st.dataframe(reporte_gen, use_container_width=True)
+                st.dataframe(reporte_gen, width='stretch')
                 
                 csv = reporte_gen.to_csv(index=False, encoding='utf-8-sig')
                 st.download_button(
@@ -3071,10 +5177,10 @@ def pagina_descargar_reportes(datos):
                 )
         else:
             st.warning("Datos de género no disponibles")
-    
-    # =========================================================================
-    # SECCIÓN 4: REPORTE PERSONALIZADO
-    # =========================================================================
+
+@st.fragment
+def reporte_personalizado(datos, df_cubo):
+    """Formulario del reporte personalizado; enviarlo solo vuelve a ejecutar esta sección"""
     
     st.markdown("---")
     st.markdown("## 🎨 Reporte Personalizado")
@@ -3090,7 +5196,7 @@ def pagina_descargar_reportes(datos):
         
         with col1:
             # Filtros temporales
-            años_disponibles = sorted(df_morbilidad['ano'].unique())
+            años_disponibles = sorted(df_cubo['ano'].unique())
             años_sel = st.multiselect(
                 "Años:",
                 options=años_disponibles,
@@ -3099,7 +5205,7 @@ def pagina_descargar_reportes(datos):
             )
             
             # Filtro de localidades
-            localidades_disponibles = sorted(df_morbilidad['prestador_localidad_nombre'].unique())
+            localidades_disponibles = sorted(df_cubo['prestador_localidad_nombre'].unique())
             localidades_sel = st.multiselect(
                 "Localidades:",
                 options=localidades_disponibles,
@@ -3126,38 +5232,26 @@ def pagina_descargar_reportes(datos):
         submitted = st.form_submit_button("🔍 Generar Reporte Personalizado")
         
         if submitted:
-            # Filtrar datos
-            df_filtrado = df_morbilidad[
-                (df_morbilidad['ano'].isin(años_sel)) &
-                (df_morbilidad['prestador_localidad_nombre'].isin(localidades_sel))
-            ]
-            
             # Mapear agrupaciones
             group_cols = []
             if 'Año' in agrupar_por:
                 group_cols.append('ano')
             if 'Localidad' in agrupar_por:
                 group_cols.append('prestador_localidad_nombre')
-            if 'Género' in agrupar_por:
-                col_gen = 'genero' if 'genero' in df_filtrado.columns else 'sexo_gen'
-                if col_gen in df_filtrado.columns:
-                    group_cols.append(col_gen)
-            if 'Trastorno' in agrupar_por:
-                col_trast = 'categoria_trastorno' if 'categoria_trastorno' in df_filtrado.columns else 'dxprincipal_agrupacion1_nombre'
-                if col_trast in df_filtrado.columns:
-                    group_cols.append(col_trast)
-            if 'Nivel Educativo' in agrupar_por and 'nivel_educativo' in df_filtrado.columns:
-                group_cols.append('nivel_educativo')
-            
-            # Aplicar agregación
-            if metrica == 'Total Atenciones':
-                reporte_pers = df_filtrado.groupby(group_cols)['sum_atenciones'].sum().reset_index()
-            elif metrica == 'Promedio':
-                reporte_pers = df_filtrado.groupby(group_cols)['sum_atenciones'].mean().reset_index()
-            elif metrica == 'Máximo':
-                reporte_pers = df_filtrado.groupby(group_cols)['sum_atenciones'].max().reset_index()
-            else:  # Mínimo
-                reporte_pers = df_filtrado.groupby(group_cols)['sum_atenciones'].min().reset_index()
+            if 'Género' in agrupar_por and COL_GENERO in df_cubo.columns:
+                group_cols.append(COL_GENERO)
+            if 'Trastorno' in agrupar_por and COL_TRASTORNO in df_cubo.columns:
+                group_cols.append(COL_TRASTORNO)
+            if 'Nivel Educativo' in agrupar_por and COL_NIVEL in df_cubo.columns:
+                group_cols.append(COL_NIVEL)
+            
+            # Filtrar (por posiciones precalculadas de cada valor) y agregar
+            metricas = {'Total Atenciones': 'sum', 'Promedio': 'mean', 'Máximo': 'max', 'Mínimo': 'min'}
+            reporte_pers = datos.agregar(
+                group_cols,
+                metricas[metrica],
+                filtros={COL_ANO: años_sel, COL_LOCALIDAD: localidades_sel}
+            ).reset_index()
             
             # Renombrar columna métrica
             reporte_pers = reporte_pers.rename(columns={'sum_atenciones': metrica})
@@ -3168,7 +5262,7 @@ def pagina_descargar_reportes(datos):
             st.success(f"✅ Reporte generado: {len(reporte_pers):,} filas")
             
             # Mostrar preview
-            st.dataframe(reporte_pers.head(20), use_container_width=True)
+            st.dataframe(reporte_pers.head(20), width='stretch')
             
             # Botón de descarga
             csv = reporte_pers.to_csv(index=False, encoding='utf-8-sig')
@@ -3179,60 +5273,86 @@ def pagina_descargar_reportes(datos):
                 mime="text/csv",
                 key="download_personalizado"
             )
-    
-    # =========================================================================
-    # SECCIÓN 5: INFORMACIÓN ADICIONAL
-    # =========================================================================
+
+@st.fragment
+def consulta_sql(datos):
+    """Consola SQL de solo lectura; ejecutar una consulta solo vuelve a ejecutar esta sección"""
     
     st.markdown("---")
-    st.markdown("## ℹ️ Información sobre los Reportes")
-    
-    with st.expander("📖 Guía de Uso"):
-        st.markdown("""
-        ### Cómo usar los reportes:
-        
-        1. **Reportes Ejecutivos**: Ideales para presentaciones y toma de decisiones rápida
-        2. **Datasets Completos**: Para análisis profundo con herramientas especializadas (Excel, R, Python)
-        3. **Reportes por Dimensión**: Enfocados en aspectos específicos (localidad, género)
-        4. **Reporte Personalizado**: Máxima flexibilidad para análisis a medida
-        
-        ### Formatos disponibles:
-        - **CSV**: Compatible con Excel, Google Sheets, y herramientas de análisis
-        - **UTF-8 con BOM**: Asegura correcta visualización de tildes y caracteres especiales
-        
-        ### Recomendaciones:
-        - Descarga regularmente para seguimiento histórico
-        - Usa reportes personalizados para análisis específicos
-        - Combina múltiples reportes para análisis integrado
-        """)
+    st.markdown("## 🧮 Consulta SQL")
     
-    with st.expander("📊 Metadatos de los Datasets"):
-        st.markdown(f"""
-        ### Información del Observatorio
-        
-        **Período cubierto:** {df_morbilidad['ano'].min()} - {df_morbilidad['ano'].max()}  
-        **Población objetivo:** Niños, niñas y adolescentes (6-17 años)  
-        **Localidades:** {df_morbilidad['prestador_localidad_nombre'].nunique()}  
-        **Registros totales:** {len(df_morbilidad):,}  
-        **Última actualización:** {pd.Timestamp.now().strftime('%Y-%m-%d')}  
-        
-        **Fuentes de datos:**
-        - Morbilidad en Salud Mental - Secretaría de Salud
-        - Matrícula Oficial - Ministerio de Educación Nacional
-        - Índice de Paridad de Género
-        - ECAS 2016 - Encuesta de Clima y Ambiente Escolar
-        
-        **Modelos aplicados:**
-        - Random Forest (Clasificación de Riesgo)
-        - K-Means (Clustering de Localidades)
-        - Red Neuronal Profunda (Predicciones)
-        """)
+    motor = datos.sql()
     
-    # Nota final
-    st.info("""
-    💾 **Nota:** Todos los datos descargados están filtrados para población de 6-17 años 
-    y incluyen únicamente registros validados y limpios.
+    st.markdown(f"""
+    Consultas de solo lectura (motor: **{motor.motor}**). `cubo` resume la morbilidad por
+    localidad, año, género, trastorno, nivel y edad (`sum_atenciones`, `n_registros`);
+    `morbilidad` tiene los registros. Cada consulta devuelve hasta {FILAS_MAXIMAS_SQL:,}
+    filas y se cancela a los {TIEMPO_MAXIMO_SQL:.0f} segundos.
     """)
+    
+    if 'morbilidad' not in motor.tablas():
+        st.caption("La tabla `morbilidad` (registros) requiere DuckDB: con SQLite se copiaría completa a memoria. Use `cubo`.")
+    
+    with st.expander("📋 Tablas disponibles"):
+        for nombre, columnas in motor.tablas().items():
+            st.markdown(f"**{nombre}**: {', '.join(columnas)}")
+    
+    ejemplo = st.selectbox("Ejemplo:", options=list(CONSULTAS_SQL), key="ejemplo_sql")
+    consulta = st.text_area("Consulta:", value=CONSULTAS_SQL[ejemplo], height=250, key=f"consulta_sql_{ejemplo}")
+    
+    if st.button("▶️ Ejecutar consulta", key="ejecutar_sql"):
+        try:
+            resultado_sql, truncado = motor.consultar(consulta)
+        except Exception as e:
+            st.error(f"❌ Error en la consulta: {e}")
+        else:
+            st.success(f"✅ {len(resultado_sql):,} filas")
+            
+            if truncado:
+                st.warning(f"⚠️ La consulta devuelve más de {FILAS_MAXIMAS_SQL:,} filas: se muestran y descargan solo las primeras {FILAS_MAXIMAS_SQL:,}. Agregue (GROUP BY) o filtre (WHERE) para ver el resultado completo.")
+            
+            st.dataframe(resultado_sql.head(1000), width='stretch')
+            
+            if len(resultado_sql) > 1000:
+                st.caption("Se muestran las primeras 1.000 filas; la descarga incluye todas las leídas.")
+            
+            st.download_button(
+                label="⬇️ Descargar Resultado (CSV)",
+                data=resultado_sql.to_csv(index=False, encoding='utf-8-sig'),
+                file_name=f"consulta_sql_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                mime="text/csv",
+                key="download_sql"
+            )
+
+def descargar_tablas_resumen(datos):
+    """Descargas disponibles en modo resumen: las tablas resumen publicadas"""
+    
+    aviso_modo_resumen("La generación de reportes detallados")
+    
+    titulos = {
+        'genero': "⚧️ Atenciones por Año y Género",
+        'localidad': "🏙️ Atenciones por Localidad",
+        'trastorno': "🧠 Atenciones por Trastorno",
+        'matricula_anio': "👥 Matrícula por Año",
+        'matricula_genero': "👥 Matrícula por Año y Género",
+        'matricula_sector': "🏫 Matrícula por Año y Sector"
+    }
+    
+    st.markdown("---")
+    st.markdown("## 📊 Tablas Resumen")
+    
+    for nombre, df in datos['resumenes'].items():
+        with st.expander(f"📁 {titulos.get(nombre, nombre)}"):
+            tabla_paginada(df, key=f"pagina_resumen_{nombre}", width='stretch')
+            
+            csv = df.to_csv(index=False, encoding='utf-8-sig')
+            st.download_button(
+                label="⬇️ Descargar CSV",
+                data=csv,
+                file_name=f"{os.path.splitext(ARCHIVOS_RESUMEN[nombre])[0]}_{pd.Timestamp.now().strftime('%Y%m%d')}.csv",
+                mime="text/csv",
+                key=f"download_resumen_{nombre}"
+            )
 
 
 def main():
@@ -3240,12 +5360,13 @@ def main():
 
     datos = cargar_datos()
 
-    if datos is None:
-        st.error("⚠️ No se pudieron cargar los datos.")
-        st.stop()
-
     pagina = sidebar_navigation()
 
+    datos.precargar(DATASETS_PAGINA.get(pagina, []))
+
+    if datos.degradado:
+        st.sidebar.warning("⚠️ **Modo resumen:** no hay registros de morbilidad en este servidor; las páginas se sirven desde las tablas resumen.")
+
     if pagina == "🏠 Inicio":
         pagina_inicio(datos)
     elif pagina == "📊 Indicadores Clave":
@@ -3263,6 +5384,10 @@ def main():
     elif pagina == "📥 Descargar Reportes":
         pagina_descargar_reportes(datos)
 
+    # Después de la página: la morbilidad (y el almacén) se carga al primer uso
+    for archivo, motivo in extractos_rechazados():
+        st.sidebar.error(f"❌ **{os.path.basename(archivo)}** no se incorporó a la morbilidad: {motivo}.")
+
     # Footer
     st.markdown("---")
     st.markdown("""
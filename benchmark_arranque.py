@@ -0,0 +1,97 @@
+"""
+Benchmark de arranque en frío del dashboard
+Compara la carga secuencial de todos los datasets sin almacén columnar con la carga
+en paralelo (la que usa el dashboard, con HILOS_PRECARGA hilos) y muestra la mediana
+del tiempo de cada dataset. Con una sola CPU el dashboard carga en secuencia: medir
+en el servidor multinúcleo antes de fijar OBSERVATORIO_HILOS_PRECARGA.
+
+Uso:
+    python benchmark_arranque.py [repeticiones] [hilos]
+"""
+
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import app_dashboard as app
+
+DIR_REPO = os.path.dirname(os.path.abspath(__file__))
+
+
+def preparar_directorio():
+    """Directorio temporal con enlaces a los archivos fuente y sin almacén columnar (arranque en frío)"""
+    directorio = tempfile.mkdtemp(prefix='observatorio_arranque_')
+
+    for nombre in os.listdir(DIR_REPO):
+        if nombre.endswith(('.csv', '.json')) or nombre == app.DIR_EXTRACTOS:
+            os.symlink(os.path.join(DIR_REPO, nombre), os.path.join(directorio, nombre))
+
+    return directorio
+
+
+def medir(hilos):
+    """Cargar todos los datasets en frío con `hilos` hilos; devuelve (segundos totales, tiempos por dataset)"""
+    directorio = preparar_directorio()
+    anterior = os.getcwd()
+    os.chdir(directorio)
+
+    try:
+        app.DIR_COMPARTIDO = os.path.join(app.DIR_ALMACEN, 'compartido')
+        cache = app.CacheVersionada()
+
+        inicio = time.perf_counter()
+        cache.precargar(app.DATASETS, hilos=hilos)
+        total = time.perf_counter() - inicio
+
+        return total, cache.tiempos()
+    finally:
+        os.chdir(anterior)
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def main():
+    repeticiones = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    hilos = int(sys.argv[2]) if len(sys.argv) > 2 else max(app.HILOS_PRECARGA, 2)
+
+    totales = {'secuencial': [], 'paralelo': []}
+    segundos = {}
+    archivos = {}
+
+    for _ in range(repeticiones):
+        for modo in totales:
+            total, tiempos = medir(1 if modo == 'secuencial' else hilos)
+            totales[modo].append(total)
+
+            if modo == 'secuencial':
+                for nombre, info in tiempos.items():
+                    segundos.setdefault(nombre, []).append(info['segundos'])
+                    archivos[nombre] = info['archivos']
+
+    # Mediana de cada dataset sobre las repeticiones de la carga secuencial
+    medianas = {nombre: statistics.median(valores) for nombre, valores in segundos.items()}
+
+    print("=" * 70)
+    print(f"ARRANQUE EN FRÍO ({repeticiones} repeticiones, mediana)")
+    print("=" * 70)
+
+    for nombre, mediana in sorted(medianas.items(), key=lambda x: -x[1]):
+        print(f"  {nombre:<15} {mediana:>8.3f} s   {', '.join(archivos[nombre])}")
+
+    suma = sum(medianas.values())
+    mayor = max(medianas.values())
+    secuencial = statistics.median(totales['secuencial'])
+    paralelo = statistics.median(totales['paralelo'])
+
+    print("-" * 70)
+    print(f"  Suma de archivos:     {suma:8.3f} s")
+    print(f"  Archivo más lento:    {mayor:8.3f} s   ({mayor / suma:.0%} del arranque)")
+    print(f"  Carga secuencial:     {secuencial:8.3f} s")
+    print(f"  Carga con {hilos} hilos:   {paralelo:8.3f} s   ({secuencial / paralelo:.2f}x)")
+    print(f"  CPU disponibles:      {len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()}")
+
+
+if __name__ == "__main__":
+    main()
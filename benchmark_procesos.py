@@ -0,0 +1,66 @@
+"""
+Benchmark del pool de procesos de agregación
+Compara la construcción del cubo en el proceso actual con la construcción repartida
+entre procesos (forkserver/spawn), para tamaños alrededor de FILAS_MINIMAS_PROCESOS.
+El pool solo debe activarse (OBSERVATORIO_PROCESOS) si aquí muestra una ganancia.
+
+Uso:
+    python benchmark_procesos.py [procesos] [repeticiones]
+"""
+
+import os
+import statistics
+import sys
+import time
+
+import pandas as pd
+
+import app_dashboard as app
+
+
+def morbilidad_de(filas, base):
+    """Morbilidad de `filas` registros repitiendo la morbilidad disponible"""
+    repeticiones = -(-filas // len(base))
+    return pd.concat([base] * repeticiones, ignore_index=True).iloc[:filas]
+
+
+def medir(df, procesos, repeticiones):
+    """Mediana de segundos de construir_cubo con `procesos` procesos"""
+    app.PROCESOS_AGREGACION = procesos
+    tiempos = []
+
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        app.construir_cubo(df)
+        tiempos.append(time.perf_counter() - inicio)
+
+    return statistics.median(tiempos)
+
+
+def main():
+    procesos = int(sys.argv[1]) if len(sys.argv) > 1 else (os.cpu_count() or 1)
+    repeticiones = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    base = app.construir_morbilidad_optimizada()[0]
+
+    # Medir también por debajo del umbral: el pool se fuerza en todos los tamaños
+    umbral = app.FILAS_MINIMAS_PROCESOS
+    app.FILAS_MINIMAS_PROCESOS = 0
+
+    print("=" * 70)
+    print(f"CUBO EN EL PROCESO vs POOL DE {procesos} PROCESOS ({repeticiones} repeticiones, mediana)")
+    print("=" * 70)
+
+    for filas in (umbral // 2, umbral, 2 * umbral, 4 * umbral):
+        df = morbilidad_de(filas, base)
+        serie = medir(df, 1, repeticiones)
+        pool = medir(df, procesos, repeticiones)
+
+        print(f"  {filas:>10,} filas   proceso {serie:8.3f} s   pool {pool:8.3f} s   ({serie / pool:.2f}x)")
+
+    print("-" * 70)
+    print(f"  CPU disponibles: {os.cpu_count()}")
+
+
+if __name__ == "__main__":
+    main()
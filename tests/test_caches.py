@@ -0,0 +1,164 @@
+"""Cachés compartidas: LRU de agregados acotado por memoria y datasets versionados por sus archivos"""
+import os
+import sys
+import time
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app_dashboard as app
+
+KB = 1024
+
+
+def lru(limite_kb):
+    """LRU cuyos valores son su propio tamaño en bytes"""
+    return app.CacheLRU(limite_kb / 1024, medir=lambda valor: valor)
+
+
+def calculo(valor, llamadas, clave):
+    def calcular():
+        llamadas.append(clave)
+        return valor
+    return calcular
+
+
+def test_lru_descarta_la_entrada_menos_usada():
+    cache = lru(1000)
+    llamadas = []
+
+    for clave in ['a', 'b']:
+        cache.obtener(clave, calculo(400 * KB, llamadas, clave))
+    cache.obtener('a', calculo(400 * KB, llamadas, 'a'))
+    cache.obtener('c', calculo(400 * KB, llamadas, 'c'))
+
+    # 'a' se usó después de 'b': al entrar 'c' sale 'b'
+    cache.obtener('a', calculo(400 * KB, llamadas, 'a'))
+    cache.obtener('b', calculo(400 * KB, llamadas, 'b'))
+
+    assert llamadas == ['a', 'b', 'c', 'b']
+    assert cache.estadisticas()['aciertos'] == 2
+    assert cache.estadisticas()['fallos'] == 4
+    assert cache.estadisticas()['memoria_mb'] <= 1000 / 1024
+
+
+def test_lru_no_guarda_valores_mayores_que_el_limite():
+    cache = lru(1000)
+    llamadas = []
+
+    cache.obtener('pequeno', calculo(100 * KB, llamadas, 'pequeno'))
+    assert cache.obtener('grande', calculo(2000 * KB, llamadas, 'grande')) == 2000 * KB
+    cache.obtener('grande', calculo(2000 * KB, llamadas, 'grande'))
+    cache.obtener('pequeno', calculo(100 * KB, llamadas, 'pequeno'))
+
+    assert llamadas == ['pequeno', 'grande', 'grande']
+    assert cache.estadisticas()['entradas'] == 1
+
+
+def test_lru_nueva_version_no_reutiliza_ni_conserva_la_anterior():
+    cache = lru(1000)
+    llamadas = []
+
+    for version in [1, 2, 3]:
+        for dimensiones in ['localidad', 'ano']:
+            clave = (dimensiones, ('morbilidad', version))
+            cache.obtener(clave, calculo(300 * KB, llamadas, clave))
+            cache.obtener(clave, calculo(300 * KB, llamadas, clave))
+
+    # Cada versión recalcula una vez; las de versiones anteriores salen por el LRU
+    assert len(llamadas) == 6
+    assert cache.estadisticas()['entradas'] == 3
+
+    anterior = ('localidad', ('morbilidad', 1))
+    cache.obtener(anterior, calculo(300 * KB, llamadas, anterior))
+    assert llamadas[-1] == anterior
+
+
+def test_agregado_en_cache_es_de_solo_lectura():
+    df = pd.DataFrame({'localidad': ['Suba', 'Usme', 'Suba'], 'sum_atenciones': [1, 2, 3]})
+    cache = app.CacheLRU(1, app.medir_agregado)
+    clave = (('localidad',), (), 'sum', ('morbilidad', 1))
+
+    serie = cache.obtener(clave, lambda: df.groupby('localidad')['sum_atenciones'].sum())
+
+    pd.testing.assert_series_equal(serie, df.groupby('localidad')['sum_atenciones'].sum())
+    with pytest.raises(ValueError):
+        serie.values[0] = 0
+
+
+def esperar(condicion, segundos=5):
+    """Esperar a que el hilo de recarga en segundo plano termine"""
+    limite = time.monotonic() + segundos
+    while not condicion():
+        assert time.monotonic() < limite, "la recarga no terminó"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    """Dataset 'prueba' leído de un CSV temporal; devuelve (caché, ruta, lecturas)"""
+    ruta = str(tmp_path / 'prueba.csv')
+    pd.DataFrame({'localidad': ['Suba', 'Usme'], 'sum_atenciones': [1, 2]}).to_csv(ruta, index=False)
+    lecturas = []
+
+    def construir():
+        lecturas.append(ruta)
+        return pd.read_csv(ruta)
+
+    monkeypatch.setattr(app, 'DATASETS', {'prueba': ([ruta], construir)})
+    cache = app.CacheVersionada()
+
+    cache.obtener('prueba')
+    esperar(lambda: cache._entradas['prueba']['hash'] is not None)
+    return cache, ruta, lecturas
+
+
+def modificar(ruta, df=None):
+    """Reescribir el archivo (o solo tocarlo) con una fecha de modificación posterior"""
+    if df is not None:
+        df.to_csv(ruta, index=False)
+    fecha = os.stat(ruta).st_mtime_ns + 10**9
+    os.utime(ruta, ns=(fecha, fecha))
+
+
+def test_contenido_nuevo_recarga_y_sube_la_version(dataset):
+    cache, ruta, lecturas = dataset
+    nuevo = pd.DataFrame({'localidad': ['Suba', 'Usme', 'Bosa'], 'sum_atenciones': [5, 6, 7]})
+
+    modificar(ruta, nuevo)
+    cache.obtener('prueba')
+    esperar(lambda: cache.version('prueba') == ('prueba', 2))
+
+    pd.testing.assert_frame_equal(cache.obtener('prueba'), pd.read_csv(ruta))
+    assert len(lecturas) == 2
+    assert cache.tiempos()['prueba']['archivos'] == [ruta]
+
+
+def test_touch_sin_cambios_conserva_datos_y_version(dataset):
+    cache, ruta, lecturas = dataset
+    anterior = cache.obtener('prueba')
+
+    modificar(ruta)
+    cache.obtener('prueba')
+    esperar(lambda: 'prueba' not in cache._recargando)
+
+    assert cache.obtener('prueba') is anterior
+    assert cache.version('prueba') == ('prueba', 1)
+    assert lecturas == [ruta]
+
+
+def test_archivo_invalido_conserva_la_version_anterior(dataset):
+    cache, ruta, lecturas = dataset
+    anterior = cache.obtener('prueba')
+
+    # El CSV vacío no se puede leer: se sigue sirviendo la versión anterior
+    with open(ruta, 'w'):
+        pass
+    modificar(ruta)
+    cache.obtener('prueba')
+    esperar(lambda: 'prueba' not in cache._recargando)
+
+    assert cache.obtener('prueba') is anterior
+    assert cache.version('prueba') == ('prueba', 1)
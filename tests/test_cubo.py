@@ -0,0 +1,211 @@
+"""Cubo de morbilidad y sus consultas: cada resultado se compara con pandas sobre los registros"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app_dashboard as app
+
+LOCALIDAD = app.COL_LOCALIDAD
+ANO = app.COL_ANO
+GENERO = app.COL_GENERO
+TRASTORNO = app.COL_TRASTORNO
+
+AGRUPACIONES = [
+    [LOCALIDAD],
+    [ANO],
+    [LOCALIDAD, ANO],
+    [GENERO, TRASTORNO],
+    [LOCALIDAD, ANO, GENERO, app.COL_NIVEL, 'edad_grupo_rias']
+]
+
+
+def registros(n=600, semilla=0):
+    """Registros sintéticos de morbilidad con el esquema de las fuentes (sexo_gen)"""
+    rng = np.random.default_rng(semilla)
+    return pd.DataFrame({
+        'ano': rng.choice([2022, 2023, 2024], n),
+        'prestador_localidad_nombre': rng.choice(['Suba', 'Kennedy', 'Usme', 'Bosa'], n),
+        'sexo_gen': rng.choice(['Hombre', 'Mujer', 'Intersexual'], n, p=[0.45, 0.45, 0.1]),
+        'categoria_trastorno': rng.choice(['Ansiedad', 'Depresión', 'Conducta'], n),
+        'nivel_educativo': rng.choice(['Primaria', 'Secundaria'], n),
+        'edad_grupo_rias': rng.choice(['Juventud', 'Adolescencia'], n),
+        'sum_atenciones': rng.integers(1, 50, n)
+    })
+
+
+def morbilidad(n=600, semilla=0):
+    return app.optimizar_tipos(app.normalizar_esquema(registros(n, semilla)))
+
+
+def como_texto(obj):
+    """Índice y columnas categóricas como texto: el cubo y los registros pueden diferir en categorías"""
+    obj = obj.copy()
+    if isinstance(obj.index, pd.MultiIndex):
+        obj.index = obj.index.set_levels([nivel.astype(str) if nivel.dtype == object or isinstance(nivel.dtype, pd.CategoricalDtype) else nivel for nivel in obj.index.levels])
+    elif isinstance(obj.index.dtype, pd.CategoricalDtype):
+        obj.index = obj.index.astype(str)
+    if isinstance(obj, pd.DataFrame):
+        obj = obj.astype({c: str for c in obj.columns if isinstance(obj[c].dtype, pd.CategoricalDtype)})
+    return obj
+
+
+@pytest.mark.parametrize('metrica', ['sum', 'mean', 'max', 'min'])
+@pytest.mark.parametrize('dimensiones', AGRUPACIONES, ids=lambda d: '+'.join(d))
+def test_enrollar_cubo_igual_a_agrupar_registros(dimensiones, metrica):
+    df = morbilidad()
+    cubo = app.construir_cubo(df)
+
+    esperado = df.groupby(dimensiones, observed=True)['sum_atenciones'].agg(metrica)
+    obtenido = app.resumir_atenciones(cubo, dimensiones, metrica)
+
+    # max y min salen de las columnas max_atenciones y min_atenciones del cubo
+    pd.testing.assert_series_equal(como_texto(obtenido.rename(esperado.name)), como_texto(esperado), check_dtype=False)
+    assert app.contar_registros(cubo) == len(df)
+
+
+FILTROS = [
+    {},
+    {LOCALIDAD: ('Suba',)},
+    {LOCALIDAD: ('Suba', 'Usme'), ANO: (2023,)},
+    {GENERO: ('Mujer', 'Intersexual'), TRASTORNO: ('Ansiedad',), ANO: (2022, 2024)},
+    {LOCALIDAD: ('Chapinero',)},
+    {LOCALIDAD: ('Bosa', 'Chapinero'), GENERO: ()}
+]
+
+
+@pytest.mark.parametrize('filtros', FILTROS, ids=lambda f: ';'.join(f'{c}={",".join(map(str, v))}' for c, v in f.items()) or 'sin filtros')
+def test_filtrar_filas_igual_a_mascara(filtros):
+    cubo, _ = app.indexar_cubo(app.construir_cubo(morbilidad()))
+    posiciones = app.indexar_valores(cubo, app.DIMENSIONES_CUBO)
+
+    mascara = np.ones(len(cubo), dtype=bool)
+    for columna, valores in filtros.items():
+        mascara &= cubo[columna].isin(valores).to_numpy()
+
+    pd.testing.assert_frame_equal(app.filtrar_filas(cubo, posiciones, filtros), cubo[mascara])
+
+
+def test_indice_de_localidades_igual_a_agrupar_registros():
+    df = morbilidad()
+    cubo, indice = app.indexar_cubo(app.construir_cubo(df))
+
+    for localidad, grupo in df.groupby(LOCALIDAD, observed=True):
+        filas = app.filas_localidad(cubo, indice, localidad)
+        assert (filas[LOCALIDAD] == localidad).all()
+        assert filas['sum_atenciones'].sum() == grupo['sum_atenciones'].sum()
+
+    assert indice['ciudad']['total'] == df['sum_atenciones'].sum()
+    por_ano = df.groupby(ANO)['sum_atenciones'].sum()
+    assert indice['ciudad']['por_ano'] == [[int(a), int(v)] for a, v in por_ano.items()]
+    assert app.filas_localidad(cubo, indice, 'Chapinero').empty
+
+
+def brechas_esperadas(atenciones):
+    """Brecha de género grupo por grupo, ordenando los géneros de cada uno"""
+    filas = {}
+
+    for grupo, serie in atenciones.groupby(level=[LOCALIDAD, ANO], observed=True):
+        serie = serie.droplevel([LOCALIDAD, ANO]).sort_index().sort_values(ascending=False, kind='stable')
+        if len(serie) < 2:
+            continue
+        filas[grupo] = {
+            'genero_predominante': serie.index[0],
+            'brecha': serie.iloc[0] / serie.iloc[1],
+            'participacion': serie.iloc[0] / serie.sum(),
+            'total': serie.sum()
+        }
+
+    esperado = pd.DataFrame.from_dict(filas, orient='index')
+    esperado.index.names = [LOCALIDAD, ANO]
+    return esperado.astype({'total': 'int64'})
+
+
+def test_brechas_genero_igual_a_calculo_por_grupo():
+    df = registros().rename(columns={'sexo_gen': GENERO})
+    # Grupos con un solo género quedan fuera de la tabla
+    df = df[~((df[LOCALIDAD] == 'Usme') & (df[ANO] == 2023) & (df[GENERO] != 'Mujer'))]
+    atenciones = df.groupby([LOCALIDAD, ANO, GENERO])['sum_atenciones'].sum()
+
+    obtenido = app.brechas_genero(atenciones)
+    esperado = brechas_esperadas(atenciones)
+
+    assert ('Usme', 2023) not in obtenido.index
+    pd.testing.assert_frame_equal(obtenido.sort_index(), esperado.sort_index(), check_dtype=False)
+
+
+def rankings_esperados(atenciones, grupo):
+    """Rango, percentil y participaciones de cada localidad con rank y sumas por grupo"""
+    df = atenciones.rename('atenciones').reset_index()
+    por_grupo = df.groupby(grupo or (lambda _: 0))['atenciones']
+    total = por_grupo.transform('sum')
+
+    df['rango'] = por_grupo.rank(ascending=False, method='first').astype('int64')
+    df['percentil'] = por_grupo.rank(method='max', pct=True) * 100
+    df['participacion'] = df['atenciones'] / total * 100
+
+    acumulado = []
+    for _, fila in df.iterrows():
+        mismo_grupo = (df[grupo] == fila[grupo]).all(axis=1) if grupo else np.ones(len(df), dtype=bool)
+        acumulado.append(df.loc[mismo_grupo & (df['rango'] <= fila['rango']), 'atenciones'].sum())
+    df['participacion_acumulada'] = np.array(acumulado) / total * 100
+
+    return df.set_index(grupo + [LOCALIDAD])
+
+
+@pytest.mark.parametrize('alcance', list(app.ALCANCES_RANKING))
+def test_rankings_igual_a_rank_por_grupo(alcance):
+    df = registros()
+    grupo = app.ALCANCES_RANKING[alcance]
+
+    rankings = app.materializar_rankings(lambda dimensiones: df.groupby(dimensiones)['sum_atenciones'].sum())
+    assert list(rankings) == list(app.ALCANCES_RANKING)
+
+    atenciones = df.groupby(grupo + [LOCALIDAD])['sum_atenciones'].sum()
+    esperado = rankings_esperados(atenciones, grupo)
+
+    pd.testing.assert_frame_equal(rankings[alcance].sort_index(), esperado.sort_index(), check_dtype=False)
+
+
+def test_rankings_solo_de_alcances_disponibles():
+    df = registros()
+    agregar = lambda dimensiones: None if TRASTORNO in dimensiones else df.groupby(dimensiones)['sum_atenciones'].sum()
+
+    assert list(app.materializar_rankings(agregar)) == ['general', 'por_ano']
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(app.DIR_EXTRACTOS)
+    return tmp_path
+
+
+@pytest.mark.parametrize('con_almacen', [True, False], ids=['particiones', 'bloques del csv'])
+def test_cubo_fuera_de_memoria_igual_a_cubo_en_memoria(almacen, monkeypatch, con_almacen):
+    if con_almacen and app.pq is None:
+        pytest.skip("el almacén particionado requiere pyarrow")
+    if not con_almacen:
+        monkeypatch.setattr(app, 'pq', None)
+
+    crudo = registros(n=2000, semilla=1)
+    crudo.to_csv(app.ARCHIVO_MORBILIDAD, index=False)
+    df = app.optimizar_tipos(app.normalizar_esquema(crudo))
+
+    # Bloques pequeños: más de 8 parciales fuerzan las fusiones intermedias
+    cubo = app.cubo_por_bloques(tamano_bloque=97)
+    columnas = list(app.DIMENSIONES_CUBO)
+    pd.testing.assert_frame_equal(
+        como_texto(cubo).sort_values(columnas, ignore_index=True),
+        como_texto(app.construir_cubo(df)).sort_values(columnas, ignore_index=True),
+        check_dtype=False
+    )
+
+    for metrica in ['sum', 'mean', 'max', 'min']:
+        esperado = df.groupby([LOCALIDAD, ANO], observed=True)['sum_atenciones'].agg(metrica)
+        obtenido = app.resumir_atenciones(cubo, [LOCALIDAD, ANO], metrica)
+        pd.testing.assert_series_equal(como_texto(obtenido.rename(esperado.name)), como_texto(esperado), check_dtype=False)
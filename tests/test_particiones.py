@@ -0,0 +1,186 @@
+"""Almacén particionado de morbilidad: granularidad ano/mes y reconciliación con las fuentes"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app_dashboard as app
+
+pytestmark = pytest.mark.skipif(app.pq is None, reason="el almacén particionado requiere pyarrow")
+
+DIMENSIONES = ['prestador_localidad_nombre', 'sexo_gen', 'categoria_trastorno', 'nivel_educativo', 'edad_grupo_rias']
+
+
+def registros(anos, filas_por_ano, semilla, meses=None):
+    """Registros sintéticos de morbilidad; con meses se agrega la columna mes"""
+    rng = np.random.default_rng(semilla)
+    n = len(anos) * filas_por_ano
+    df = pd.DataFrame({
+        'ano': np.repeat(anos, filas_por_ano),
+        'prestador_localidad_nombre': rng.choice(['Suba', 'Kennedy', 'Usme'], n),
+        'sexo_gen': rng.choice(['Hombre', 'Mujer'], n),
+        'categoria_trastorno': rng.choice(['Ansiedad', 'Depresión'], n),
+        'nivel_educativo': rng.choice(['Primaria', 'Secundaria'], n),
+        'edad_grupo_rias': rng.choice(['Juventud', 'Adultez'], n),
+        'sum_atenciones': rng.integers(1, 50, n)
+    })
+    if meses is not None:
+        df['mes'] = rng.choice(meses, n)
+    return df
+
+
+def ordenar(cubo):
+    """El orden de las filas del cubo depende del orden de las particiones; se compara el contenido"""
+    cubo = cubo.astype({c: str for c in cubo.columns if isinstance(cubo[c].dtype, pd.CategoricalDtype)})
+    return cubo.sort_values(list(app.DIMENSIONES_CUBO)).reset_index(drop=True)
+
+
+def cubo_esperado(*fuentes):
+    """Cubo construido directamente sobre los registros concatenados"""
+    crudo = pd.concat(fuentes, ignore_index=True)[['ano'] + DIMENSIONES + ['sum_atenciones']]
+    return ordenar(app.construir_cubo(app.optimizar_tipos(app.normalizar_esquema(crudo))))
+
+
+def cubo_almacen():
+    return ordenar(app.cubo_por_bloques(tamano_bloque=97))
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(app.DIR_EXTRACTOS)
+    return tmp_path
+
+
+def test_extracto_parcial_igual_a_registros_concatenados(almacen):
+    base = registros([2019, 2020, 2021, 2022, 2023, 2024], 150, semilla=1)
+    extracto = registros([2025], 200, semilla=2, meses=[1, 2, 3])
+    base.to_csv(app.ARCHIVO_MORBILIDAD, index=False)
+    extracto.to_csv(os.path.join(app.DIR_EXTRACTOS, '2025_t1.csv'), index=False)
+
+    pd.testing.assert_frame_equal(cubo_almacen(), cubo_esperado(base, extracto), check_exact=True)
+
+    claves = app.claves_particiones(app.leer_manifiesto())
+    assert 'ano=2019/mes=0' in claves
+    assert [c for c in claves if c.startswith('ano=2025/')] == ['ano=2025/mes=1', 'ano=2025/mes=2', 'ano=2025/mes=3']
+
+
+def test_meses_reemplazan_el_ano_sin_detalle(almacen):
+    # La base trae 2025 sin mes; el extracto trae los mismos registros de 2025 por mes
+    base = registros([2024, 2025], 150, semilla=3)
+    extracto = base[base['ano'] == 2025].assign(mes=np.resize([1, 2, 3], 150))
+    base.to_csv(app.ARCHIVO_MORBILIDAD, index=False)
+    extracto.to_csv(os.path.join(app.DIR_EXTRACTOS, '2025_t1.csv'), index=False)
+
+    pd.testing.assert_frame_equal(cubo_almacen(), cubo_esperado(base), check_exact=True)
+    assert not os.path.exists(os.path.join(app.DIR_PARTICIONES, 'ano=2025', 'mes=0'))
+
+
+def test_borrar_extracto_elimina_sus_particiones(almacen):
+    base = registros([2024], 150, semilla=4)
+    extracto = registros([2025], 120, semilla=5, meses=[1, 2])
+    ruta_extracto = os.path.join(app.DIR_EXTRACTOS, '2025_t1.csv')
+    base.to_csv(app.ARCHIVO_MORBILIDAD, index=False)
+    extracto.to_csv(ruta_extracto, index=False)
+
+    app.actualizar_particiones()
+    version = app.leer_manifiesto()['version']
+
+    os.remove(ruta_extracto)
+    cambios = app.actualizar_particiones()
+    manifiesto = app.leer_manifiesto()
+
+    assert sorted(cambios) == ['ano=2025/mes=1', 'ano=2025/mes=2']
+    assert list(manifiesto['particiones']) == ['ano=2024/mes=0']
+    assert list(manifiesto['extractos']) == [app.ARCHIVO_MORBILIDAD]
+    assert manifiesto['version'] == version + 1
+    assert not os.path.exists(os.path.join(app.DIR_PARTICIONES, 'ano=2025'))
+    pd.testing.assert_frame_equal(cubo_almacen(), cubo_esperado(base), check_exact=True)
+
+
+def test_fuente_anterior_recupera_el_ano_al_borrar_el_extracto(almacen):
+    base = registros([2024, 2025], 150, semilla=6)
+    extracto = registros([2025], 100, semilla=7, meses=[1])
+    ruta_extracto = os.path.join(app.DIR_EXTRACTOS, '2025_t1.csv')
+    base.to_csv(app.ARCHIVO_MORBILIDAD, index=False)
+    extracto.to_csv(ruta_extracto, index=False)
+
+    pd.testing.assert_frame_equal(cubo_almacen(), cubo_esperado(base[base['ano'] == 2024], extracto), check_exact=True)
+
+    os.remove(ruta_extracto)
+    pd.testing.assert_frame_equal(cubo_almacen(), cubo_esperado(base), check_exact=True)
+    assert sorted(app.leer_manifiesto()['particiones']) == ['ano=2024/mes=0', 'ano=2025/mes=0']
+
+
+def test_almacen_de_formato_anterior_se_reconstruye(almacen):
+    base = registros([2024], 150, semilla=8)
+    base.to_csv(app.ARCHIVO_MORBILIDAD, index=False)
+
+    # Partición solo por año de un almacén anterior
+    os.makedirs(os.path.join(app.DIR_PARTICIONES, 'ano=2024'))
+    base.to_parquet(os.path.join(app.DIR_PARTICIONES, 'ano=2024', 'datos.parquet'))
+    app.guardar_manifiesto({
+        'version': 3,
+        'particiones': {'ano=2024': {'hash': '', 'origen': app.ARCHIVO_MORBILIDAD, 'filas': 150}},
+        'extractos': {app.ARCHIVO_MORBILIDAD: ''}
+    })
+
+    pd.testing.assert_frame_equal(cubo_almacen(), cubo_esperado(base), check_exact=True)
+    manifiesto = app.leer_manifiesto()
+    assert manifiesto['formato'] == app.FORMATO_MANIFIESTO
+    assert manifiesto['version'] == 4
+    assert not os.path.exists(os.path.join(app.DIR_PARTICIONES, 'ano=2024', 'datos.parquet'))
+
+
+def test_registros_sin_mes_van_a_mes_cero(almacen):
+    base = registros([2024], 150, semilla=9)
+    extracto = registros([2025], 120, semilla=10, meses=[1, 2]).astype({'mes': float})
+    extracto.loc[extracto.index[::7], 'mes'] = np.nan
+    base.to_csv(app.ARCHIVO_MORBILIDAD, index=False)
+    extracto.to_csv(os.path.join(app.DIR_EXTRACTOS, '2025_t1.csv'), index=False)
+
+    pd.testing.assert_frame_equal(cubo_almacen(), cubo_esperado(base, extracto), check_exact=True)
+    assert 'ano=2025/mes=0' in app.leer_manifiesto()['particiones']
+
+
+def test_extracto_con_registros_sin_ano_se_rechaza(almacen):
+    base = registros([2024], 150, semilla=11)
+    extracto = registros([2025], 120, semilla=12, meses=[1]).astype({'ano': float})
+    extracto.loc[extracto.index[:3], 'ano'] = np.nan
+    ruta_extracto = os.path.join(app.DIR_EXTRACTOS, '2025_t1.csv')
+    base.to_csv(app.ARCHIVO_MORBILIDAD, index=False)
+    extracto.to_csv(ruta_extracto, index=False)
+
+    pd.testing.assert_frame_equal(cubo_almacen(), cubo_esperado(base), check_exact=True)
+    assert app.extractos_rechazados() == [(ruta_extracto, 'tiene 3 registros sin año')]
+    assert app.actualizar_particiones() == []
+
+    # Corregido el extracto, se incorpora y deja de figurar como rechazado
+    corregido = extracto.dropna(subset=['ano']).astype({'ano': int})
+    corregido.to_csv(ruta_extracto, index=False)
+    pd.testing.assert_frame_equal(cubo_almacen(), cubo_esperado(base, corregido), check_exact=True)
+    assert app.extractos_rechazados() == []
+
+
+def test_registros_originales_conservan_columnas_y_duenos(almacen):
+    # La descarga del dataset principal sale de las fuentes: columnas sin renombrar ni
+    # proyectar y, de cada fuente, solo los registros de sus particiones
+    base = registros([2024, 2025], 150, semilla=13).assign(prestador_nombre='IPS')
+    extracto = registros([2025], 100, semilla=14, meses=[1, 2])
+    base.to_csv(app.ARCHIVO_MORBILIDAD, index=False)
+    extracto.to_csv(os.path.join(app.DIR_EXTRACTOS, '2025_t1.csv'), index=False)
+    app.actualizar_particiones()
+
+    columnas = app.columnas_originales()
+    assert columnas == list(base.columns) + ['mes']
+
+    original = pd.concat(list(app.bloques_morbilidad_original(columnas, tamano_bloque=37)), ignore_index=True)
+    esperado = pd.concat([base[base['ano'] == 2024], extracto], ignore_index=True).reindex(columns=columnas)
+    pd.testing.assert_frame_equal(original, esperado, check_dtype=False)
+
+    vista = pd.concat(list(app.bloques_morbilidad_original(['sexo_gen'], filas=160, tamano_bloque=37)), ignore_index=True)
+    pd.testing.assert_frame_equal(vista, esperado[['sexo_gen']].head(160))
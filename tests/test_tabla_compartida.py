@@ -0,0 +1,65 @@
+"""Tablas compartidas entre sesiones: toda escritura en el lugar se rechaza"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app_dashboard as app
+
+
+def original():
+    return pd.DataFrame({
+        'localidad': pd.Categorical(['Suba', 'Usme', 'Suba', 'Kennedy']),
+        'ano': np.array([2023, 2024, 2024, 2023], dtype='int16'),
+        'atenciones': [10.0, 20.0, 30.0, 40.0]
+    })
+
+
+@pytest.fixture
+def tabla():
+    return app.congelar_tabla(original())
+
+
+ESCRITURAS = {
+    'asignar valor': lambda df: df.__setitem__('atenciones', 0),
+    'nueva columna': lambda df: df.__setitem__('total', 1),
+    'borrar columna': lambda df: df.__delitem__('ano'),
+    'insert': lambda df: df.insert(0, 'x', 1),
+    'loc': lambda df: df.loc.__setitem__((0, 'atenciones'), 0.0),
+    'iloc': lambda df: df.iloc.__setitem__((0, 2), 0.0),
+    'at': lambda df: df.at.__setitem__((0, 'ano'), 2000),
+    'arreglo de columna': lambda df: df['atenciones'].to_numpy().__setitem__(0, 0.0),
+    'categoria': lambda df: df['localidad'].cat.codes.to_numpy().__setitem__(0, 1),
+    'sort_values inplace': lambda df: df.sort_values('atenciones', inplace=True),
+    'drop inplace': lambda df: df.drop(columns='ano', inplace=True),
+    'fillna inplace': lambda df: df.fillna(0, inplace=True),
+    'rename inplace': lambda df: df.rename(columns={'ano': 'año'}, inplace=True),
+    'reset_index inplace': lambda df: df.reset_index(drop=True, inplace=True),
+    'asignar columnas': lambda df: setattr(df, 'columns', ['a', 'b', 'c']),
+    'asignar índice': lambda df: setattr(df, 'index', [9, 8, 7, 6]),
+}
+
+
+@pytest.mark.parametrize('escritura', ESCRITURAS.values(), ids=ESCRITURAS.keys())
+def test_escritura_en_el_lugar_se_rechaza(tabla, escritura):
+    with pytest.raises((TypeError, ValueError)):
+        escritura(tabla)
+
+    pd.testing.assert_frame_equal(pd.DataFrame(tabla), original())
+
+
+def test_operaciones_derivadas_devuelven_dataframe_modificable(tabla):
+    filtrado = tabla[tabla['ano'] == 2024]
+    assert type(filtrado) is pd.DataFrame
+
+    copia = tabla.copy()
+    copia['atenciones'] = 0
+    assert type(copia) is pd.DataFrame
+
+    agrupado = tabla.groupby('localidad', observed=True)['atenciones'].sum()
+    pd.testing.assert_series_equal(agrupado, original().groupby('localidad', observed=True)['atenciones'].sum())
+    pd.testing.assert_frame_equal(pd.DataFrame(tabla), original())